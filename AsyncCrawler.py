@@ -0,0 +1,328 @@
+from AsyncWebAccesser import AsyncWebAccesser, FetchedResponse
+from SeenStore import SeenStore, ExactSeenStore
+from Frontier import FrontierFactory
+from RobotsCache import RobotsCache
+from Worker import UnwantedPagesHeuristics
+from WarcFileSave import WarcSaver
+from DebugPrinter import JsonPrinter
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import BeautifulSoup
+from Url import Url
+import datetime
+import asyncio
+import logging
+import Parser
+import utils
+import Host
+
+def _getAndFormatLinks(html:bytes, buildTree:bool, contentType:str, hostWithSchema:str) -> tuple:
+    """
+    Runs on the executor of the AsyncCrawler. Returns the links of the page, formatted with its host, and its tree,
+    which is only built if buildTree
+    """
+    urlsFound, parsedHTML = Parser.HTMLParser.getLinksAndParsedHTML(html, buildTree, contentType)
+    return Parser.HTMLParser.formatUrlsWithHostIfNeeded(urlsFound, hostWithSchema), parsedHTML
+
+class AsyncWorker():
+    """
+    The asyncio counterpart of a Worker. It owns the same partition of hosts
+    (utils.threadOfHost) but each of its hosts is crawled by its own coroutine
+    """
+
+    def __init__(self, id:int, crawler, seenStore = None, frontierFactory = None, robotsCache = None,
+                    singleGET:bool = True):
+        self._id = id
+        self._crawler = crawler
+        #Whether a page is fetched with a single streamed GET instead of a HEAD and a GET
+        self._singleGET = singleGET
+
+        #All hosts discovered with their policies
+        self._hostsInfo = Host.HostsInfo(seenStore, frontierFactory, robotsCache)
+
+        #Hosts that currently have a coroutine crawling them
+        self._hostsBeingCrawled = set()
+
+    @property
+    def id(self) -> int:
+        return self._id
+
+    @id.setter
+    def id(self, newId):
+        raise AttributeError("id is not writable")
+
+    @property
+    def hostsInfo(self):
+        raise AttributeError("hostsInfo is not readable")
+
+    @hostsInfo.setter
+    def hostsInfo(self, newHostsInfo):
+        raise AttributeError("hostsInfo is not writable")
+
+    def addLinkToRequest(self, newLink):
+        url = Url.of(newLink)
+        hostWithSchema = url.hostWithSchema
+
+        if self._hostsInfo.markUrlAsSeen(url):
+            self._hostsInfo.createInfoForHostIfNotExists(hostWithSchema)
+            hostInfo = self._hostsInfo.getHostInfo(hostWithSchema)
+            hostInfo.addResource(url.resource)
+
+            if hostWithSchema not in self._hostsBeingCrawled:
+                self._hostsBeingCrawled.add(hostWithSchema)
+                self._crawler.startHostTask(self._crawlHost(hostInfo))
+
+    async def _crawlHost(self, hostInfo:Host.HostInfo):
+        webAccess = self._crawler.webAccess
+        try:
+            nextAllowedReqTimestamp = 0.0
+            while not hostInfo.emptyOfResources() and not self._crawler.allDone:
+                #Checked for every resource, since the robots may expire while the host is crawled
+                if not hostInfo.hasRobots() and not hostInfo.tryRobotsFromCache():
+                    hostInfo.setRobotsContent(await webAccess.getRobotsContentOf(hostInfo.hostNameWithSchema))
+
+                resource = hostInfo.getNextResource()
+                completeLink = utils.getCompleteLinkFromHostAndResource(hostInfo.hostNameWithSchema, resource)
+
+                if self._passesAccessPolicies(completeLink, hostInfo):
+                    await self._waitMinDelayIfNecessary(nextAllowedReqTimestamp)
+
+                    if await self._shouldAccessPage(completeLink):
+                        await self._accessPageAndGetLinks(completeLink, hostInfo)
+
+                    nextAllowedReqTimestamp = hostInfo.nextRequestAllowedTimestampFromNow()
+
+                hostInfo.markResourceAsCrawled(resource)
+        finally:
+            self._hostsBeingCrawled.discard(hostInfo.hostNameWithSchema)
+
+    async def _waitMinDelayIfNecessary(self, minTimestampToReq:float):
+        now = datetime.datetime.now()
+        minTimeToWait = datetime.datetime.fromtimestamp(minTimestampToReq)
+
+        if minTimeToWait > now:
+            timeDiff = minTimeToWait - now
+            await asyncio.sleep(timeDiff.total_seconds())
+
+    def _passesAccessPolicies(self, completeLink:str, hostInfo:Host.HostInfo) -> bool:
+        allowed = hostInfo.canAccessPage(completeLink)
+        passHeuristics = UnwantedPagesHeuristics.passHeuristicsAccess(completeLink)
+        return allowed and passHeuristics
+
+    async def _shouldAccessPage(self, completeLink:str) -> bool:
+        if self._singleGET:
+            #The Content-Type is checked on the GET itself
+            return True
+        try:
+            response = await self._crawler.webAccess.HEADRequest(completeLink)
+        except:
+            return False
+        else:
+            return response.hasTextHtmlContent()
+
+    async def _accessPageAndGetLinks(self, requestLink:str, hostInfo:Host.HostInfo):
+        try:
+            if self._singleGET:
+                response = await self._crawler.webAccess.GETRequestIfHtml(requestLink)
+            else:
+                response = await self._crawler.webAccess.GETRequest(requestLink)
+        except Exception as e:
+            pass
+        else:
+            if response.success() and response.hasTextHtmlContent():
+
+                #The tree is only needed to print the page on debug mode
+                treatedUrls, parsedHTML = await self._crawler.runOffLoop(_getAndFormatLinks, response.body,
+                                                                            self._crawler.debugMode,
+                                                                            response.getheader('content-type'),
+                                                                            hostInfo.hostNameWithSchema)
+
+                self._crawler.distributeLinks(treatedUrls)
+
+                await self._crawler.saveResponse(response, requestLink, self._id)
+                self._crawler.printIfOnDebugMode(requestLink, response.requestTimestamp, parsedHTML)
+
+    def getCrawledResourcesPerHostDict(self) -> dict:
+        return self._hostsInfo.getCrawledResourcesPerHostDict()
+
+class AsyncCrawler():
+    """
+    A crawler that drives every host from a single asyncio event loop instead of one
+    blocking thread per Worker. Hosts keep being partitioned between workers with
+    utils.threadOfHost and each host keeps its own politeness delay.
+    Parsing pages and writing their records take the CPU, so they run on an executor
+    and the requests in flight go on while they do
+    """
+
+    NUM_OFF_LOOP_THREADS = 4
+
+    def __init__(self, pagesCrawledLimit:int, numWorkers:int = 1, debugMode:bool = False,
+                    maxInFlightRequests:int = 1000, seenStore:SeenStore = None,
+                    frontierFactory:FrontierFactory = None, robotsCache:RobotsCache = None,
+                    singleGET:bool = True, warcSaver = None, offLoopExecutor = None, maxBodyBytes:int = None,
+                    maxDownloadSeconds:float = None):
+
+        #Shared by every worker
+        self._seenStore = ExactSeenStore() if seenStore == None else seenStore
+        self._frontierFactory = FrontierFactory() if frontierFactory == None else frontierFactory
+        self._robotsCache = RobotsCache() if robotsCache == None else robotsCache
+        self._workers = {workerId:AsyncWorker(workerId, self, self._seenStore, self._frontierFactory,
+                                                self._robotsCache, singleGET)
+                            for workerId in range(numWorkers)}
+        self._webAccess = AsyncWebAccesser(maxInFlightRequests, maxBodyBytes, maxDownloadSeconds)
+
+        self._pagesLimit = pagesCrawledLimit
+        self._numWorkers = numWorkers
+        self._debugMode = debugMode
+
+        self._numPagesCrawled = 0
+        self._allDone = False
+
+        self._runningHostTasks = set()
+        self._allHostTasksDoneEvent = None
+
+        #A WarcSaver or anything with the same interface, like a BackgroundWarcSaver
+        self._warcSaver = WarcSaver() if warcSaver == None else warcSaver
+        self._debugPrinter = JsonPrinter()
+        #Parses pages and saves their records. A ThreadPoolExecutor or anything with the same interface
+        self._offLoopExecutor = (ThreadPoolExecutor(AsyncCrawler.NUM_OFF_LOOP_THREADS, thread_name_prefix="AsyncOffLoop")
+                                    if offLoopExecutor == None else offLoopExecutor)
+
+    @property
+    def webAccess(self) -> AsyncWebAccesser:
+        return self._webAccess
+
+    @webAccess.setter
+    def webAccess(self, newWebAccess):
+        raise AttributeError("webAccess is not writable")
+
+    @property
+    def pagesLimit(self):
+        """The maximum number of pages that can be crawled"""
+        return self._pagesLimit
+
+    @pagesLimit.setter
+    def pagesLimit(self, newPagesLimit):
+        self._pagesLimit = newPagesLimit
+
+    @property
+    def pagesCrawled(self) -> int:
+        """The number of pages already crawled"""
+        return self._numPagesCrawled
+
+    @pagesCrawled.setter
+    def pagesCrawled(self, newValue):
+        raise AttributeError("pagesCrawled is not writable")
+
+    @property
+    def numWorkers(self):
+        """The number of host partitions"""
+        return self._numWorkers
+
+    @numWorkers.setter
+    def numWorkers(self, newNumWorkers):
+        raise AttributeError("newNumWorkers is read-only")
+
+    @property
+    def debugMode(self) -> bool:
+        return self._debugMode
+
+    @debugMode.setter
+    def debugMode(self, newDebugMode):
+        raise AttributeError("debugMode is not writable")
+
+    @property
+    def allDone(self) -> bool:
+        return self._allDone
+
+    @allDone.setter
+    def allDone(self, newAllDone):
+        raise AttributeError("allDone is not writable")
+
+    def startCrawlingFromSeedsFile(self, seedsFilePath: str):
+        asyncio.run(self._crawlFromSeedsFile(seedsFilePath))
+
+    async def _crawlFromSeedsFile(self, seedsFilePath: str):
+        self._allHostTasksDoneEvent = asyncio.Event()
+        await self._webAccess.open()
+
+        try:
+            self._distributeSeedsForWorkers(seedsFilePath)
+
+            if len(self._runningHostTasks) > 0:
+                await self._allHostTasksDoneEvent.wait()
+
+            logging.info("Terminou Operações")
+        finally:
+            await self._webAccess.close()
+            self._offLoopExecutor.shutdown(wait=True)
+            self._warcSaver.close()
+            logging.info(self._warcSaver.getStatsString())
+            logging.info(self._seenStore.getStatsString())
+            self._seenStore.close()
+            logging.info(self._frontierFactory.getStatsString())
+            self._frontierFactory.close()
+            logging.info(self._robotsCache.getStatsString())
+            self._robotsCache.close()
+            logging.info(self._webAccess.fetchStats.getStatsString(self._numPagesCrawled))
+            logging.info(Parser.CharsetResolver.getStatsString())
+
+    def _distributeSeedsForWorkers(self, seedsFilePath: str):
+
+        with open(seedsFilePath, 'r') as seedsFile:
+
+            link = seedsFile.readline().rstrip('\n')
+
+            while link:
+                self.distributeLinks([link])
+                link = seedsFile.readline().rstrip('\n')
+
+    def startHostTask(self, hostCoroutine):
+        hostTask = asyncio.ensure_future(hostCoroutine)
+        self._runningHostTasks.add(hostTask)
+        hostTask.add_done_callback(self._onHostTaskDone)
+
+    def _onHostTaskDone(self, hostTask:asyncio.Task):
+        self._runningHostTasks.discard(hostTask)
+
+        if not hostTask.cancelled() and hostTask.exception() != None:
+            logging.error(f"Host task failed: {hostTask.exception()}")
+
+        if len(self._runningHostTasks) == 0:
+            self._allHostTasksDoneEvent.set()
+
+    def distributeLinks(self, urls):
+        for url in urls:
+            url = Url.of(url)
+            workerId = utils.threadOfHostHash(self._numWorkers, url.hostHash)
+            self._workers[workerId].addLinkToRequest(url)
+
+    async def runOffLoop(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._offLoopExecutor, function, *args)
+
+    async def saveResponse(self, response:FetchedResponse, link:str, workerId:int = None):
+        #Counted back on the loop, so the pages are only counted by one thread
+        if await self.runOffLoop(self._warcSaver.saveBytesAndReturnIfSuccess, response.status, response.headers,
+                                    response.rawBody, link, workerId, response.truncated):
+            self._addPageCrawledAndSaved()
+
+    def _addPageCrawledAndSaved(self):
+        self._numPagesCrawled += 1
+        logging.info(f"NUM PAGES: {self._numPagesCrawled}")
+
+        if self._numPagesCrawled > self._pagesLimit:
+            logging.info(f"ATINGIU MAX PAGES")
+            self._allDone = True
+
+    def printIfOnDebugMode(self, link:str, reqTimestamp:float, parsedHTML:BeautifulSoup):
+        if self._debugMode:
+            NUM_WORDS_TO_PRINT = 20
+            textToPrint = Parser.HTMLParser.getNFirstTextWords(parsedHTML, NUM_WORDS_TO_PRINT)
+            title = parsedHTML.find('title').string
+            self._debugPrinter.printJson(link, reqTimestamp, title, textToPrint)
+
+    def getResourcesNumPerHost(self) -> dict:
+        resourcesPerHost = dict()
+        for _, worker in self._workers.items():
+            for host, numResources in worker.getCrawledResourcesPerHostDict().items():
+                resourcesPerHost[host] = resourcesPerHost.get(host, 0) + numResources
+        return resourcesPerHost
@@ -0,0 +1,251 @@
+from WebAccesser import WebAccesser, FetchStats, BodyDecoder
+from DnsCache import DnsCache
+import datetime
+import asyncio
+import logging
+import aiohttp
+import certifi
+import reppy
+import utils
+import time
+import ssl
+
+class FetchedResponse():
+    """
+    A response already read by the AsyncWebAccesser.
+    Many requests are in flight at the same time, so there is no "last response" to ask for
+    """
+
+    def __init__(self, status:int, headers:list, body:bytes, requestTimestamp:float, rawBody:bytes = None,
+                    truncated:str = None):
+        self._status = status
+        self._headers = headers
+        self._body = body
+        #As the server sent it, compressed if it was
+        self._rawBody = body if rawBody == None else rawBody
+        self._requestTimestamp = requestTimestamp
+        #Why the body is not whole, as WebAccesser.lastResponseTruncated, or None if it is
+        self._truncated = truncated
+
+    @property
+    def status(self) -> int:
+        return self._status
+
+    @status.setter
+    def status(self, newStatus):
+        raise AttributeError("status is not writable")
+
+    @property
+    def headers(self) -> list:
+        return self._headers
+
+    @headers.setter
+    def headers(self, newHeaders):
+        raise AttributeError("headers is not writable")
+
+    @property
+    def body(self) -> bytes:
+        return self._body
+
+    @body.setter
+    def body(self, newBody):
+        raise AttributeError("body is not writable")
+
+    @property
+    def rawBody(self) -> bytes:
+        return self._rawBody
+
+    @rawBody.setter
+    def rawBody(self, newRawBody):
+        raise AttributeError("rawBody is not writable")
+
+    @property
+    def requestTimestamp(self) -> float:
+        return self._requestTimestamp
+
+    @requestTimestamp.setter
+    def requestTimestamp(self, newRequestTimestamp):
+        raise AttributeError("requestTimestamp is not writable")
+
+    @property
+    def truncated(self) -> str:
+        return self._truncated
+
+    @truncated.setter
+    def truncated(self, newTruncated):
+        raise AttributeError("truncated is not writable")
+
+    def getheader(self, name:str, default:str = None) -> str:
+        name = name.lower()
+        for headerName, headerValue in self._headers:
+            if headerName.lower() == name:
+                return headerValue
+        return default
+
+    def success(self) -> bool:
+        return self._status >= 200 and self._status < 300
+
+    def hasTextHtmlContent(self) -> bool:
+        return 'text/html' in self.getheader('content-type', "")
+
+class AsyncWebAccesser():
+    """
+    The asyncio counterpart of WebAccesser. One instance is shared by every coroutine
+    """
+
+    MAX_TIME_REQ_FOR_ROBOTS = 10.0
+
+    def __init__(self, maxInFlightRequests:int = 1000, maxBodyBytes:int = None, maxDownloadSeconds:float = None):
+        self._maxInFlightRequests = maxInFlightRequests
+        #Bodies are read a chunk at a time and cut at these, as on the WebAccesser
+        self._maxBodyBytes = WebAccesser.MAX_BODY_BYTES if maxBodyBytes == None else maxBodyBytes
+        self._maxDownloadSeconds = WebAccesser.MAX_DOWNLOAD_SECONDS if maxDownloadSeconds == None else maxDownloadSeconds
+        self._session = None
+        self._fetchStats = FetchStats()
+        logging.getLogger("aiohttp").setLevel(logging.CRITICAL)
+
+    @property
+    def session(self):
+        raise AttributeError("session is not directly readable")
+
+    @session.setter
+    def session(self, newSession):
+        raise AttributeError("session is not directly writable")
+
+    @property
+    def fetchStats(self) -> FetchStats:
+        return self._fetchStats
+
+    @fetchStats.setter
+    def fetchStats(self, newFetchStats):
+        raise AttributeError("fetchStats is not directly writable")
+
+    async def open(self):
+        sslContext = ssl.create_default_context(cafile=certifi.where())
+        #Its own DNS cache is shared by every coroutine, kept as long as the DnsCache of the other engines
+        connector = aiohttp.TCPConnector(limit=self._maxInFlightRequests, ssl=sslContext,
+                                            ttl_dns_cache=DnsCache.TTL_SECONDS)
+        timeout = aiohttp.ClientTimeout(sock_connect=2.0, sock_read=3.0)
+        #Bodies are read as they were sent, so they are archived compressed, and decoded here to be parsed
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                headers=WebAccesser.REQ_HEADERS, auto_decompress=False)
+
+    async def close(self):
+        if self._session != None:
+            await self._session.close()
+            self._session = None
+
+    async def getRobotsContentOf(self, url:str) -> tuple:
+        """The same as WebAccesser.getRobotsContentOf"""
+        url = utils.normalizeLinkIfCan(url)
+
+        try:
+            hostRobotsPath = reppy.Robots.robots_url(url)
+        except:
+            return None
+
+        try:
+            timeout = aiohttp.ClientTimeout(total=AsyncWebAccesser.MAX_TIME_REQ_FOR_ROBOTS)
+            requestStart = time.monotonic()
+            async with self._session.get(hostRobotsPath, timeout=timeout) as response:
+                content = ""
+                if response.status >= 200 and response.status < 300:
+                    content, _, _ = await self._readBody(response, requestStart)
+                    content = content.decode('utf-8', errors='replace')
+                return WebAccesser.getRobotsUrlAndContentForStatus(hostRobotsPath, response.status, content)
+        except:
+            return None
+
+    async def GETRequest(self, link:str) -> FetchedResponse:
+        self._fetchStats.countGETRequest()
+        response = await self._doRequest('GET', link)
+        self._countBodyRead(response, 0, False)
+        return response
+
+    async def HEADRequest(self, link:str) -> FetchedResponse:
+        self._fetchStats.countHEADRequest()
+        return await self._doRequest('HEAD', link)
+
+    async def GETRequestIfHtml(self, link:str) -> FetchedResponse:
+        """
+        The same as WebAccesser.GETRequestIfHtml. The body of the response is empty if it was not read
+        """
+        self._fetchStats.countGETRequest()
+        now = datetime.datetime.now()
+        requestTimestamp = datetime.datetime.timestamp(now)
+        requestStart = time.monotonic()
+        async with self._session.request('GET', link, allow_redirects=False) as response:
+            headers = [(name, value) for name, value in response.headers.items()]
+            fetchedResponse = FetchedResponse(response.status, headers, b"", requestTimestamp)
+
+            if fetchedResponse.success() and fetchedResponse.hasTextHtmlContent():
+                body, rawBody, truncated = await self._readBody(response, requestStart)
+                fetchedResponse = FetchedResponse(response.status, headers, body, requestTimestamp, rawBody, truncated)
+                self._fetchStats.countBodyTruncated(truncated)
+                self._countBodyRead(fetchedResponse, FetchStats.getHeaderBytes(response.status, headers), True)
+                return fetchedResponse
+
+            contentLength = response.content_length
+            if contentLength != None and contentLength <= WebAccesser.MAX_BODY_BYTES_TO_DRAIN:
+                await response.read()
+                self._fetchStats.countBodyDrained(contentLength)
+            else:
+                response.close()
+                self._fetchStats.countBodyAborted()
+            return fetchedResponse
+
+    async def _doRequest(self, reqType:str, link:str) -> FetchedResponse:
+        now = datetime.datetime.now()
+        requestTimestamp = datetime.datetime.timestamp(now)
+        requestStart = time.monotonic()
+        async with self._session.request(reqType, link, allow_redirects=False) as response:
+            body, rawBody, truncated = await self._readBody(response, requestStart)
+            self._fetchStats.countBodyTruncated(truncated)
+            headers = [(name, value) for name, value in response.headers.items()]
+            return FetchedResponse(response.status, headers, body, requestTimestamp, rawBody, truncated)
+
+    async def _readBody(self, response:aiohttp.ClientResponse, requestStart:float) -> tuple:
+        """
+        The same as WebAccesser._readBody: the body decoded, the body as it was sent, which is the same object
+        when it was not compressed, and why it was truncated, or None if it was read whole.
+        A truncated response has its connection closed
+        """
+        body = bytearray()
+        rawBody = bytearray()
+        truncated = None
+        decoder = BodyDecoder.forContentEncoding(response.headers.get('Content-Encoding'))
+        deadline = requestStart + self._maxDownloadSeconds
+
+        rawChunks = response.content.iter_chunked(WebAccesser.BODY_CHUNK_BYTES)
+        while truncated == None:
+            secondsLeft = deadline - time.monotonic()
+            try:
+                if secondsLeft <= 0:
+                    raise asyncio.TimeoutError()
+                rawChunk = await asyncio.wait_for(rawChunks.__anext__(), secondsLeft)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                truncated = WebAccesser.TRUNCATED_BY_TIME
+                break
+
+            if decoder != None:
+                #One more byte than fits tells the body was longer
+                body += decoder.decode(rawChunk, self._maxBodyBytes - len(body) + 1)
+                rawBody += rawChunk
+            else:
+                body += rawChunk
+
+            if len(body) > self._maxBodyBytes or len(rawBody) > self._maxBodyBytes:
+                del body[self._maxBodyBytes:]
+                del rawBody[self._maxBodyBytes:]
+                truncated = WebAccesser.TRUNCATED_BY_LENGTH
+        if truncated != None:
+            response.close()
+
+        body = bytes(body)
+        return body, bytes(rawBody) if decoder != None else body, truncated
+
+    def _countBodyRead(self, response:FetchedResponse, headerBytes:int, headAvoided:bool):
+        numBytesOnWire = None if response.rawBody is response.body else len(response.rawBody)
+        self._fetchStats.countBodyRead(len(response.body), headerBytes, headAvoided, numBytesOnWire)
@@ -0,0 +1,241 @@
+from threading import Lock, Event, Thread
+import datetime
+import logging
+import signal
+import shutil
+import pickle
+import queue
+import json
+import os
+
+class CheckpointError(Exception):
+    pass
+
+class CrawlCheckpointer():
+    """
+    Writes periodic and on-signal (SIGUSR1) checkpoints of a Crawler to a directory.
+
+    A checkpoint does not stop the crawl: each worker saves its own state the next
+    time it is between two requests, and a writer thread puts it on disk. Links sent
+    to a worker that already saved its state by a worker that did not are recorded
+    as in flight, so no link is lost between the two saves. The checkpoint is only
+    valid once the manifest points to it
+    """
+
+    MANIFEST_FILE_NAME = "manifest.json"
+    SEEN_FILE_NAME = "seen.ckpt"
+    PIPELINE_FILE_NAME = "pipeline.pkl"
+
+    def __init__(self, checkpointDir:str, numWorkers:int, intervalSeconds:float = 300.0):
+        self._checkpointDir = checkpointDir
+        self._numWorkers = numWorkers
+        self._intervalSeconds = intervalSeconds
+
+        os.makedirs(self._checkpointDir, exist_ok=True)
+
+        #The last generation requested and the last one fully written
+        self._generation = CrawlCheckpointer.getLatestGeneration(checkpointDir)
+        self._completedGeneration = self._generation
+        self._numWorkersCheckpointed = 0
+        self._inFlightLinks = list()
+        self._generationStart = None
+        self._lock = Lock()
+
+        self._seenStore = None
+        self._workersPipeline = None
+
+        self._writeQueue = queue.Queue()
+        self._writerThread = None
+        self._timerThread = None
+        self._stopEvent = Event()
+        self._checkpointRequestedEvent = Event()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @generation.setter
+    def generation(self, newGeneration):
+        raise AttributeError("generation is not writable")
+
+    def attach(self, seenStore, workersPipeline):
+        self._seenStore = seenStore
+        self._workersPipeline = workersPipeline
+
+    def getGenerationDir(self, generation:int) -> str:
+        return os.path.join(self._checkpointDir, f"gen{generation}")
+
+    def start(self):
+        self._writerThread = Thread(target=self._writeStates, name="CheckpointWriter")
+        self._writerThread.start()
+        self._timerThread = Thread(target=self._requestCheckpointsPeriodically, name="CheckpointTimer")
+        self._timerThread.start()
+
+    def installSignalHandler(self):
+        """Must be called from the main thread"""
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self._checkpointRequestedEvent.set())
+
+    def stop(self):
+        self._stopEvent.set()
+        self._checkpointRequestedEvent.set()
+        self._writeQueue.put(None)
+
+        if self._timerThread != None:
+            self._timerThread.join()
+        if self._writerThread != None:
+            self._writerThread.join()
+
+    def _requestCheckpointsPeriodically(self):
+        while not self._stopEvent.is_set():
+            self._checkpointRequestedEvent.wait(self._intervalSeconds)
+            self._checkpointRequestedEvent.clear()
+
+            if not self._stopEvent.is_set():
+                self.requestCheckpoint()
+
+    def requestCheckpoint(self):
+        self._lock.acquire()
+        previousStillBeingWritten = self._generation != self._completedGeneration
+        newGeneration = self._generation + 1
+        self._lock.release()
+
+        if previousStillBeingWritten:
+            logging.info(f"Checkpoint {newGeneration - 1} still being written, skipping a new one")
+            return
+
+        generationDir = self.getGenerationDir(newGeneration)
+        shutil.rmtree(generationDir, ignore_errors=True)
+        os.makedirs(generationDir)
+
+        #Before any worker saves its state: a url marked as seen after this is, at worst, enqueued twice
+        self._seenStore.checkpointTo(os.path.join(generationDir, CrawlCheckpointer.SEEN_FILE_NAME))
+
+        self._lock.acquire()
+        self._numWorkersCheckpointed = 0
+        self._inFlightLinks = list()
+        self._generationStart = datetime.datetime.now()
+        self._generation = newGeneration
+        self._lock.release()
+
+        logging.info(f"Checkpoint {newGeneration} requested")
+        self._workersPipeline.wakeEveryWorker()
+
+    def saveWorkerState(self, workerId:int, generation:int, state:dict):
+        """Called by the worker itself. Only the serialization happens on its thread"""
+        stateBytes = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        self._writeQueue.put((generation, f"worker{workerId}.pkl", stateBytes))
+
+    def recordInFlightLinks(self, generation:int, links:list):
+        self._lock.acquire()
+        if generation == self._generation:
+            self._inFlightLinks.extend(links)
+        self._lock.release()
+
+    def _writeStates(self):
+        while True:
+            stateToWrite = self._writeQueue.get()
+            if stateToWrite == None:
+                return
+
+            generation, fileName, stateBytes = stateToWrite
+            CrawlCheckpointer._writeFileAtomically(os.path.join(self.getGenerationDir(generation), fileName), stateBytes)
+
+            self._lock.acquire()
+            self._numWorkersCheckpointed += 1
+            everyWorkerCheckpointed = self._numWorkersCheckpointed == self._numWorkers
+            self._lock.release()
+
+            if everyWorkerCheckpointed:
+                self._completeGeneration(generation)
+
+    def _completeGeneration(self, generation:int):
+        generationDir = self.getGenerationDir(generation)
+
+        self._lock.acquire()
+        inFlightLinks = list(self._inFlightLinks)
+        self._lock.release()
+
+        pipelineState = self._workersPipeline.getCheckpointState()
+        pipelineState['inFlightLinks'] = inFlightLinks
+        CrawlCheckpointer._writeFileAtomically(os.path.join(generationDir, CrawlCheckpointer.PIPELINE_FILE_NAME),
+                                                pickle.dumps(pipelineState, pickle.HIGHEST_PROTOCOL))
+
+        manifest = {'generation': generation, 'numWorkers': self._numWorkers,
+                    'timestamp': datetime.datetime.timestamp(datetime.datetime.now())}
+        CrawlCheckpointer._writeFileAtomically(os.path.join(self._checkpointDir, CrawlCheckpointer.MANIFEST_FILE_NAME),
+                                                json.dumps(manifest).encode('utf-8'))
+
+        self._lock.acquire()
+        self._completedGeneration = generation
+        timeTaken = datetime.datetime.now() - self._generationStart
+        self._lock.release()
+
+        self._removeGenerationsBefore(generation)
+        logging.info(f"Checkpoint {generation} written in {timeTaken.total_seconds()}s "
+                        f"with {len(inFlightLinks)} links in flight")
+
+    def _removeGenerationsBefore(self, generation:int):
+        for fileName in os.listdir(self._checkpointDir):
+            if fileName.startswith("gen") and fileName[3:].isdigit() and int(fileName[3:]) < generation:
+                shutil.rmtree(os.path.join(self._checkpointDir, fileName), ignore_errors=True)
+
+    @staticmethod
+    def _writeFileAtomically(filePath:str, content:bytes):
+        temporaryFilePath = f"{filePath}.tmp"
+        with open(temporaryFilePath, 'wb') as temporaryFile:
+            temporaryFile.write(content)
+            temporaryFile.flush()
+            os.fsync(temporaryFile.fileno())
+        os.replace(temporaryFilePath, filePath)
+
+    @staticmethod
+    def readManifest(checkpointDir:str) -> dict:
+        manifestPath = os.path.join(checkpointDir, CrawlCheckpointer.MANIFEST_FILE_NAME)
+        if not os.path.isfile(manifestPath):
+            return None
+
+        with open(manifestPath, 'r') as manifestFile:
+            return json.load(manifestFile)
+
+    @staticmethod
+    def getLatestGeneration(checkpointDir:str) -> int:
+        manifest = CrawlCheckpointer.readManifest(checkpointDir)
+        return 0 if manifest == None else manifest['generation']
+
+class CheckpointReader():
+    """
+    Reads the latest complete checkpoint written by a CrawlCheckpointer
+    """
+
+    def __init__(self, checkpointDir:str, numWorkers:int):
+        manifest = CrawlCheckpointer.readManifest(checkpointDir)
+        if manifest == None:
+            raise CheckpointError(f"There is no complete checkpoint on {checkpointDir}")
+
+        if manifest['numWorkers'] != numWorkers:
+            raise CheckpointError(f"The checkpoint on {checkpointDir} was written by {manifest['numWorkers']} "
+                                    f"workers, not {numWorkers}")
+
+        self._generation = manifest['generation']
+        self._generationDir = os.path.join(checkpointDir, f"gen{self._generation}")
+
+    @property
+    def generationDir(self) -> str:
+        return self._generationDir
+
+    @generationDir.setter
+    def generationDir(self, newGenerationDir):
+        raise AttributeError("generationDir is not writable")
+
+    def getSeenStoreFilePath(self) -> str:
+        return os.path.join(self._generationDir, CrawlCheckpointer.SEEN_FILE_NAME)
+
+    def loadWorkerState(self, workerId:int) -> dict:
+        return self._loadPickle(f"worker{workerId}.pkl")
+
+    def loadPipelineState(self) -> dict:
+        return self._loadPickle(CrawlCheckpointer.PIPELINE_FILE_NAME)
+
+    def _loadPickle(self, fileName:str):
+        with open(os.path.join(self._generationDir, fileName), 'rb') as stateFile:
+            return pickle.load(stateFile)
@@ -1,5 +1,17 @@
 from Worker import Worker
 from WorkersPipeline import WorkersPipeline
+from SeenStore import SeenStore, ExactSeenStore
+from Frontier import FrontierFactory
+from RobotsCache import RobotsCache
+from Parser import CharsetResolver
+from ParsePool import ParsePool
+from DnsCache import DnsCache
+from WebAccesser import WebAccesser, CachedDnsPoolManager
+from PolitenessGroups import PolitenessGroups
+from RecrawlIndex import RecrawlIndex
+from Metrics import CrawlMetrics, MetricsReporter
+from Url import Url
+from Checkpoint import CrawlCheckpointer, CheckpointReader
 import threading
 import logging
 import utils
@@ -8,14 +20,53 @@ class Crawler():
     """
     This is the crawler. It manages all workers to crawl pages until the limit is reached
     """
-    def __init__(self, pagesCrawledLimit:int, numWorkers:int = 1, debugMode:bool = False):
+    def __init__(self, pagesCrawledLimit:int, numWorkers:int = 1, debugMode:bool = False,
+                    linkExchange = None, warcPreName:str = "results", seenStore:SeenStore = None,
+                    frontierFactory:FrontierFactory = None, checkpointer:CrawlCheckpointer = None,
+                    robotsCache:RobotsCache = None, singleGET:bool = True, parsePool:ParsePool = None,
+                    warcSaver = None, dnsCache:DnsCache = None, politenessGroups:PolitenessGroups = None,
+                    poolManager:CachedDnsPoolManager = None, maxBodyBytes:int = None, maxDownloadSeconds:float = None,
+                    recrawlIndex:RecrawlIndex = None, metricsReporter:MetricsReporter = None):
         
-        self._workersQueues = {workerId:Worker(workerId) for workerId in range(numWorkers)}
-        self._workersPipeline = WorkersPipeline(self._workersQueues, pagesCrawledLimit, debugMode)
+        #Shared by every worker
+        self._seenStore = ExactSeenStore() if seenStore == None else seenStore
+        self._frontierFactory = FrontierFactory() if frontierFactory == None else frontierFactory
+        self._robotsCache = RobotsCache() if robotsCache == None else robotsCache
+        self._dnsCache = DnsCache() if dnsCache == None else dnsCache
+        self._politenessGroups = PolitenessGroups(None, self._dnsCache) if politenessGroups == None else politenessGroups
+        #Fetches pages, HEADs and robots of every worker
+        self._poolManager = WebAccesser.newPoolManager(self._dnsCache) if poolManager == None else poolManager
+        #Always collected. The reporter, if any, writes and serves them while crawling
+        self._metrics = CrawlMetrics() if metricsReporter == None else metricsReporter.metrics
+        self._metricsReporter = metricsReporter
+
+        self._workersQueues = {workerId:Worker(workerId, self._seenStore, self._frontierFactory, self._robotsCache,
+                                                singleGET, self._dnsCache, self._politenessGroups, self._poolManager,
+                                                maxBodyBytes, maxDownloadSeconds, recrawlIndex, self._metrics)
+                                for workerId in range(numWorkers)}
+        self._workersPipeline = WorkersPipeline(self._workersQueues, pagesCrawledLimit, debugMode,
+                                                linkExchange, warcPreName, self._frontierFactory, parsePool, warcSaver,
+                                                self._metrics)
+        self._metrics.addGaugesSource(self._workersPipeline.getQueueDepths)
+        self._metrics.addGaugesSource(self.__getHostsQueuesDepths)
+        #Exchanges links with the other Crawler processes, if any
+        self._linkExchange = linkExchange
+        #Parses the pages on other processes, if any
+        self._parsePool = parsePool
+        #Of the previous crawl, if this one recrawls it
+        self._recrawlIndex = recrawlIndex
 
         for (_, worker) in self._workersQueues.items():
             worker.workersPipeline = self._workersPipeline 
 
+        #Saves the crawl state from time to time, if any
+        self._checkpointer = checkpointer
+        if self._checkpointer != None:
+            self._checkpointer.attach(self._seenStore, self._workersPipeline)
+            self._workersPipeline.checkpointer = self._checkpointer
+            for (_, worker) in self._workersQueues.items():
+                worker.checkpointer = self._checkpointer
+
         self._pagesLimit = pagesCrawledLimit
         self._numWorkers = numWorkers
     
@@ -66,7 +117,79 @@ class Crawler():
 
     def startCrawlingFromSeedsFile(self, seedsFilePath: str):
         self.__distributeSeedsForWorkers(seedsFilePath)
-        self.__crawlWorkers()
+        self.__crawl()
+    
+    def startCrawlingFromReceivedLinks(self):
+        """
+        For when every link comes through the link exchange, like on a node of a distributed crawl
+        """
+        self.__crawl()
+    
+    def resumeFromCheckpoint(self, checkpointDir: str):
+        """
+        Continues the crawl from the latest complete checkpoint on checkpointDir.
+        Robots are restored too, so they are not fetched again
+        """
+        checkpointReader = CheckpointReader(checkpointDir, self._numWorkers)
+        generationDir = checkpointReader.generationDir
+
+        self._seenStore.restoreFrom(checkpointReader.getSeenStoreFilePath())
+
+        numPagesCrawled = 0
+        for workerId, worker in self._workersQueues.items():
+            worker.restoreFromCheckpointState(checkpointReader.loadWorkerState(workerId), generationDir)
+            #Hosts may have been moved to workers other than the ones of their hash
+            self._workersPipeline.setOwnerOfHosts(workerId, worker.getHostsNames())
+            numPagesCrawled += worker.numPagesSaved
+        
+        self._workersPipeline.restoreFromCheckpointState(checkpointReader.loadPipelineState(), numPagesCrawled)
+        logging.info(f"Resumed from {generationDir} with {numPagesCrawled} pages crawled")
+
+        self.__crawl()
+    
+    def __crawl(self):
+        if self._metricsReporter != None:
+            self._metricsReporter.start()
+        if self._checkpointer != None:
+            self._checkpointer.installSignalHandler()
+            self._checkpointer.start()
+
+        if self._linkExchange != None:
+            self._linkExchange.startReceiving(self._workersPipeline)
+            try:
+                self.__crawlWorkers()
+            finally:
+                self._linkExchange.stopReceiving()
+        else:
+            self.__crawlWorkers()
+        
+        if self._checkpointer != None:
+            self._checkpointer.stop()
+        if self._metricsReporter != None:
+            self._metricsReporter.stop()
+        
+        self._workersPipeline.closeWarcSaver()
+        logging.info(self._seenStore.getStatsString())
+        self._seenStore.close()
+        logging.info(self._frontierFactory.getStatsString())
+        self._frontierFactory.close()
+        logging.info(self._robotsCache.getStatsString())
+        self._robotsCache.close()
+        logging.info(self._workersPipeline.getFetchStatsString())
+        logging.info(self._workersPipeline.getHostsMovesStatsString())
+        logging.info(self._workersPipeline.getPolitenessStatsString())
+        logging.info(self._workersPipeline.getDelaysStatsString())
+        logging.info(self._politenessGroups.getStatsString())
+        logging.info(self._dnsCache.getStatsString())
+        logging.info(self._poolManager.connectionStats.getStatsString())
+        if self._parsePool != None:
+            self._parsePool.shutdown()
+            logging.info(self._parsePool.getStatsString())
+        if self._recrawlIndex != None:
+            logging.info(self._recrawlIndex.getStatsString())
+        logging.info(CharsetResolver.getStatsString())
+        logging.info(Url.getCacheStatsString())
+        logging.info(self._metrics.getStatsString())
     
     def __distributeSeedsForWorkers(self, seedsFilePath: str):
         
@@ -78,10 +201,16 @@ class Crawler():
                 self.__sendLinkForThread(link)
                 link = seedsFile.readline().rstrip('\n')
 
+        #The links of pages that did not change are not parsed again, so every page of the previous crawl is a seed
+        if self._recrawlIndex != None:
+            [self.__sendLinkForThread(link) for link in self._recrawlIndex.getUrls()]
+
     def __sendLinkForThread(self, newPageLink: str):
         
-        threadOfHost = utils.threadOfHost(self._numWorkers, utils.getHostWithSchemaOfLink(newPageLink))
-        self._workersQueues[threadOfHost].addLinkToRequest(newPageLink)
+        url = Url.of(newPageLink)
+        if self._workersPipeline.isLocalHost(url.hostWithSchema):
+            threadOfHost = self._workersPipeline.workerOfHost(url.hostWithSchema, url.hostHash)
+            self._workersQueues[threadOfHost].addLinkToRequest(url)
 
     def __crawlWorkers(self):
         
@@ -94,6 +223,9 @@ class Crawler():
 
         [thread.join() for thread in workersThreads]
     
+    def __getHostsQueuesDepths(self) -> dict:
+        return {'hostsToRequest': {workerId: worker.numHostsToRequest() for workerId, worker in self._workersQueues.items()}}
+
     def __getHostsAndResourcesFromWorkers(self):
         workers = [worker for (_,worker) in self._workersQueues.items()]
         for workerId, worker in enumerate(workers):
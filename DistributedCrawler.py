@@ -0,0 +1,577 @@
+from Crawler import Crawler
+from RobotsCache import RobotsCache
+from threading import Lock, Condition, Event, Thread
+import SeenStore
+import Frontier
+import itertools
+import logging
+import socket
+import signal
+import queue
+import json
+import utils
+
+class MessageConnection():
+    """
+    Messages are dicts sent as JSON, one per line, over a TCP connection.
+    Sending is thread safe; only one thread may receive
+    """
+
+    def __init__(self, connectedSocket:socket.socket):
+        self._socket = connectedSocket
+        self._reader = connectedSocket.makefile('r', encoding='utf-8', newline='\n')
+        self._sendLock = Lock()
+
+    def send(self, message:dict) -> bool:
+        data = (json.dumps(message) + "\n").encode('utf-8')
+
+        self._sendLock.acquire()
+        try:
+            self._socket.sendall(data)
+            sent = True
+        except OSError:
+            sent = False
+        self._sendLock.release()
+
+        return sent
+
+    def receive(self) -> dict:
+        """None once the connection is closed"""
+        try:
+            line = self._reader.readline()
+        except (OSError, ValueError):
+            return None
+
+        if line == "":
+            return None
+        return json.loads(line)
+
+    def stopReceiving(self):
+        """Wakes up whoever is receiving, while messages can still be sent"""
+        try:
+            self._socket.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+
+    def close(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+
+class CrawlNode():
+    """
+    What the coordinator knows of a node. Messages to it are queued and sent by its own thread,
+    so the coordinator never blocks on a slow node
+    """
+
+    def __init__(self, nodeId:int, connection:MessageConnection):
+        self.nodeId = nodeId
+        self.connection = connection
+
+        #Batches of links sent to the node and how many it said it had delivered when it was last idle
+        self.numBatchesSent = 0
+        self.numBatchesReceivedWhenIdle = None
+        #Left the host assignment, but may still be delivering links to the other nodes
+        self.leaving = False
+
+        self._outbox = queue.Queue()
+        self._senderThread = Thread(target=self._sendMessages, name=f"NodeSender{nodeId}")
+        self._senderThread.start()
+
+    def isIdle(self) -> bool:
+        return self.numBatchesReceivedWhenIdle == self.numBatchesSent
+
+    def queueMessage(self, message:dict):
+        self._outbox.put(message)
+
+    def stopSending(self):
+        self._outbox.put(None)
+
+    def _sendMessages(self):
+        message = self._outbox.get()
+        while message != None:
+            self.connection.send(message)
+            message = self._outbox.get()
+
+class CrawlCoordinator():
+    """
+    Coordinates the nodes of a distributed crawl, each one a NodeCrawler on its own machine.
+    It owns which node crawls each host, relays the links nodes find to the nodes of their hosts,
+    counts the pages crawled by every node and decides when the crawl is over, like WorkersPipeline
+    does for the workers of a process. Hosts are given to nodes by rendezvous hashing, so when
+    a node joins or leaves only the hosts it gets or had are reassigned
+    """
+
+    ACCEPT_TIMEOUT_SECONDS = 0.5
+
+    def __init__(self, pagesCrawledLimit:int, address:tuple, minNumNodes:int = 1):
+        self._pagesLimit = pagesCrawledLimit
+        self._address = address
+        #Seeds are only sent once this many nodes joined
+        self._minNumNodes = minNumNodes
+
+        self._lock = Lock()
+        self._nodesChangedCondition = Condition(self._lock)
+        self._nextNodeId = itertools.count()
+        #Every node connected, and the ones hosts are assigned to
+        self._nodes = dict()
+        self._assignedNodeIds = list()
+        self._assignmentVersion = 0
+
+        self._started = False
+        self._doneEvent = Event()
+        self._numLinksLost = 0
+        #Batches of links sent to nodes that failed before delivering them, of unknown size
+        self._numBatchesLost = 0
+
+        self._pagesCrawled = 0
+        self._resourcesPerHost = dict()
+
+        self._listeningSocket = None
+        self._stopAccepting = Event()
+
+    @property
+    def pagesLimit(self):
+        """The maximum number of pages that can be crawled"""
+        return self._pagesLimit
+
+    @pagesLimit.setter
+    def pagesLimit(self, newPagesLimit):
+        self._pagesLimit = newPagesLimit
+
+    @property
+    def pagesCrawled(self) -> int:
+        """The number of pages crawled by every node"""
+        return self._pagesCrawled
+
+    @pagesCrawled.setter
+    def pagesCrawled(self, newValue):
+        raise AttributeError("pagesCrawled is not writable")
+
+    def startCrawlingFromSeedsFile(self, seedsFilePath:str):
+        with open(seedsFilePath, 'r') as seedsFile:
+            seeds = [link.rstrip('\n') for link in seedsFile if link.rstrip('\n') != ""]
+
+        self._listeningSocket = socket.create_server(self._address)
+        #Closing the socket does not wake up a thread blocked on accept, so it checks if the crawl is over
+        self._listeningSocket.settimeout(CrawlCoordinator.ACCEPT_TIMEOUT_SECONDS)
+        acceptThread = Thread(target=self._acceptNodes, name="AcceptNodes")
+        acceptThread.start()
+        logging.info(f"Coordinator on {self._address}, waiting for {self._minNumNodes} nodes")
+
+        self._lock.acquire()
+        while len(self._assignedNodeIds) < self._minNumNodes:
+            self._nodesChangedCondition.wait()
+        self._started = True
+        self._sendLinksToTheirNodes(seeds)
+        self._checkIfDone()
+        self._lock.release()
+
+        self._doneEvent.wait()
+
+        #Every node sends what it crawled before it disconnects
+        self._lock.acquire()
+        while len(self._nodes) > 0:
+            self._nodesChangedCondition.wait()
+        self._lock.release()
+
+        self._stopAccepting.set()
+        acceptThread.join()
+        self._listeningSocket.close()
+        logging.info(f"Crawl done: {self._pagesCrawled} pages, {self._numLinksLost} links with no node to go to and "
+                        f"{self._numBatchesLost} batches of links lost with nodes that failed")
+
+    def _acceptNodes(self):
+        while not self._stopAccepting.is_set():
+            try:
+                nodeSocket, _ = self._listeningSocket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            nodeSocket.settimeout(None)
+            Thread(target=self._serveNode, args=(MessageConnection(nodeSocket),)).start()
+
+    def _serveNode(self, connection:MessageConnection):
+        hello = connection.receive()
+        if hello == None or hello.get('type') != "hello":
+            connection.close()
+            return
+
+        node = self._addNode(connection)
+
+        message = connection.receive()
+        while message != None:
+            self._handleMessage(node, message)
+            message = connection.receive()
+
+        self._removeNode(node)
+        connection.close()
+
+    def _addNode(self, connection:MessageConnection) -> CrawlNode:
+        self._lock.acquire()
+        node = CrawlNode(next(self._nextNodeId), connection)
+        self._nodes[node.nodeId] = node
+        self._assignedNodeIds.append(node.nodeId)
+        self._assignmentVersion += 1
+
+        node.queueMessage({'type': "welcome", 'nodeId': node.nodeId, 'pagesLimit': self._pagesLimit,
+                            'nodeIds': list(self._assignedNodeIds), 'assignmentVersion': self._assignmentVersion})
+        self._sendAssignmentToEveryNode(exceptNodeId=node.nodeId)
+        if self._doneEvent.is_set():
+            node.queueMessage({'type': "done"})
+
+        logging.info(f"Node {node.nodeId} joined, nodes: {self._assignedNodeIds}")
+        self._nodesChangedCondition.notify_all()
+        self._lock.release()
+
+        return node
+
+    def _removeNode(self, node:CrawlNode):
+        self._lock.acquire()
+        if node.nodeId in self._assignedNodeIds:
+            self._assignedNodeIds.remove(node.nodeId)
+            if not self._doneEvent.is_set():
+                #It failed, so the links on its frontier and the batches it had not delivered are lost
+                self._numBatchesLost += node.numBatchesSent - (node.numBatchesReceivedWhenIdle or 0)
+                self._assignmentVersion += 1
+                self._sendAssignmentToEveryNode()
+                logging.info(f"Node {node.nodeId} disconnected without leaving, nodes: {self._assignedNodeIds}")
+
+        self._nodes.pop(node.nodeId, None)
+        node.stopSending()
+        self._checkIfDone()
+        self._nodesChangedCondition.notify_all()
+        self._lock.release()
+
+    def _handleMessage(self, node:CrawlNode, message:dict):
+        self._lock.acquire()
+        messageType = message.get('type')
+
+        if messageType == "links":
+            if not self._doneEvent.is_set():
+                self._sendLinksToTheirNodes(message['links'])
+
+        elif messageType == "seen":
+            if not self._doneEvent.is_set():
+                self._sendLinksToTheirNodes(message['links'], "seen")
+
+        elif messageType == "page":
+            self._pagesCrawled += 1
+            if self._pagesCrawled > self._pagesLimit:
+                self._finish()
+
+        elif messageType == "idle":
+            node.numBatchesReceivedWhenIdle = message['numBatchesReceived']
+            self._checkIfDone()
+
+        elif messageType == "leave":
+            if node.nodeId in self._assignedNodeIds:
+                self._assignedNodeIds.remove(node.nodeId)
+                self._assignmentVersion += 1
+                node.leaving = True
+                self._sendAssignmentToEveryNode()
+                logging.info(f"Node {node.nodeId} is leaving, nodes: {self._assignedNodeIds}")
+                self._checkIfDone()
+
+        elif messageType == "result":
+            for host, numResources in message['resourcesPerHost'].items():
+                self._resourcesPerHost[host] = self._resourcesPerHost.get(host, 0) + numResources
+            logging.info(f"Node {node.nodeId} crawled {message['pagesCrawled']} pages")
+
+        self._lock.release()
+
+    def _sendLinksToTheirNodes(self, links:list, messageType:str = "links"):
+        """
+        Must be called with the lock. Seen links give a node nothing to crawl,
+        so they are neither counted as batches nor as links lost
+        """
+        linksByNode = dict()
+        for link in links:
+            nodeId = utils.nodeOfHost(self._assignedNodeIds, utils.getHostWithSchemaOfLink(link))
+            if nodeId == None:
+                if messageType == "links":
+                    self._numLinksLost += 1
+            else:
+                linksByNode.setdefault(nodeId, list()).append(link)
+
+        for nodeId, linksOfNode in linksByNode.items():
+            node = self._nodes[nodeId]
+            if messageType == "links":
+                node.numBatchesSent += 1
+            node.queueMessage({'type': messageType, 'links': linksOfNode})
+
+    def _sendAssignmentToEveryNode(self, exceptNodeId:int = None):
+        """Must be called with the lock"""
+        for nodeId, node in self._nodes.items():
+            if nodeId != exceptNodeId:
+                node.queueMessage({'type': "assignment", 'nodeIds': list(self._assignedNodeIds),
+                                    'assignmentVersion': self._assignmentVersion})
+
+    def _checkIfDone(self):
+        """
+        Must be called with the lock. A node is only idle when it has delivered every batch sent to it,
+        and it only gets work from batches, so the crawl is over when every node is idle
+        """
+        if not self._started or self._doneEvent.is_set():
+            return
+
+        for nodeId, node in list(self._nodes.items()):
+            if node.leaving and node.isIdle():
+                node.leaving = False
+                node.queueMessage({'type': "done"})
+                logging.info(f"Node {nodeId} left")
+
+        everyNodeIdle = all([node.isIdle() for _, node in self._nodes.items()
+                                if node.nodeId in self._assignedNodeIds])
+        if everyNodeIdle and not any([node.leaving for _, node in self._nodes.items()]):
+            logging.info("Every node is idle")
+            self._finish()
+
+    def _finish(self):
+        """Must be called with the lock"""
+        if not self._doneEvent.is_set():
+            self._doneEvent.set()
+            for _, node in self._nodes.items():
+                node.queueMessage({'type': "done"})
+
+    def getResourcesNumPerHost(self) -> dict:
+        return self._resourcesPerHost
+
+class NodeLinkExchange():
+    """
+    The link exchange of a NodeCrawler, with the same interface as ProcessLinkExchange.
+    Links of hosts of other nodes go through the coordinator, which also counts the pages
+    and tells when the crawl is over
+    """
+
+    def __init__(self, connection:MessageConnection, welcome:dict, seenStore:SeenStore.SeenStore = None):
+        self._connection = connection
+        self._nodeId = welcome['nodeId']
+        #Where the urls seen of hosts this node got from others are marked
+        self._seenStore = SeenStore.ExactSeenStore() if seenStore == None else seenStore
+
+        self._lock = Lock()
+        self._assignedNodeIds = welcome['nodeIds']
+        self._assignmentVersion = welcome['assignmentVersion']
+
+        #Only touched under self._lock
+        self._numBatchesReceived = 0
+        self._deliveriesInProgress = 0
+        self._idleReported = False
+
+        self._doneEvent = Event()
+        self._receiverThread = None
+
+    @property
+    def processId(self) -> int:
+        return self._nodeId
+
+    @processId.setter
+    def processId(self, newProcessId):
+        raise AttributeError("processId is not writable")
+
+    @property
+    def numProcesses(self) -> int:
+        """
+        Hosts are not given to nodes by dividing their hash, so the workers
+        of a node do not need to account for the other nodes
+        """
+        return 1
+
+    @numProcesses.setter
+    def numProcesses(self, newNumProcesses):
+        raise AttributeError("numProcesses is not writable")
+
+    @property
+    def assignmentVersion(self) -> int:
+        """Changes every time a node joins or leaves"""
+        return self._assignmentVersion
+
+    @assignmentVersion.setter
+    def assignmentVersion(self, newAssignmentVersion):
+        raise AttributeError("assignmentVersion is not writable")
+
+    def processOfHost(self, hostWithSchema:str) -> int:
+        return utils.nodeOfHost(self._assignedNodeIds, hostWithSchema)
+
+    def isLocalHost(self, hostWithSchema:str) -> bool:
+        return self.processOfHost(hostWithSchema) == self._nodeId
+
+    def sendLinks(self, processId:int, links:list):
+        #The coordinator sends them to whichever node has their hosts when they get there
+        self._connection.send({'type': "links", 'links': links})
+
+    def sendSeenLinks(self, processId:int, links:list):
+        self._connection.send({'type': "seen", 'links': links})
+
+    def addPageAndReturnIfLimitReached(self) -> bool:
+        self._connection.send({'type': "page"})
+        return self.pagesLimitReached()
+
+    def pagesLimitReached(self) -> bool:
+        return self._doneEvent.is_set()
+
+    def notifyLocallyIdle(self) -> bool:
+        """
+        Called when every worker of this node is waiting with no links to receive.
+        Returns whether the crawl is over
+        """
+        self._lock.acquire()
+        if self._deliveriesInProgress == 0 and not self._idleReported:
+            self._idleReported = True
+            self._connection.send({'type': "idle", 'numBatchesReceived': self._numBatchesReceived})
+        self._lock.release()
+
+        return self.allDone()
+
+    def allDone(self) -> bool:
+        return self._doneEvent.is_set()
+
+    def leave(self):
+        """The hosts of this node go to the other nodes, then the coordinator ends its crawl"""
+        self._connection.send({'type': "leave"})
+
+    def startReceiving(self, workersPipeline):
+        self._receiverThread = Thread(target=self._receiveMessages, args=(workersPipeline,))
+        self._receiverThread.start()
+
+    def stopReceiving(self):
+        self._connection.stopReceiving()
+        if self._receiverThread != None:
+            self._receiverThread.join()
+
+    def _receiveMessages(self, workersPipeline):
+        message = self._connection.receive()
+        while message != None:
+            messageType = message.get('type')
+
+            if messageType == "links":
+                self._beginDelivery()
+                workersPipeline.deliverLinksToProperWorkers(message['links'])
+                self._endDelivery()
+
+                workersPipeline.checkIfShouldStop()
+
+            elif messageType == "seen":
+                [self._seenStore.addIfNotSeen(link) for link in message['links']]
+
+            elif messageType == "assignment":
+                self._lock.acquire()
+                self._assignedNodeIds = message['nodeIds']
+                self._assignmentVersion = message['assignmentVersion']
+                self._lock.release()
+
+            elif messageType == "done":
+                self._doneEvent.set()
+                workersPipeline.finishAllWorkers()
+
+            message = self._connection.receive()
+
+        if not self._doneEvent.is_set():
+            logging.info("Lost the connection to the coordinator")
+            self._doneEvent.set()
+            workersPipeline.finishAllWorkers()
+
+    def _beginDelivery(self):
+        self._lock.acquire()
+        self._idleReported = False
+        self._deliveriesInProgress += 1
+        self._lock.release()
+
+    def _endDelivery(self):
+        self._lock.acquire()
+        self._numBatchesReceived += 1
+        self._deliveriesInProgress -= 1
+        self._lock.release()
+
+class NodeCrawler():
+    """
+    A node of a distributed crawl. It joins the CrawlCoordinator and runs a Crawler on the hosts
+    the coordinator gives it, writing its own WARC files. On SIGTERM it leaves the crawl:
+    the resources of its hosts are sent to the nodes that get them
+    """
+
+    def __init__(self, coordinatorAddress:tuple, numWorkers:int = 1, debugMode:bool = False,
+                    seenStoreConfig:dict = None, maxResidentResources:int = 0,
+                    robotsCacheFilePath:str = "robots.cache", singleGET:bool = True):
+        self._coordinatorAddress = coordinatorAddress
+        self._numWorkers = numWorkers
+        self._debugMode = debugMode
+        self._maxResidentResources = maxResidentResources
+        self._robotsCacheFilePath = robotsCacheFilePath
+        self._singleGET = singleGET
+
+        self._seenStoreConfig = seenStoreConfig
+        if self._seenStoreConfig == None:
+            self._seenStoreConfig = {'kind': "exact", 'expectedNumUrls': 0, 'falsePositiveRate': 0.0,
+                                        'filePath': "seen.bloom", 'reuseFile': False}
+
+        self._nodeId = None
+        self._crawler = None
+        self._linkExchange = None
+
+    @property
+    def nodeId(self) -> int:
+        return self._nodeId
+
+    @nodeId.setter
+    def nodeId(self, newNodeId):
+        raise AttributeError("nodeId is not writable")
+
+    @property
+    def pagesCrawled(self) -> int:
+        """The number of pages crawled by this node"""
+        return 0 if self._crawler == None else self._crawler.pagesCrawled
+
+    @pagesCrawled.setter
+    def pagesCrawled(self, newValue):
+        raise AttributeError("pagesCrawled is not writable")
+
+    def startCrawlingFromCoordinator(self):
+        try:
+            connection = MessageConnection(socket.create_connection(self._coordinatorAddress))
+        except OSError as e:
+            raise ConnectionError(f"Could not connect to the coordinator on {self._coordinatorAddress}: {e}") from e
+        connection.send({'type': "hello"})
+        welcome = connection.receive()
+        if welcome == None or welcome.get('type') != "welcome":
+            connection.close()
+            raise ConnectionError(f"The coordinator on {self._coordinatorAddress} did not accept this node")
+
+        self._nodeId = welcome['nodeId']
+        logging.info(f"Joined the crawl as node {self._nodeId}")
+
+        #Files of other nodes may be on the same directory when testing on a single machine
+        seenStore = SeenStore.createSeenStore(self._seenStoreConfig['kind'], self._seenStoreConfig['expectedNumUrls'],
+                                                self._seenStoreConfig['falsePositiveRate'],
+                                                f"{self._seenStoreConfig['filePath']}.n{self._nodeId}",
+                                                self._seenStoreConfig['reuseFile'])
+        frontierFactory = None
+        if self._maxResidentResources > 0:
+            frontierFactory = Frontier.SpillingFrontierFactory(f"frontier_spill_n{self._nodeId}",
+                                                                self._maxResidentResources)
+        robotsCache = RobotsCache(f"{self._robotsCacheFilePath}.n{self._nodeId}")
+
+        self._linkExchange = NodeLinkExchange(connection, welcome, seenStore)
+        self._crawler = Crawler(welcome['pagesLimit'], self._numWorkers, self._debugMode,
+                                linkExchange=self._linkExchange, warcPreName=f"results_n{self._nodeId}_",
+                                seenStore=seenStore, frontierFactory=frontierFactory, robotsCache=robotsCache,
+                                singleGET=self._singleGET)
+        signal.signal(signal.SIGTERM, lambda signalNumber, frame: self.leave())
+
+        self._crawler.startCrawlingFromReceivedLinks()
+
+        connection.send({'type': "result", 'pagesCrawled': self._crawler.pagesCrawled,
+                            'resourcesPerHost': self._crawler.getResourcesNumPerHost()})
+        connection.close()
+
+    def leave(self):
+        if self._linkExchange != None:
+            logging.info(f"Node {self._nodeId} leaving the crawl")
+            self._linkExchange.leave()
+
+    def getResourcesNumPerHost(self) -> dict:
+        return dict() if self._crawler == None else self._crawler.getResourcesNumPerHost()
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from threading import Lock
+import socket
+import time
+
+class DnsCache():
+    """
+    Addresses of hosts resolved by the system, kept for some time and shared by every worker of the process.
+    Failures are kept too, for less time, so a host that can not be resolved is not resolved on every request.
+    At most maxEntries hosts are kept, dropping the ones looked up least recently
+    """
+
+    TTL_SECONDS = 300
+    NEGATIVE_TTL_SECONDS = 60
+    MAX_ENTRIES = 65536
+
+    def __init__(self, ttlSeconds:float = None, negativeTtlSeconds:float = None, maxEntries:int = None):
+        self._ttlSeconds = DnsCache.TTL_SECONDS if ttlSeconds == None else ttlSeconds
+        self._negativeTtlSeconds = DnsCache.NEGATIVE_TTL_SECONDS if negativeTtlSeconds == None else negativeTtlSeconds
+        self._maxEntries = DnsCache.MAX_ENTRIES if maxEntries == None else maxEntries
+
+        #(host, family) -> (expireTime on time.monotonic(), getaddrinfo entries or None if it failed),
+        #from the one looked up least recently to the one looked up last
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+        self._numHits = 0
+        self._numMisses = 0
+        self._numFailures = 0
+
+    def getAddresses(self, host:str, family:int = socket.AF_UNSPEC) -> list:
+        """
+        The getaddrinfo entries of the host, without port. Raises socket.gaierror if it can not be resolved
+        """
+        now = time.monotonic()
+
+        self._lock.acquire()
+        entry = self._entries.get((host, family))
+        isCached = entry != None and entry[0] > now
+        if isCached:
+            self._numHits += 1
+            self._entries.move_to_end((host, family))
+        else:
+            self._numMisses += 1
+            if entry != None:
+                del self._entries[(host, family)]
+        self._lock.release()
+
+        if isCached:
+            if entry[1] == None:
+                raise socket.gaierror(socket.EAI_NONAME, f"{host} could not be resolved a moment ago")
+            return entry[1]
+
+        #Resolved out of the lock, so other hosts are not kept waiting. A host may be resolved
+        #by two workers at the same time, which only costs a lookup
+        try:
+            addresses = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
+        except socket.gaierror:
+            self._putEntry(host, family, None, self._negativeTtlSeconds)
+            raise
+
+        self._putEntry(host, family, addresses, self._ttlSeconds)
+        return addresses
+
+    def getIpOf(self, host:str) -> str:
+        """
+        The first address of the host, or None if it can not be resolved
+        """
+        try:
+            return self.getAddresses(host)[0][4][0]
+        except (socket.gaierror, UnicodeError, IndexError):
+            return None
+
+    def _putEntry(self, host:str, family:int, addresses:list, ttlSeconds:float):
+        self._lock.acquire()
+        if addresses == None:
+            self._numFailures += 1
+        self._entries[(host, family)] = (time.monotonic() + ttlSeconds, addresses)
+        self._entries.move_to_end((host, family))
+        while len(self._entries) > self._maxEntries:
+            self._entries.popitem(last=False)
+        self._lock.release()
+
+    def getStatsString(self) -> str:
+        numLookups = max(1, self._numHits + self._numMisses)
+        return (f"DnsCache: {len(self._entries)} hosts, {self._numHits} hits and {self._numMisses} misses "
+                f"({self._numHits / numLookups:.2%} hit rate), {self._numFailures} resolutions failed")
@@ -0,0 +1,431 @@
+from collections import deque
+from threading import Lock
+import itertools
+import shutil
+import sys
+import os
+
+class FrontierBudget():
+    """
+    The maximum number of resources that all the frontiers together may keep in memory
+    """
+
+    def __init__(self, maxResidentResources:int):
+        self._maxResidentResources = maxResidentResources
+        self._numResidentResources = 0
+        self._lock = Lock()
+
+    @property
+    def numResidentResources(self) -> int:
+        return self._numResidentResources
+
+    @numResidentResources.setter
+    def numResidentResources(self, newNumResidentResources):
+        raise AttributeError("numResidentResources is not writable")
+
+    def tryReserve(self) -> bool:
+        self._lock.acquire()
+        reserved = self._numResidentResources < self._maxResidentResources
+        if reserved:
+            self._numResidentResources += 1
+        self._lock.release()
+        return reserved
+
+    def reserveUpTo(self, numResources:int, minNumResources:int = 1) -> int:
+        """
+        Reserves as many of numResources as the budget allows, but at least minNumResources,
+        so that a frontier can always make progress
+        """
+        self._lock.acquire()
+        numReserved = min(numResources, max(minNumResources, self._maxResidentResources - self._numResidentResources))
+        self._numResidentResources += numReserved
+        self._lock.release()
+        return numReserved
+
+    def release(self, numResources:int = 1):
+        self._lock.acquire()
+        self._numResidentResources -= numResources
+        self._lock.release()
+    
+    def forceReserve(self, numResources:int):
+        """For resources that are already in memory, like the ones restored from a checkpoint"""
+        self._lock.acquire()
+        self._numResidentResources += numResources
+        self._lock.release()
+
+class SpillSegment():
+    """
+    An append-only file of resources, one per line, read from the start to the end.
+    The file is only open while it is written or read, so there are never more open files than threads spilling
+    """
+
+    def __init__(self, filePath:str):
+        self._filePath = filePath
+        self._numWritten = 0
+        self._numBytesWritten = 0
+        self._numRead = 0
+        self._readOffset = 0
+
+    @property
+    def numWritten(self) -> int:
+        return self._numWritten
+
+    @numWritten.setter
+    def numWritten(self, newNumWritten):
+        raise AttributeError("numWritten is not writable")
+
+    @property
+    def filePath(self) -> str:
+        return self._filePath
+
+    @filePath.setter
+    def filePath(self, newFilePath):
+        raise AttributeError("filePath is not writable")
+
+    def numUnread(self) -> int:
+        return self._numWritten - self._numRead
+
+    def append(self, resources:list):
+        resourcesBytes = "".join([f"{resource}\n" for resource in resources]).encode('utf-8')
+        with open(self._filePath, 'ab') as segmentFile:
+            segmentFile.write(resourcesBytes)
+        self._numWritten += len(resources)
+        self._numBytesWritten += len(resourcesBytes)
+
+    def read(self, maxNumResources:int) -> list:
+        resources = list()
+        with open(self._filePath, 'rb') as segmentFile:
+            segmentFile.seek(self._readOffset)
+            while len(resources) < maxNumResources and self._numRead < self._numWritten:
+                resources.append(segmentFile.readline().decode('utf-8').rstrip('\n'))
+                self._numRead += 1
+            self._readOffset = segmentFile.tell()
+        return resources
+
+    def delete(self):
+        if os.path.isfile(self._filePath):
+            os.remove(self._filePath)
+
+    def getCheckpointState(self, segmentsDir:str) -> dict:
+        """
+        Hard links the segment into segmentsDir. It is append-only, so what is
+        appended after the checkpoint is cut off when it is restored
+        """
+        linkedFileName = os.path.basename(self._filePath)
+        linkedFilePath = os.path.join(segmentsDir, linkedFileName)
+        try:
+            os.link(self._filePath, linkedFilePath)
+        except OSError:
+            shutil.copyfile(self._filePath, linkedFilePath)
+
+        return {'fileName': linkedFileName, 'numWritten': self._numWritten, 'numBytesWritten': self._numBytesWritten,
+                'numRead': self._numRead, 'readOffset': self._readOffset}
+
+    @staticmethod
+    def fromCheckpointState(state:dict, segmentsDir:str, filePath:str):
+        shutil.copyfile(os.path.join(segmentsDir, state['fileName']), filePath)
+        os.truncate(filePath, state['numBytesWritten'])
+
+        segment = SpillSegment(filePath)
+        segment._numWritten = state['numWritten']
+        segment._numBytesWritten = state['numBytesWritten']
+        segment._numRead = state['numRead']
+        segment._readOffset = state['readOffset']
+        return segment
+
+class SpillingFrontier():
+    """
+    A FIFO queue of resources with the same interface as the deque it replaces.
+    Its head is kept in memory while the FrontierBudget allows and its tail
+    is spilled to append-only segment files, read back in bulk when the head drains
+    """
+
+    #Spilled resources are written and read back in batches of this size while the budget allows
+    REFILL_BATCH_SIZE = 256
+    MAX_RESOURCES_PER_SEGMENT = 100000
+
+    def __init__(self, segmentsPathPrefix:str, budget:FrontierBudget):
+        self._segmentsPathPrefix = segmentsPathPrefix
+        self._budget = budget
+
+        self._head = deque()
+        #Spilled resources not yet written to a segment. They are counted on the budget,
+        #and written as soon as it is used up
+        self._writeBuffer = list()
+        self._segments = deque()
+        self._segmentsCreated = 0
+        self._numSpilled = 0
+
+    def __len__(self) -> int:
+        return len(self._head) + self._numSpilled
+
+    def __str__(self) -> str:
+        return f"{list(self._head)} (+{self._numSpilled} on disk)"
+
+    def append(self, resource:str):
+        #Once something is spilled, everything after it must be spilled too to keep the order
+        if self._numSpilled > 0:
+            self._spill(resource)
+        elif self._budget.tryReserve():
+            self._head.append(resource)
+        else:
+            self._spill(resource)
+
+    def extend(self, resources):
+        for resource in resources:
+            self.append(resource)
+
+    def popleft(self) -> str:
+        if len(self._head) == 0:
+            self._refill()
+
+        resource = self._head.popleft()
+        self._budget.release()
+        return resource
+
+    def clear(self):
+        self._budget.release(len(self._head) + len(self._writeBuffer))
+        self._head.clear()
+        self._writeBuffer.clear()
+        [segment.delete() for segment in self._segments]
+        self._segments.clear()
+        self._numSpilled = 0
+
+    def _spill(self, resource:str):
+        #A Url, like the ones on the inboxes of the workers, is spilled as its link and read back as it
+        resource = str(resource).replace("\n", "%0A")
+        self._numSpilled += 1
+
+        if self._budget.tryReserve():
+            self._writeBuffer.append(resource)
+            if len(self._writeBuffer) >= SpillingFrontier.REFILL_BATCH_SIZE:
+                self._flushWriteBuffer()
+        else:
+            self._flushWriteBuffer([resource])
+
+    def _flushWriteBuffer(self, unreservedResources:list = None):
+        """unreservedResources are written after the buffer and were not counted on the budget"""
+        resources = self._writeBuffer if unreservedResources == None else self._writeBuffer + unreservedResources
+        if len(resources) == 0:
+            return
+
+        if len(self._segments) == 0 or self._segments[-1].numWritten >= SpillingFrontier.MAX_RESOURCES_PER_SEGMENT:
+            self._segments.append(SpillSegment(self._newSegmentPath()))
+
+        self._segments[-1].append(resources)
+        self._budget.release(len(self._writeBuffer))
+        self._writeBuffer = list()
+
+    def _newSegmentPath(self) -> str:
+        segmentPath = f"{self._segmentsPathPrefix}_{self._segmentsCreated}.seg"
+        self._segmentsCreated += 1
+        return segmentPath
+
+    def getCheckpointState(self, checkpointDir:str) -> dict:
+        segmentsDir = os.path.join(checkpointDir, "segments")
+        os.makedirs(segmentsDir, exist_ok=True)
+
+        return {'head': list(self._head), 'writeBuffer': list(self._writeBuffer), 'numSpilled': self._numSpilled,
+                'segments': [segment.getCheckpointState(segmentsDir) for segment in self._segments]}
+
+    def restoreFromCheckpointState(self, state:dict, checkpointDir:str):
+        segmentsDir = os.path.join(checkpointDir, "segments")
+
+        self.clear()
+        self._head.extend(state['head'])
+        self._budget.forceReserve(len(self._head))
+
+        for segmentState in state['segments']:
+            self._segments.append(SpillSegment.fromCheckpointState(segmentState, segmentsDir, self._newSegmentPath()))
+        #What was not yet written goes to the disk after them, so it takes none of the budget
+        self._flushWriteBuffer(state['writeBuffer'])
+        self._numSpilled = state['numSpilled']
+
+    def _refill(self):
+        if self._numSpilled == 0:
+            raise IndexError("pop from an empty frontier")
+
+        numToRefill = min(SpillingFrontier.REFILL_BATCH_SIZE, self._numSpilled)
+        #At least the one being popped, which leaves the budget as soon as it is returned
+        numToRefill = self._budget.reserveUpTo(numToRefill)
+
+        while len(self._head) < numToRefill:
+            if len(self._segments) == 0:
+                #The oldest spilled resources left were never written, so they are taken from the buffer
+                numFromBuffer = numToRefill - len(self._head)
+                self._head.extend(self._writeBuffer[:numFromBuffer])
+                del self._writeBuffer[:numFromBuffer]
+                self._budget.release(numFromBuffer)
+                break
+
+            oldestSegment = self._segments[0]
+            self._head.extend(oldestSegment.read(numToRefill - len(self._head)))
+
+            if oldestSegment.numUnread() == 0:
+                oldestSegment.delete()
+                self._segments.popleft()
+
+        self._numSpilled -= numToRefill
+
+class PackedFrontier():
+    """
+    A FIFO queue of the resources of a host with the same interface as the deque it replaces, packed into one
+    bytearray. Resources are front-coded: each one keeps a byte with the length of the prefix it shares with
+    the one before it and then only the rest, since the resources of a host are mostly under the same paths
+    """
+
+    __slots__ = ('_packed', '_readOffset', '_length', '_lastAppended', '_lastPopped')
+
+    MAX_SHARED_PREFIX = 255
+    #What was already popped is cut off the start once it is at least this big and half of the bytearray
+    MIN_COMPACT_BYTES = 4096
+
+    def __init__(self, resources = None):
+        #None while empty, so a host with nothing to crawl keeps no buffer
+        self._packed = None
+        self._readOffset = 0
+        self._length = 0
+        #Encoded, the last resource appended and the last popped, which the next ones are coded against
+        self._lastAppended = b""
+        self._lastPopped = b""
+
+        if resources != None:
+            self.extend(resources)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self):
+        previousResource = self._lastPopped
+        offset = self._readOffset
+        for _ in range(self._length):
+            end = self._packed.index(b"\n", offset + 1)
+            previousResource = previousResource[:self._packed[offset]] + bytes(self._packed[offset + 1:end])
+            offset = end + 1
+            yield previousResource.decode('utf-8')
+
+    def __str__(self) -> str:
+        return str(list(self))
+
+    def append(self, resource:str):
+        resourceBytes = str(resource).replace("\n", "%0A").encode('utf-8')
+        sharedLength = PackedFrontier._sharedPrefixLength(self._lastAppended, resourceBytes)
+
+        if self._packed == None:
+            self._packed = bytearray()
+        self._packed.append(sharedLength)
+        self._packed += resourceBytes[sharedLength:]
+        self._packed.append(10)
+        self._lastAppended = resourceBytes
+        self._length += 1
+
+    def extend(self, resources):
+        for resource in resources:
+            self.append(resource)
+
+    @staticmethod
+    def _sharedPrefixLength(previousBytes:bytes, nextBytes:bytes) -> int:
+        #A binary search comparing slices, which is faster than comparing byte by byte in Python
+        minLength, maxLength = 0, min(len(previousBytes), len(nextBytes), PackedFrontier.MAX_SHARED_PREFIX)
+        while minLength < maxLength:
+            length = (minLength + maxLength + 1) // 2
+            if previousBytes[:length] == nextBytes[:length]:
+                minLength = length
+            else:
+                maxLength = length - 1
+        return minLength
+
+    def popleft(self) -> str:
+        if self._length == 0:
+            raise IndexError("pop from an empty frontier")
+
+        end = self._packed.index(b"\n", self._readOffset + 1)
+        resourceBytes = self._lastPopped[:self._packed[self._readOffset]] + bytes(self._packed[self._readOffset + 1:end])
+        self._readOffset = end + 1
+        self._length -= 1
+
+        if self._length == 0:
+            self.clear()
+        else:
+            self._lastPopped = resourceBytes
+            if self._readOffset >= PackedFrontier.MIN_COMPACT_BYTES and self._readOffset * 2 >= len(self._packed):
+                del self._packed[:self._readOffset]
+                self._readOffset = 0
+
+        return resourceBytes.decode('utf-8')
+
+    def clear(self):
+        self._packed = None
+        self._readOffset = 0
+        self._length = 0
+        self._lastAppended = b""
+        self._lastPopped = b""
+
+    def memoryFootprintBytes(self) -> int:
+        return (sys.getsizeof(self) + (0 if self._packed == None else sys.getsizeof(self._packed))
+                + sys.getsizeof(self._lastAppended) + sys.getsizeof(self._lastPopped))
+
+class FrontierFactory():
+    """
+    Creates the queues of resources of hosts and of links sent between workers
+    """
+
+    def newFrontier(self):
+        return deque()
+
+    def newHostFrontier(self):
+        """The queue of resources of a host. Links sent between workers are Urls, so they are not packed"""
+        return PackedFrontier()
+
+    def getFrontierCheckpointState(self, frontier, checkpointDir:str):
+        return list(frontier)
+
+    def restoreFrontier(self, state, checkpointDir:str):
+        return PackedFrontier(state)
+
+    def close(self):
+        pass
+
+    def getStatsString(self) -> str:
+        return "Frontier fully in memory, the resources of each host packed"
+
+class SpillingFrontierFactory(FrontierFactory):
+    """
+    Creates SpillingFrontiers that share one memory budget and one spill directory
+    """
+
+    def __init__(self, spillDir:str, maxResidentResources:int):
+        self._spillDir = spillDir
+        self._budget = FrontierBudget(maxResidentResources)
+        self._maxResidentResources = maxResidentResources
+        self._frontierIds = itertools.count()
+        self._frontierIdsLock = Lock()
+
+        #Whatever is there was left by a run that died. What a checkpoint needs is linked into it
+        shutil.rmtree(self._spillDir, ignore_errors=True)
+        os.makedirs(self._spillDir, exist_ok=True)
+
+    def newFrontier(self):
+        self._frontierIdsLock.acquire()
+        frontierId = next(self._frontierIds)
+        self._frontierIdsLock.release()
+
+        return SpillingFrontier(os.path.join(self._spillDir, f"frontier{frontierId}"), self._budget)
+
+    def newHostFrontier(self):
+        return self.newFrontier()
+
+    def getFrontierCheckpointState(self, frontier, checkpointDir:str):
+        return frontier.getCheckpointState(checkpointDir)
+
+    def restoreFrontier(self, state, checkpointDir:str):
+        frontier = self.newFrontier()
+        frontier.restoreFromCheckpointState(state, checkpointDir)
+        return frontier
+
+    def close(self):
+        shutil.rmtree(self._spillDir, ignore_errors=True)
+
+    def getStatsString(self) -> str:
+        return (f"Frontier: {self._budget.numResidentResources} resources in memory "
+                f"of a budget of {self._maxResidentResources}")
@@ -1,20 +1,50 @@
 import datetime
 import logging
+import time
 import WebAccesser
-from reppy import Robots
-from collections import deque
+import utils
+import sys
+from SeenStore import SeenStore, ExactSeenStore
+from Frontier import FrontierFactory, PackedFrontier
+from RobotsCache import RobotsCache
 
 class HostInfo():
+
+    #A worker may keep millions of hosts, most of them with nothing to crawl, so they keep no __dict__
+    __slots__ = ('_resourcesQueue', '_robotsCache', '_robotsEntry', '_hostNameWithSchema', '_numCrawledResources',
+                 '_nextRequestAllowedTime', '_delaySeconds', '_retryAfterTime')
     
     AGENTNAME = '*'
     MAXNUMINNERSITEMAPSCRAWLABLE = 5
 
-    def __init__(self, hostWithSchema):
-        self._resourcesQueue = deque()
-        self._robots = None
-        self._couldNotAccessRobots = False
-        self._hostNameWithSchema = hostWithSchema
-        self._crawledResources = set()
+    #The delay between requests to a host adapts to how it answers, but is never below the one of its robots.
+    #It starts here and goes down by a step on every fast successful response
+    INITIAL_DELAY_SECONDS = 0.1
+    MIN_DELAY_SECONDS = 0.05
+    DELAY_DECREASE_SECONDS = 0.01
+    #Not less than this many times the time the host took to answer, so slow hosts get more time
+    LATENCY_DELAY_FACTOR = 2
+    #Doubled on timeouts, 429 and 5xx
+    DELAY_BACKOFF_FACTOR = 2
+    MAX_DELAY_SECONDS = 60
+    MAX_RETRY_AFTER_SECONDS = 600
+    MAX_ROBOTS_DELAY_SECONDS = 3
+
+    def __init__(self, hostWithSchema, resourcesQueue = None, robotsCache:RobotsCache = None):
+        #A PackedFrontier or anything with the interface of a deque, like a SpillingFrontier
+        self._resourcesQueue = PackedFrontier() if resourcesQueue == None else resourcesQueue
+        #Shared by every host of the process. The entry of this host may expire
+        self._robotsCache = RobotsCache() if robotsCache == None else robotsCache
+        self._robotsEntry = None
+        #The same string as the one of every Url of the host and of the schedulers
+        self._hostNameWithSchema = sys.intern(hostWithSchema)
+        #Which resources were already seen is kept by the SeenStore of the HostsInfo
+        self._numCrawledResources = 0
+        #On time.monotonic(). A host that was never requested may be requested right away
+        self._nextRequestAllowedTime = 0.0
+        self._delaySeconds = HostInfo.INITIAL_DELAY_SECONDS
+        #Until when the host asked, with a Retry-After, not to be requested
+        self._retryAfterTime = 0.0
     
     @property
     def hostNameWithSchema(self):
@@ -24,6 +54,14 @@ class HostInfo():
     def hostNameWithSchema(self, newHostName):
         raise AttributeError("hostNameWithSchema is not directly writable")
     
+    @property
+    def nextRequestAllowedTime(self) -> float:
+        return self._nextRequestAllowedTime
+    
+    @nextRequestAllowedTime.setter
+    def nextRequestAllowedTime(self, newNextRequestAllowedTime):
+        raise AttributeError("nextRequestAllowedTime is not directly writable")
+    
     @property
     def crawledResources(self):
         raise AttributeError("crawledResources is not directly readable")
@@ -33,12 +71,12 @@ class HostInfo():
         raise AttributeError("crawledResources is not directly writable")
     
     @property
-    def couldNotAccessRobots(self):
-        raise AttributeError("couldNotAccessRobots is not directly readable")
+    def robotsCache(self):
+        raise AttributeError("robotsCache is not directly readable")
     
-    @couldNotAccessRobots.setter
-    def couldNotAccessRobots(self, newHostName):
-        raise AttributeError("couldNotAccessRobots is not directly writable")
+    @robotsCache.setter
+    def robotsCache(self, newRobotsCache):
+        raise AttributeError("robotsCache is not directly writable")
     
     @property
     def resourcesQueue(self):
@@ -70,86 +108,156 @@ class HostInfo():
     
     def emptyOfResources(self) -> bool:
         return len(self._resourcesQueue) == 0
+    
+    def numResources(self) -> int:
+        return len(self._resourcesQueue)
+    
+    def takeResourcesOf(self, otherHostInfo):
+        """
+        Moves the resources and crawled count of another HostInfo of the same host into this one
+        """
+        while not otherHostInfo.emptyOfResources():
+            self.addResource(otherHostInfo.getNextResource())
+        self._numCrawledResources += otherHostInfo.getCrawledResourcesNum()
+        self._nextRequestAllowedTime = max(self._nextRequestAllowedTime, otherHostInfo.nextRequestAllowedTime)
+        self._delaySeconds = max(self._delaySeconds, otherHostInfo._delaySeconds)
+        self._retryAfterTime = max(self._retryAfterTime, otherHostInfo._retryAfterTime)
 
     def hasRobots(self) -> bool:
-        if self._couldNotAccessRobots:
-            return True
-        
-        if self._robots == None:
+        """Whether the robots were accessed, or found not accessible, and have not expired"""
+        if self._robotsEntry == None:
             return False
         else:
-            return True
+            return not self._robotsEntry.hasExpired()
     
     def canAccessPage(self, completePageLink:str) -> bool:
-        if self._couldNotAccessRobots:
+        #The robots are accessed before the first request to the host, never here
+        if self._robotsEntry == None:
             return True
-        
-        if self._robots == None:
-            self.tryFirstAccessToRobots()
-        
-            if self._robots == None:
-                return True
 
-        return self._robots.allowed(completePageLink, HostInfo.AGENTNAME)
+        return self._robotsEntry.allowed(completePageLink)
     
     def requestDelaySeconds(self) -> float:
-        MIN_DELAY_TIME_SECONDS = 0.1
-        MAX_DELAY_TIME_SECONDS = 3
+        return max(self._delaySeconds, self.robotsDelaySeconds())
 
-        if self._couldNotAccessRobots:
-            return MIN_DELAY_TIME_SECONDS
-        elif self._robots == None:
-            self.tryFirstAccessToRobots()
-        
-        if self._robots == None:
-            return MIN_DELAY_TIME_SECONDS
+    def robotsDelaySeconds(self) -> float:
+        if self._robotsEntry == None:
+            return 0.0
         else:  
-            hostMinDelay = self._robots.agent(HostInfo.AGENTNAME).delay
+            hostMinDelay = self._robotsEntry.delaySeconds()
         
             if hostMinDelay == None:
-                return MIN_DELAY_TIME_SECONDS
-            elif hostMinDelay > MAX_DELAY_TIME_SECONDS:
-                return MAX_DELAY_TIME_SECONDS
+                return 0.0
+            elif hostMinDelay > HostInfo.MAX_ROBOTS_DELAY_SECONDS:
+                return HostInfo.MAX_ROBOTS_DELAY_SECONDS
             else: 
                 return hostMinDelay
 
-    def tryFirstAccessToRobots(self, webAccess:WebAccesser.WebAccesser = None):
+    def adaptDelayToResponse(self, status:int, latencySeconds:float, retryAfterSeconds:float = None):
+        """
+        Faster after a successful response that took little time, slower after a 429 or a 5xx.
+        Must be called before markRequestMade, so the next request already waits the new delay
+        """
+        if status == 429 or status >= 500:
+            self._backOff()
+        else:
+            latencyDelay = HostInfo.LATENCY_DELAY_FACTOR * latencySeconds
+            if status >= 200 and status < 300:
+                self._delaySeconds = max(HostInfo.MIN_DELAY_SECONDS, latencyDelay,
+                                            self._delaySeconds - HostInfo.DELAY_DECREASE_SECONDS)
+            else:
+                self._delaySeconds = max(self._delaySeconds, latencyDelay)
+            self._delaySeconds = min(HostInfo.MAX_DELAY_SECONDS, self._delaySeconds)
+
+        if retryAfterSeconds != None:
+            retryAfterSeconds = min(HostInfo.MAX_RETRY_AFTER_SECONDS, max(0.0, retryAfterSeconds))
+            self._retryAfterTime = time.monotonic() + retryAfterSeconds
+
+    def adaptDelayToFailure(self, timedOut:bool):
+        """Slower after a timeout. Other failures, like a refused connection, keep the delay"""
+        if timedOut:
+            self._backOff()
+
+    def _backOff(self):
+        self._delaySeconds = min(HostInfo.MAX_DELAY_SECONDS, self._delaySeconds * HostInfo.DELAY_BACKOFF_FACTOR)
+
+    def tryFirstAccessToRobots(self, webAccess:WebAccesser.WebAccesser = None) -> bool:
+        """
+        Returns whether the robots were requested to the host, since they were not on the cache
+        """
+        if self.tryRobotsFromCache():
+            return False
+
         if webAccess == None:
             webAccess = WebAccesser.WebAccesser()
         
-        self._robots = webAccess.getRobotsOf(self._hostNameWithSchema)
-        if self._robots == None:
-            self._couldNotAccessRobots = True
+        self.setRobotsContent(webAccess.getRobotsContentOf(self._hostNameWithSchema))
+        return True
+    
+    def tryRobotsFromCache(self) -> bool:
+        """
+        Takes the robots of the host from the cache. Returns whether they were there
+        """
+        self._robotsEntry = self._robotsCache.getEntry(self._hostNameWithSchema)
+        return self._robotsEntry != None
+    
+    def setRobotsContent(self, robotsUrlAndContent:tuple):
+        """
+        Sets the robots of the host, already fetched by the caller.
+        None means the robots could not be accessed
+        """
+        self._robotsEntry = self._robotsCache.putContent(self._hostNameWithSchema, robotsUrlAndContent)
 
     def nextRequestAllowedTimestampFromNow(self):
         now = datetime.datetime.now()
-        minDelay = self.requestDelaySeconds()
+        minDelay = max(self.requestDelaySeconds(), self._retryAfterTime - time.monotonic())
         delay = datetime.timedelta(seconds=minDelay)
         nextAllowedTime = now + delay
         nextAllowedReqTimestamp = datetime.datetime.timestamp(nextAllowedTime)
         return nextAllowedReqTimestamp
 
+    def markRequestMade(self):
+        self._nextRequestAllowedTime = max(time.monotonic() + self.requestDelaySeconds(), self._retryAfterTime)
+
     def getRequestsString(self) -> str:
         return str(self._resourcesQueue)
     
     def markResourceAsCrawled(self, resource:str):
-        self._crawledResources.add(resource)
-    
-    def dismarkResourceAsCrawled(self, resource:str):
-        self._crawledResources.discard(resource)
-    
-    def alreadyCrawledResource(self, resource: str) -> bool:
-        return resource in self._crawledResources
-    
-    def getCrawledResourcesString(self):
-        return str(self._crawledResources)
+        self._numCrawledResources += 1
     
     def getCrawledResourcesNum(self):
-        return len(self._crawledResources)
+        return self._numCrawledResources
+    
+    def getCheckpointState(self, frontierFactory:FrontierFactory, checkpointDir:str) -> dict:
+        return {'hostNameWithSchema': self._hostNameWithSchema,
+                'resources': frontierFactory.getFrontierCheckpointState(self._resourcesQueue, checkpointDir),
+                'robotsUrlAndContent': None if self._robotsEntry == None else self._robotsEntry.robotsUrlAndContent,
+                'couldNotAccessRobots': self._robotsEntry != None and self._robotsEntry.isNegative(),
+                'numCrawledResources': self._numCrawledResources,
+                'delaySeconds': self._delaySeconds}
+    
+    @staticmethod
+    def fromCheckpointState(state:dict, frontierFactory:FrontierFactory, checkpointDir:str,
+                            robotsCache:RobotsCache = None):
+        hostInfo = HostInfo(state['hostNameWithSchema'], frontierFactory.restoreFrontier(state['resources'], checkpointDir),
+                            robotsCache)
+        hostInfo._numCrawledResources = state['numCrawledResources']
+        hostInfo._delaySeconds = state.get('delaySeconds', HostInfo.INITIAL_DELAY_SECONDS)
+
+        if state['couldNotAccessRobots'] or state['robotsUrlAndContent'] != None:
+            hostInfo._robotsEntry = hostInfo._robotsCache.restoreEntry(hostInfo.hostNameWithSchema,
+                                                                        state['robotsUrlAndContent'])
+        
+        return hostInfo
 
 class HostsInfo():
-    def __init__ (self):
+    def __init__ (self, seenStore:SeenStore = None, frontierFactory:FrontierFactory = None,
+                    robotsCache:RobotsCache = None):
         self._hosts = dict()
+        #May be shared with other HostsInfo
+        self._seenStore = ExactSeenStore() if seenStore == None else seenStore
+        self._frontierFactory = FrontierFactory() if frontierFactory == None else frontierFactory
+        self._robotsCache = RobotsCache() if robotsCache == None else robotsCache
     
     @property
     def hosts(self):
@@ -160,24 +268,42 @@ class HostsInfo():
         raise AttributeError("hosts is not writable")
     
     def hostExists(self, host:str) -> bool:
-        return host in list(self._hosts.keys())
+        return host in self._hosts
     
     def getHostInfo(self, host:str) -> HostInfo:
-        if self.hostExists(host):
-            return self._hosts[host]
-        return None
+        return self._hosts.get(host)
     
     def createInfoForHostIfNotExists(self, host:str):
         if not self.hostExists(host):
-            self._hosts[host] = HostInfo(host)
+            hostInfo = HostInfo(host, self._frontierFactory.newHostFrontier(), self._robotsCache)
+            self._hosts[hostInfo.hostNameWithSchema] = hostInfo
+    
+    def removeHostInfo(self, host:str) -> HostInfo:
+        """For when the host is given to another worker"""
+        return self._hosts.pop(host, None)
+    
+    def adoptHostInfo(self, hostInfo:HostInfo):
+        """
+        Takes the HostInfo given by another worker. Resources of the host that
+        arrived before it are kept
+        """
+        host = hostInfo.hostNameWithSchema
+        if self.hostExists(host):
+            hostInfo.takeResourcesOf(self._hosts[host])
+        self._hosts[host] = hostInfo
     
-    def getCrawledResourcesPerHostStr(self) -> str:
-        crawled = ""
-
-        for host, hostInfo in self._hosts.items():
-            crawled+=f"({host}):{hostInfo.getCrawledResourcesString()} "
-        
-        return crawled
+    def getNumResourcesPerHost(self) -> dict:
+        """Of the hosts with resources still to crawl"""
+        return {host: hostInfo.numResources() for host, hostInfo in self._hosts.items() if not hostInfo.emptyOfResources()}
+    
+    def getHostsNames(self) -> list:
+        return list(self._hosts.keys())
+    
+    def getTotalNumResources(self) -> int:
+        return sum([hostInfo.numResources() for _, hostInfo in self._hosts.items()])
+    
+    def getDelaySecondsPerHost(self) -> dict:
+        return {host: hostInfo.requestDelaySeconds() for host, hostInfo in self._hosts.items()}
     
     def getCrawledResourcesPerHostDict(self) -> str:
         crawled = dict()
@@ -188,10 +314,28 @@ class HostsInfo():
         return crawled
     
     def alreadyCrawled(self, host:str, resource:str) -> bool:
-        if self.hostExists(host):
-            return self.getHostInfo(host).alreadyCrawledResource(resource)
-        else:
-            return False
+        """
+        Whether the resource was already put on the queue of its host, crawled or not
+        """
+        return self._seenStore.contains(utils.getCompleteLinkFromHostAndResource(host, resource))
+    
+    def getSeenLinksOfHosts(self, hosts:set) -> list:
+        """None if the seen store cannot list them"""
+        return self._seenStore.getSeenLinksOfHosts(hosts)
+    
+    def markUrlAsSeen(self, url) -> bool:
+        """
+        Marks the Url as seen. Returns whether it was not seen before
+        """
+        return self._seenStore.addIfNotSeen(url.link)
+    
+    def getCheckpointState(self, checkpointDir:str) -> list:
+        return [hostInfo.getCheckpointState(self._frontierFactory, checkpointDir) for _, hostInfo in self._hosts.items()]
+    
+    def restoreFromCheckpointState(self, state:list, checkpointDir:str):
+        for hostState in state:
+            hostInfo = HostInfo.fromCheckpointState(hostState, self._frontierFactory, checkpointDir, self._robotsCache)
+            self._hosts[hostInfo.hostNameWithSchema] = hostInfo
     
     def getTotalNumCrawledResources(self):
         total = 0
@@ -0,0 +1,79 @@
+import heapq
+import time
+
+class HostsScheduler():
+    """
+    The hosts of a worker that have resources to crawl, ordered by the time each one may be requested next.
+    Times are of time.monotonic(), so they do not jump when the clock of the system is set
+    """
+
+    def __init__(self):
+        #(readyTime, insertion number, host). The number keeps hosts ready at the same time in insertion order
+        self._heap = list()
+        self._numInserted = 0
+        #Hosts on the heap, so a host is never on it twice
+        self._hostsOnHeap = set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, host:str) -> bool:
+        return host in self._hostsOnHeap
+
+    def isEmpty(self) -> bool:
+        return len(self._heap) == 0
+
+    def addHost(self, host:str, readyTime:float = 0.0) -> bool:
+        """
+        A host that was never requested is ready right away. Returns whether the host was added,
+        which it is not if it is already on the scheduler
+        """
+        if host in self._hostsOnHeap:
+            return False
+
+        self._hostsOnHeap.add(host)
+        heapq.heappush(self._heap, (readyTime, self._numInserted, host))
+        self._numInserted += 1
+        return True
+
+    def popReadyHost(self, now:float = None) -> str:
+        """
+        The host that has been ready for the longest, or None if no host may be requested yet
+        """
+        if len(self._heap) == 0:
+            return None
+
+        if now == None:
+            now = time.monotonic()
+
+        readyTime, _, host = self._heap[0]
+        if readyTime > now:
+            return None
+
+        heapq.heappop(self._heap)
+        self._hostsOnHeap.discard(host)
+        return host
+
+    def secondsUntilNextReady(self, now:float = None) -> float:
+        """
+        How long until some host may be requested. 0 if one already may, None if there is no host
+        """
+        if len(self._heap) == 0:
+            return None
+
+        if now == None:
+            now = time.monotonic()
+
+        return max(0.0, self._heap[0][0] - now)
+
+    def removeHosts(self, hosts:set):
+        if len(hosts & self._hostsOnHeap) == 0:
+            return
+
+        self._hostsOnHeap -= hosts
+        self._heap = [entry for entry in self._heap if entry[2] not in hosts]
+        heapq.heapify(self._heap)
+
+    def getHosts(self) -> list:
+        """In the order they become ready"""
+        return [host for _, _, host in sorted(self._heap)]
@@ -0,0 +1,271 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Event, Thread
+from collections import deque
+from bisect import bisect_left
+import logging
+import time
+import json
+
+class Histogram():
+    """
+    How many values fell on each bucket of fixed upper bounds, with their count, sum and max.
+    Percentiles are estimated as the upper bound of the bucket they fall on
+    """
+
+    LATENCY_BOUNDS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                              30.0, 60.0)
+    DEPTH_BOUNDS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+    def __init__(self, bounds:tuple):
+        self._bounds = bounds
+        #The last bucket is for values above every bound
+        self._bucketCounts = [0] * (len(bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = Lock()
+
+    def observe(self, value:float):
+        bucket = bisect_left(self._bounds, value)
+        self._lock.acquire()
+        self._bucketCounts[bucket] += 1
+        self._count += 1
+        self._sum += value
+        if value > self._max:
+            self._max = value
+        self._lock.release()
+
+    def getSnapshot(self) -> dict:
+        self._lock.acquire()
+        bucketCounts = list(self._bucketCounts)
+        count, valuesSum, maxValue = self._count, self._sum, self._max
+        self._lock.release()
+
+        return {'count': count, 'sum': valuesSum, 'mean': valuesSum / count if count > 0 else 0.0, 'max': maxValue,
+                'p50': self._percentileOf(bucketCounts, count, maxValue, 0.5),
+                'p90': self._percentileOf(bucketCounts, count, maxValue, 0.9),
+                'p99': self._percentileOf(bucketCounts, count, maxValue, 0.99),
+                'buckets': [[bound, bucketCount] for bound, bucketCount in zip(self._bounds, bucketCounts)]
+                            + [["+Inf", bucketCounts[-1]]]}
+
+    def _percentileOf(self, bucketCounts:list, count:int, maxValue:float, quantile:float) -> float:
+        if count == 0:
+            return 0.0
+
+        numBelow = 0
+        for bound, bucketCount in zip(self._bounds, bucketCounts):
+            numBelow += bucketCount
+            if numBelow >= quantile * count:
+                return min(bound, maxValue)
+        return maxValue
+
+class CrawlMetrics():
+    """
+    Counters and latency histograms of each stage a page goes through, shared by every worker of a Crawler.
+    Queue depths are taken from the gauge sources only when a snapshot is taken, so they cost nothing while crawling
+    """
+
+    ROBOTS = "robots"
+    HEAD = "head"
+    #The whole request, until the body was read, decoding included
+    GET = "get"
+    #Of the Content-Encoding of a compressed body and, of a page that is parsed, of its charset
+    DECODE = "decode"
+    #Of the links of a decoded page. On a ParsePool, from when it was submitted to when its links came back,
+    #less the decoding of its charset
+    PARSE = "parse"
+    NORMALIZE = "normalize"
+    #Of links to the inboxes of the workers that have their hosts
+    SEND = "send"
+    #What saving a record costs the worker, which is only queuing it with background writers
+    WARC = "warc"
+    #Waits for a host that could be requested, while having hosts to crawl
+    POLITENESS = "politeness"
+
+    STAGES = (ROBOTS, HEAD, GET, DECODE, PARSE, NORMALIZE, SEND, WARC, POLITENESS)
+
+    PAGES_SAVED = "pagesSaved"
+    REQUEST_ERRORS = "requestErrors"
+    LINKS_SENT = "linksSent"
+
+    #Recent pages per second are of about this window, between snapshots
+    RATE_WINDOW_SECONDS = 60
+
+    def __init__(self):
+        self._startTime = time.monotonic()
+        self._stages = {stage: Histogram(Histogram.LATENCY_BOUNDS_SECONDS) for stage in CrawlMetrics.STAGES}
+        #Resources left on the queue of a host each time one of them is requested
+        self._hostFrontierDepths = Histogram(Histogram.DEPTH_BOUNDS)
+        self._counters = {counterName: 0 for counterName in (CrawlMetrics.PAGES_SAVED, CrawlMetrics.REQUEST_ERRORS,
+                                                                CrawlMetrics.LINKS_SENT)}
+        self._countersLock = Lock()
+        #Functions that return a dict of gauge name to a value, or to a dict of worker id to a value
+        self._gaugesSources = list()
+
+        #(time.monotonic(), pages saved) of the snapshots of the last RATE_WINDOW_SECONDS
+        self._pagesSamples = deque([(self._startTime, 0)])
+        self._pagesSamplesLock = Lock()
+
+    def observeStage(self, stage:str, seconds:float):
+        self._stages[stage].observe(seconds)
+
+    def observeHostFrontierDepth(self, numResources:int):
+        self._hostFrontierDepths.observe(numResources)
+
+    def count(self, counterName:str, num:int = 1):
+        self._countersLock.acquire()
+        self._counters[counterName] = self._counters.get(counterName, 0) + num
+        self._countersLock.release()
+
+    def addGaugesSource(self, getGauges):
+        self._gaugesSources.append(getGauges)
+
+    def getSnapshot(self) -> dict:
+        now = time.monotonic()
+        self._countersLock.acquire()
+        counters = dict(self._counters)
+        self._countersLock.release()
+
+        numPages = counters[CrawlMetrics.PAGES_SAVED]
+        self._pagesSamplesLock.acquire()
+        while len(self._pagesSamples) > 1 and now - self._pagesSamples[1][0] >= CrawlMetrics.RATE_WINDOW_SECONDS:
+            self._pagesSamples.popleft()
+        oldestTime, oldestNumPages = self._pagesSamples[0]
+        self._pagesSamples.append((now, numPages))
+        self._pagesSamplesLock.release()
+
+        gauges = dict()
+        [gauges.update(getGauges()) for getGauges in self._gaugesSources]
+
+        uptimeSeconds = now - self._startTime
+        return {'timestamp': time.time(), 'uptimeSeconds': uptimeSeconds,
+                'pagesPerSecond': numPages / uptimeSeconds if uptimeSeconds > 0 else 0.0,
+                'recentPagesPerSecond': (numPages - oldestNumPages) / (now - oldestTime) if now > oldestTime else 0.0,
+                'counters': counters, 'gauges': gauges,
+                'stagesSeconds': {stage: histogram.getSnapshot() for stage, histogram in self._stages.items()},
+                'hostFrontierDepth': self._hostFrontierDepths.getSnapshot()}
+
+    @staticmethod
+    def formatSnapshotAsText(snapshot:dict) -> str:
+        """In the text format of Prometheus"""
+        lines = [f"crawler_uptime_seconds {snapshot['uptimeSeconds']}",
+                 f"crawler_pages_per_second {snapshot['pagesPerSecond']}",
+                 f"crawler_recent_pages_per_second {snapshot['recentPagesPerSecond']}"]
+        lines += [f"crawler_{counterName}_total {value}" for counterName, value in snapshot['counters'].items()]
+
+        for gaugeName, value in snapshot['gauges'].items():
+            if isinstance(value, dict):
+                lines += [f"crawler_{gaugeName}{{worker=\"{workerId}\"}} {workerValue}"
+                          for workerId, workerValue in value.items()]
+            else:
+                lines.append(f"crawler_{gaugeName} {value}")
+
+        histograms = [("crawler_stage_seconds", f"stage=\"{stage}\",", histogram)
+                      for stage, histogram in snapshot['stagesSeconds'].items()]
+        histograms.append(("crawler_host_frontier_depth", "", snapshot['hostFrontierDepth']))
+        for metricName, labels, histogram in histograms:
+            numBelow = 0
+            for bound, bucketCount in histogram['buckets']:
+                numBelow += bucketCount
+                lines.append(f"{metricName}_bucket{{{labels}le=\"{bound}\"}} {numBelow}")
+            sumAndCountLabels = f"{{{labels.rstrip(',')}}}" if labels != "" else ""
+            lines.append(f"{metricName}_sum{sumAndCountLabels} {histogram['sum']}")
+            lines.append(f"{metricName}_count{sumAndCountLabels} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    def getStatsString(self) -> str:
+        snapshot = self.getSnapshot()
+        stagesStrings = [f"{stage} {histogram['count']} times, mean {histogram['mean'] * 1000:.1f}ms, "
+                         f"p99 {histogram['p99'] * 1000:.1f}ms" for stage, histogram in snapshot['stagesSeconds'].items()
+                         if histogram['count'] > 0]
+        return (f"Metrics: {snapshot['pagesPerSecond']:.2f} pages/sec, {snapshot['counters']}. "
+                f"Stages: {'; '.join(stagesStrings)}")
+
+class MetricsReporter():
+    """
+    Appends a JSON snapshot of the CrawlMetrics to a file every interval, one per line, and serves the latest
+    ones over HTTP on localhost: /metrics in the text format of Prometheus and /metrics.json as JSON
+    """
+
+    INTERVAL_SECONDS = 10
+
+    def __init__(self, metrics:CrawlMetrics, filePath:str = None, port:int = None, intervalSeconds:float = None):
+        self._metrics = metrics
+        self._filePath = filePath
+        self._port = port
+        self._intervalSeconds = MetricsReporter.INTERVAL_SECONDS if intervalSeconds == None else intervalSeconds
+
+        self._stopEvent = Event()
+        self._writerThread = None
+        self._httpServer = None
+        self._httpThread = None
+
+    @property
+    def metrics(self) -> CrawlMetrics:
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, newMetrics):
+        raise AttributeError("metrics is not writable")
+
+    def start(self):
+        if self._filePath != None:
+            self._writerThread = Thread(target=self._writeSnapshotsPeriodically, name="MetricsWriter", daemon=True)
+            self._writerThread.start()
+
+        if self._port != None:
+            self._httpServer = ThreadingHTTPServer(("127.0.0.1", self._port), self._newRequestHandlerClass())
+            self._httpServer.daemon_threads = True
+            self._httpThread = Thread(target=self._httpServer.serve_forever, name="MetricsServer", daemon=True)
+            self._httpThread.start()
+            logging.info(f"Serving metrics on http://127.0.0.1:{self._httpServer.server_address[1]}/metrics")
+
+    def stop(self):
+        """The last snapshot is written when the crawl is over"""
+        self._stopEvent.set()
+        if self._writerThread != None:
+            self._writerThread.join()
+        if self._httpServer != None:
+            self._httpServer.shutdown()
+            self._httpServer.server_close()
+
+    def _writeSnapshotsPeriodically(self):
+        while not self._stopEvent.wait(self._intervalSeconds):
+            self._writeSnapshot()
+        self._writeSnapshot()
+
+    def _writeSnapshot(self):
+        try:
+            with open(self._filePath, 'a') as metricsFile:
+                metricsFile.write(json.dumps(self._metrics.getSnapshot()) + "\n")
+        except OSError as e:
+            logging.info(f"Could not write the metrics to {self._filePath}: {e}")
+
+    def _newRequestHandlerClass(self):
+        metrics = self._metrics
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path in ("/", "/metrics"):
+                    body = CrawlMetrics.formatSnapshotAsText(metrics.getSnapshot()).encode('utf-8')
+                    contentType = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body = json.dumps(metrics.getSnapshot()).encode('utf-8')
+                    contentType = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', contentType)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                #Scrapes are not logged with the pages
+                pass
+
+        return MetricsRequestHandler
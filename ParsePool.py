@@ -0,0 +1,99 @@
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+from Parser import HTMLParser, LinkExtractor, CharsetResolver
+import multiprocessing
+import logging
+import time
+
+def _extractAndFormatLinks(html:bytes, contentType:str, hostWithSchema:str) -> tuple:
+    """
+    Runs on a parser process. Returns the links of the page, already formatted with
+    its host, what resolved its charset, since the parser process counters are not seen,
+    and how long decoding its charset took
+    """
+    decodeStart = time.monotonic()
+    decodedHTML, resolvedBy = CharsetResolver.decodeAndGetResolvedBy(html, contentType)
+    decodeSeconds = time.monotonic() - decodeStart
+
+    linkExtractor = LinkExtractor()
+    linkExtractor.feed(decodedHTML)
+    linkExtractor.close()
+
+    return HTMLParser.formatUrlsWithHostIfNeeded(linkExtractor.hrefs, hostWithSchema), resolvedBy, decodeSeconds
+
+class ParsePool():
+    """
+    Parses pages on other processes, so the thread that fetched a page can go on fetching.
+    At most maxPendingParses pages wait to be parsed; past that, whoever submits a page
+    blocks until a parser is done with one
+    """
+
+    def __init__(self, numProcesses:int, maxPendingParses:int):
+        self._numProcesses = numProcesses
+        self._maxPendingParses = maxPendingParses
+
+        self._pendingParsesSlots = BoundedSemaphore(maxPendingParses)
+        self._numParsed = 0
+        self._numFailed = 0
+        self._numTimesFull = 0
+        #Submitted from every fetch thread and done on the threads of the pool
+        self._countersLock = Lock()
+
+        #The fetch threads may hold locks, so do not fork them
+        self._executor = ProcessPoolExecutor(max_workers=numProcesses,
+                                                mp_context=multiprocessing.get_context("spawn"))
+
+    @property
+    def numProcesses(self) -> int:
+        return self._numProcesses
+
+    @numProcesses.setter
+    def numProcesses(self, newNumProcesses):
+        raise AttributeError("numProcesses is not writable")
+
+    def submit(self, html:bytes, contentType:str, hostWithSchema:str, onLinksParsed):
+        """
+        onLinksParsed is called with the set of links found, or an empty one if parsing failed,
+        and the seconds decoding the charset of the page took on the parser process, on a thread of the pool
+        """
+        if not self._pendingParsesSlots.acquire(blocking=False):
+            self._countersLock.acquire()
+            self._numTimesFull += 1
+            self._countersLock.release()
+            self._pendingParsesSlots.acquire()
+
+        future = self._executor.submit(_extractAndFormatLinks, html, contentType, hostWithSchema)
+        future.add_done_callback(lambda doneFuture: self._onParseDone(doneFuture, onLinksParsed))
+
+    def _onParseDone(self, future, onLinksParsed):
+        self._pendingParsesSlots.release()
+
+        links = set()
+        decodeSeconds = 0.0
+        parsed = not future.cancelled() and future.exception() == None
+        if parsed:
+            links, resolvedBy, decodeSeconds = future.result()
+            CharsetResolver.countResolvedBy(resolvedBy)
+        elif not future.cancelled():
+            logging.info(f"Could not parse a page: {future.exception()}")
+
+        self._countersLock.acquire()
+        if parsed:
+            self._numParsed += 1
+        else:
+            self._numFailed += 1
+        self._countersLock.release()
+
+        onLinksParsed(links, decodeSeconds)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def getStatsString(self) -> str:
+        self._countersLock.acquire()
+        numParsed, numFailed, numTimesFull = self._numParsed, self._numFailed, self._numTimesFull
+        self._countersLock.release()
+
+        return (f"ParsePool: {self._numProcesses} processes, {numParsed} pages parsed, "
+                f"{numFailed} failed, full {numTimesFull} times "
+                f"(at most {self._maxPendingParses} pending)")
@@ -1,14 +1,127 @@
 from charset_normalizer import from_bytes
 from bs4 import BeautifulSoup
 from bs4.element import Comment
+from threading import Lock
+from Url import Url
+import html.parser
+import codecs
 import utils
+import re
+
+class CharsetResolver():
+    """
+    Decodes a page with the first charset that works of: the Content-Type header, a BOM,
+    a <meta> charset near the start and UTF-8. Only if none does, the charset is detected
+    by charset_normalizer, which has to go through the whole body
+    """
+
+    HEADER = "header"
+    BOM = "bom"
+    META = "meta"
+    UTF8 = "utf-8"
+    DETECTED = "detected"
+
+    META_SNIFF_BYTES = 4096
+    HEADER_CHARSET_REGEX = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.IGNORECASE)
+    META_CHARSET_REGEX = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+    BOMS = [(codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+            (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")]
+
+    _numPagesResolvedBy = {HEADER: 0, BOM: 0, META: 0, UTF8: 0, DETECTED: 0}
+    _numPagesResolvedByLock = Lock()
+
+    @staticmethod
+    def decode(html:bytes, contentType:str = None) -> str:
+        decodedHTML, resolvedBy = CharsetResolver.decodeAndGetResolvedBy(html, contentType)
+        CharsetResolver.countResolvedBy(resolvedBy)
+        return decodedHTML
+
+    @staticmethod
+    def decodeAndGetResolvedBy(html:bytes, contentType:str = None) -> tuple:
+        """
+        Returns the decoded html and what resolved its charset, without counting it
+        """
+        if contentType != None:
+            headerCharset = CharsetResolver.HEADER_CHARSET_REGEX.search(contentType)
+            if headerCharset != None:
+                decodedHTML = CharsetResolver._tryDecode(html, headerCharset.group(1))
+                if decodedHTML != None:
+                    return decodedHTML, CharsetResolver.HEADER
+
+        for bom, bomCharset in CharsetResolver.BOMS:
+            if html.startswith(bom):
+                decodedHTML = CharsetResolver._tryDecode(html, bomCharset)
+                if decodedHTML != None:
+                    return decodedHTML, CharsetResolver.BOM
+                break
+
+        metaCharset = CharsetResolver.META_CHARSET_REGEX.search(html[:CharsetResolver.META_SNIFF_BYTES])
+        if metaCharset != None:
+            decodedHTML = CharsetResolver._tryDecode(html, metaCharset.group(1).decode('ascii'))
+            if decodedHTML != None:
+                return decodedHTML, CharsetResolver.META
+
+        decodedHTML = CharsetResolver._tryDecode(html, "utf-8")
+        if decodedHTML != None:
+            return decodedHTML, CharsetResolver.UTF8
+
+        bestMatch = from_bytes(html).best()
+        decodedHTML = str(bestMatch) if bestMatch != None else html.decode('utf-8', errors='replace')
+        return decodedHTML, CharsetResolver.DETECTED
+
+    @staticmethod
+    def _tryDecode(html:bytes, charset:str) -> str:
+        """None if the charset is unknown or html is not valid on it"""
+        try:
+            return html.decode(charset)
+        except (LookupError, UnicodeDecodeError):
+            return None
+
+    @staticmethod
+    def countResolvedBy(resolvedBy:str):
+        CharsetResolver._numPagesResolvedByLock.acquire()
+        CharsetResolver._numPagesResolvedBy[resolvedBy] += 1
+        CharsetResolver._numPagesResolvedByLock.release()
+
+    @staticmethod
+    def getNumPagesResolvedBy() -> dict:
+        CharsetResolver._numPagesResolvedByLock.acquire()
+        numPagesResolvedBy = dict(CharsetResolver._numPagesResolvedBy)
+        CharsetResolver._numPagesResolvedByLock.release()
+        return numPagesResolvedBy
+
+    @staticmethod
+    def getStatsString() -> str:
+        numPagesResolvedBy = CharsetResolver.getNumPagesResolvedBy()
+        resolvedByString = ", ".join([f"{numPages} by {path}" for path, numPages in numPagesResolvedBy.items()])
+        return f"Charset of {sum(numPagesResolvedBy.values())} pages resolved: {resolvedByString}"
+
+class LinkExtractor(html.parser.HTMLParser):
+    """
+    Collects the hrefs of the anchors of a page as it is tokenized, without building a tree.
+    It uses the same tokenizer as BeautifulSoup's "html.parser", so it finds the same anchors
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = set()
+
+    def handle_starttag(self, tag:str, attrs:list):
+        if tag == "a":
+            #As BeautifulSoup, the last of repeated attributes wins
+            href = dict(attrs).get("href")
+            if href != None and href.strip() != "":
+                self.hrefs.add(href.split()[0])
 
 class HTMLParser():
     
     @staticmethod
-    def parseHTMLBytes(html:str) -> BeautifulSoup:
-        html = str(from_bytes(html).best())
-        return BeautifulSoup(html, features="html.parser")
+    def decodeHTMLBytes(html:bytes, contentType:str = None) -> str:
+        return CharsetResolver.decode(html, contentType)
+    
+    @staticmethod
+    def parseHTMLBytes(html:bytes, contentType:str = None) -> BeautifulSoup:
+        return BeautifulSoup(HTMLParser.decodeHTMLBytes(html, contentType), features="html.parser")
     
     @staticmethod
     def getAllLinksFromParsedHTML(parsedHTML:BeautifulSoup) -> set:
@@ -23,6 +136,38 @@ class HTMLParser():
         
         return urlsFound
     
+    @staticmethod
+    def extractLinksFromHTMLBytes(html:bytes, contentType:str = None) -> LinkExtractor:
+        """
+        The same links getAllLinksFromParsedHTML finds, without building the tree
+        """
+        linkExtractor = LinkExtractor()
+        linkExtractor.feed(HTMLParser.decodeHTMLBytes(html, contentType))
+        linkExtractor.close()
+        return linkExtractor
+    
+    @staticmethod
+    def getLinksAndParsedHTML(html:bytes, buildTree:bool, contentType:str = None) -> tuple:
+        """
+        Returns the links of the page and its tree. The tree is only built if buildTree,
+        otherwise it is None
+        """
+        return HTMLParser.getLinksAndParsedHTMLOfText(HTMLParser.decodeHTMLBytes(html, contentType), buildTree)
+    
+    @staticmethod
+    def getLinksAndParsedHTMLOfText(decodedHTML:str, buildTree:bool) -> tuple:
+        """
+        As getLinksAndParsedHTML, of a page whose charset was already decoded
+        """
+        if buildTree:
+            parsedHTML = BeautifulSoup(decodedHTML, features="html.parser")
+            return HTMLParser.getAllLinksFromParsedHTML(parsedHTML), parsedHTML
+        
+        linkExtractor = LinkExtractor()
+        linkExtractor.feed(decodedHTML)
+        linkExtractor.close()
+        return linkExtractor.hrefs, None
+    
     @staticmethod
     def formatUrlsWithHostIfNeeded(urls, host:str) -> set:
         formatedUrls = set()
@@ -41,7 +186,7 @@ class HTMLParser():
                         formatedUrl = url
 
                     if(formatedUrl != ""):
-                        formatedUrls.add(utils.normalizeLinkIfCan(formatedUrl))
+                        formatedUrls.add(Url.fromLink(formatedUrl))
         
         return formatedUrls
 
@@ -0,0 +1,89 @@
+from DnsCache import DnsCache
+from threading import Lock
+import time
+import utils
+
+class PolitenessGroups():
+    """
+    Hosts that are probably on the same server, by their address or by the domain they were registered under.
+    Only one host of a group is requested at a time and the next one waits the delay of the last,
+    even when they are on different workers. Grouping by host keeps the delay of each host only
+    """
+
+    BY_HOST = "host"
+    BY_IP = "ip"
+    BY_DOMAIN = "domain"
+
+    #When another host of the group is being requested, how long until it is tried again
+    IN_FLIGHT_RETRY_SECONDS = 0.1
+
+    def __init__(self, groupBy:str = None, dnsCache:DnsCache = None):
+        self._groupBy = PolitenessGroups.BY_HOST if groupBy == None else groupBy
+        self._dnsCache = DnsCache() if dnsCache == None else dnsCache
+
+        #Group -> time.monotonic() its next request is allowed, or None while one of its hosts is requested
+        self._groupsNextRequestTime = dict()
+        self._lock = Lock()
+
+        self._numRequests = 0
+        self._numDeferred = 0
+
+    @property
+    def groupBy(self) -> str:
+        return self._groupBy
+
+    @groupBy.setter
+    def groupBy(self, newGroupBy):
+        raise AttributeError("groupBy is not writable")
+
+    def groupOf(self, hostWithSchema:str) -> str:
+        """
+        None when hosts are not grouped. A host that can not be resolved is a group of its own
+        """
+        if self._groupBy == PolitenessGroups.BY_HOST:
+            return None
+
+        hostName = utils.getHostNameOfHostWithSchema(hostWithSchema)
+        if self._groupBy == PolitenessGroups.BY_DOMAIN:
+            return utils.registeredDomainOf(hostName)
+
+        ip = self._dnsCache.getIpOf(hostName)
+        return hostName if ip == None else ip
+
+    def tryToStartRequest(self, group:str) -> float:
+        """
+        Returns None if a host of the group may be requested now, and then finishRequest must be called.
+        Otherwise, the time.monotonic() at which it should be tried again
+        """
+        if group == None:
+            return None
+
+        now = time.monotonic()
+        self._lock.acquire()
+        nextRequestTime = self._groupsNextRequestTime.get(group, 0.0)
+        if nextRequestTime != None and nextRequestTime <= now:
+            self._groupsNextRequestTime[group] = None
+            self._numRequests += 1
+            retryTime = None
+        else:
+            self._numDeferred += 1
+            retryTime = now + PolitenessGroups.IN_FLIGHT_RETRY_SECONDS if nextRequestTime == None else nextRequestTime
+        self._lock.release()
+
+        return retryTime
+
+    def finishRequest(self, group:str, delaySeconds:float):
+        if group == None:
+            return
+
+        self._lock.acquire()
+        self._groupsNextRequestTime[group] = time.monotonic() + delaySeconds
+        self._lock.release()
+
+    def getStatsString(self) -> str:
+        if self._groupBy == PolitenessGroups.BY_HOST:
+            return "PolitenessGroups: hosts are not grouped"
+
+        return (f"PolitenessGroups: by {self._groupBy}, {len(self._groupsNextRequestTime)} groups, "
+                f"{self._numRequests} requests, {self._numDeferred} deferred because another host "
+                f"of their group was requested too recently")
@@ -0,0 +1,356 @@
+from Crawler import Crawler
+from RobotsCache import RobotsCache
+import SeenStore
+import Frontier
+import multiprocessing
+import threading
+import logging
+import queue
+import utils
+
+class ProcessLinkExchange():
+    """
+    Exchanges links between Crawler processes. Each process owns the hosts
+    given by utils.processOfHost and receives the links of its hosts on its own queue.
+
+    It also does the global accounting: the number of pages crawled by every process
+    and the detection of when every process is idle with no links in flight
+    """
+
+    RECEIVE_TIMEOUT_SECONDS = 0.5
+
+    def __init__(self, processId:int, sharedState:dict):
+        self._processId = processId
+        self._inboxes = sharedState['inboxes']
+        self._numProcesses = len(self._inboxes)
+
+        self._lock = sharedState['lock']
+        self._numBatchesSent = sharedState['numBatchesSent']
+        self._numBatchesReceived = sharedState['numBatchesReceived']
+        self._numIdleProcesses = sharedState['numIdleProcesses']
+        self._numPagesCrawled = sharedState['numPagesCrawled']
+        self._maxNumPagesToCrawl = sharedState['maxNumPagesToCrawl']
+        self._globalDoneEvent = sharedState['globalDoneEvent']
+
+        #Only touched by this process, always under self._lock
+        self._locallyIdle = False
+        self._deliveriesInProgress = 0
+
+        self._receiverThread = None
+        self._stopReceiving = threading.Event()
+
+    @staticmethod
+    def createSharedState(context, numProcesses:int, maxNumPagesToCrawl:int) -> dict:
+        """
+        Creates the primitives shared by every process. They must be created by the parent
+        """
+        return {
+            'inboxes': [context.Queue() for _ in range(numProcesses)],
+            'lock': context.Lock(),
+            'numBatchesSent': context.Value('q', 0, lock=False),
+            'numBatchesReceived': context.Value('q', 0, lock=False),
+            'numIdleProcesses': context.Value('i', 0, lock=False),
+            'numPagesCrawled': context.Value('q', 0, lock=False),
+            'maxNumPagesToCrawl': maxNumPagesToCrawl,
+            'globalDoneEvent': context.Event()
+        }
+
+    @property
+    def processId(self) -> int:
+        return self._processId
+
+    @processId.setter
+    def processId(self, newProcessId):
+        raise AttributeError("processId is not writable")
+
+    @property
+    def numProcesses(self) -> int:
+        return self._numProcesses
+
+    @numProcesses.setter
+    def numProcesses(self, newNumProcesses):
+        raise AttributeError("numProcesses is not writable")
+
+    @property
+    def assignmentVersion(self) -> int:
+        """Hosts never change process"""
+        return 0
+
+    @assignmentVersion.setter
+    def assignmentVersion(self, newAssignmentVersion):
+        raise AttributeError("assignmentVersion is not writable")
+
+    @property
+    def globalPagesCrawled(self) -> int:
+        return self._numPagesCrawled.value
+
+    @globalPagesCrawled.setter
+    def globalPagesCrawled(self, newValue):
+        raise AttributeError("globalPagesCrawled is not writable")
+
+    def processOfHost(self, hostWithSchema:str) -> int:
+        return utils.processOfHost(self._numProcesses, hostWithSchema)
+
+    def isLocalHost(self, hostWithSchema:str) -> bool:
+        return self.processOfHost(hostWithSchema) == self._processId
+
+    def sendLinks(self, processId:int, links:list):
+        self._lock.acquire()
+        self._numBatchesSent.value += 1
+        self._lock.release()
+
+        self._inboxes[processId].put(links)
+
+    def addPageAndReturnIfLimitReached(self) -> bool:
+        self._lock.acquire()
+        self._numPagesCrawled.value += 1
+        limitReached = self._numPagesCrawled.value > self._maxNumPagesToCrawl
+        self._lock.release()
+
+        if limitReached:
+            self._globalDoneEvent.set()
+
+        return limitReached
+
+    def pagesLimitReached(self) -> bool:
+        return self._numPagesCrawled.value > self._maxNumPagesToCrawl
+
+    def notifyLocallyIdle(self) -> bool:
+        """
+        Called when every worker of this process is waiting with no links to receive.
+        Returns whether every process is done
+        """
+        self._lock.acquire()
+        if self._deliveriesInProgress == 0 and not self._locallyIdle:
+            self._locallyIdle = True
+            self._numIdleProcesses.value += 1
+
+        everyProcessIdle = self._numIdleProcesses.value == self._numProcesses
+        noBatchInFlight = self._numBatchesSent.value == self._numBatchesReceived.value
+        self._lock.release()
+
+        if everyProcessIdle and noBatchInFlight:
+            self._globalDoneEvent.set()
+
+        return self.allDone()
+
+    def allDone(self) -> bool:
+        return self._globalDoneEvent.is_set()
+
+    def startReceiving(self, workersPipeline):
+        self._receiverThread = threading.Thread(target=self._receiveLinks, args=(workersPipeline,))
+        self._receiverThread.start()
+
+    def stopReceiving(self):
+        self._stopReceiving.set()
+        if self._receiverThread != None:
+            self._receiverThread.join()
+
+        #Links still queued will never be read, so do not wait for them to be flushed on exit
+        for inbox in self._inboxes:
+            inbox.cancel_join_thread()
+
+    def _receiveLinks(self, workersPipeline):
+        myInbox = self._inboxes[self._processId]
+
+        while not self._stopReceiving.is_set():
+            if self.allDone():
+                workersPipeline.finishAllWorkers()
+                return
+
+            try:
+                links = myInbox.get(timeout=ProcessLinkExchange.RECEIVE_TIMEOUT_SECONDS)
+            except queue.Empty:
+                continue
+
+            self._beginDelivery()
+            workersPipeline.deliverLinksToProperWorkers(links)
+            self._endDelivery()
+
+            workersPipeline.checkIfShouldStop()
+
+    def _beginDelivery(self):
+        self._lock.acquire()
+        if self._locallyIdle:
+            self._locallyIdle = False
+            self._numIdleProcesses.value -= 1
+        self._deliveriesInProgress += 1
+        self._lock.release()
+
+    def _endDelivery(self):
+        self._lock.acquire()
+        self._numBatchesReceived.value += 1
+        self._deliveriesInProgress -= 1
+        self._lock.release()
+
+def _runCrawlerProcess(processId:int, sharedState:dict, numWorkers:int, debugMode:bool,
+                        seenStoreConfig:dict, maxResidentResources:int, robotsCacheFilePath:str,
+                        singleGET:bool, seedsFilePath:str, resultsQueue):
+
+    logging.basicConfig(level=logging.INFO, format='%(process)d-%(thread)d-%(threadName)s-%(levelname)s-%(message)s',
+    filename=f"log_p{processId}.log", filemode="w")
+
+    #The parent waits for a result of every process, so one is always sent, with the error if it failed
+    try:
+        pagesCrawled, resourcesPerHost = _crawlOnProcess(processId, sharedState, numWorkers, debugMode, seenStoreConfig,
+                                                            maxResidentResources, robotsCacheFilePath, singleGET,
+                                                            seedsFilePath)
+    except Exception as e:
+        logging.exception(f"Process {processId} failed")
+        resultsQueue.put((processId, 0, dict(), repr(e)))
+    else:
+        resultsQueue.put((processId, pagesCrawled, resourcesPerHost, None))
+
+def _crawlOnProcess(processId:int, sharedState:dict, numWorkers:int, debugMode:bool, seenStoreConfig:dict,
+                    maxResidentResources:int, robotsCacheFilePath:str, singleGET:bool, seedsFilePath:str) -> tuple:
+    #Hosts are disjoint between processes, so each one only needs to remember its own urls
+    seenStore = SeenStore.createSeenStore(seenStoreConfig['kind'], seenStoreConfig['expectedNumUrls'],
+                                            seenStoreConfig['falsePositiveRate'],
+                                            f"{seenStoreConfig['filePath']}.p{processId}",
+                                            seenStoreConfig['reuseFile'])
+
+    frontierFactory = None
+    if maxResidentResources > 0:
+        frontierFactory = Frontier.SpillingFrontierFactory(f"frontier_spill_p{processId}", maxResidentResources)
+
+    #The hosts of a process are the same on every run with the same number of processes
+    robotsCache = RobotsCache(f"{robotsCacheFilePath}.p{processId}")
+
+    linkExchange = ProcessLinkExchange(processId, sharedState)
+    myCrawler = Crawler(sharedState['maxNumPagesToCrawl'], numWorkers, debugMode,
+                        linkExchange=linkExchange, warcPreName=f"results_p{processId}_", seenStore=seenStore,
+                        frontierFactory=frontierFactory, robotsCache=robotsCache, singleGET=singleGET)
+
+    myCrawler.startCrawlingFromSeedsFile(seedsFilePath)
+    return myCrawler.pagesCrawled, myCrawler.getResourcesNumPerHost()
+
+class ProcessCrawler():
+    """
+    Runs one Crawler per process, each one owning a disjoint set of hosts.
+    Every process writes its own WARC files and the per host counts are merged at the end.
+    If a process fails, the others are stopped and what they crawled is still merged
+    """
+
+    #How often the processes are checked for one that died without sending its result
+    RESULTS_POLL_SECONDS = 1.0
+
+    def __init__(self, pagesCrawledLimit:int, numProcesses:int, numWorkersPerProcess:int = 1,
+                    debugMode:bool = False, seenStoreConfig:dict = None, maxResidentResourcesPerProcess:int = 0,
+                    robotsCacheFilePath:str = "robots.cache", singleGET:bool = True):
+        self._pagesLimit = pagesCrawledLimit
+        self._numProcesses = numProcesses
+        self._numWorkersPerProcess = numWorkersPerProcess
+        self._debugMode = debugMode
+
+        #If positive, each process spills the frontier that does not fit on this budget to disk
+        self._maxResidentResourcesPerProcess = maxResidentResourcesPerProcess
+
+        #How each process builds its SeenStore
+        self._seenStoreConfig = seenStoreConfig
+        if self._seenStoreConfig == None:
+            self._seenStoreConfig = {'kind': "exact", 'expectedNumUrls': 0, 'falsePositiveRate': 0.0,
+                                        'filePath': "seen.bloom", 'reuseFile': False}
+
+        #Each process keeps the robots of its hosts on its own file
+        self._robotsCacheFilePath = robotsCacheFilePath
+        self._singleGET = singleGET
+
+        self._pagesCrawled = 0
+        self._resourcesPerHost = dict()
+        self._failedProcessIds = list()
+
+    @property
+    def pagesLimit(self):
+        """The maximum number of pages that can be crawled"""
+        return self._pagesLimit
+
+    @pagesLimit.setter
+    def pagesLimit(self, newPagesLimit):
+        self._pagesLimit = newPagesLimit
+
+    @property
+    def pagesCrawled(self) -> int:
+        """The number of pages crawled by every process"""
+        return self._pagesCrawled
+
+    @pagesCrawled.setter
+    def pagesCrawled(self, newValue):
+        raise AttributeError("pagesCrawled is not writable")
+
+    @property
+    def numProcesses(self) -> int:
+        return self._numProcesses
+
+    @numProcesses.setter
+    def numProcesses(self, newNumProcesses):
+        raise AttributeError("numProcesses is read-only")
+
+    @property
+    def failedProcessIds(self) -> list:
+        """The processes that raised an error or died, whose hosts were left uncrawled"""
+        return list(self._failedProcessIds)
+
+    @failedProcessIds.setter
+    def failedProcessIds(self, newFailedProcessIds):
+        raise AttributeError("failedProcessIds is read-only")
+
+    def startCrawlingFromSeedsFile(self, seedsFilePath: str):
+        #Fail here instead of inside every process
+        open(seedsFilePath, 'r').close()
+
+        #Workers are threads, so do not fork a process that may hold their locks
+        context = multiprocessing.get_context("spawn")
+        sharedState = ProcessLinkExchange.createSharedState(context, self._numProcesses, self._pagesLimit)
+        resultsQueue = context.Queue()
+
+        processes = list()
+        for processId in range(self._numProcesses):
+            newProcess = context.Process(target=_runCrawlerProcess,
+                                            args=(processId, sharedState, self._numWorkersPerProcess,
+                                                    self._debugMode, self._seenStoreConfig,
+                                                    self._maxResidentResourcesPerProcess,
+                                                    self._robotsCacheFilePath, self._singleGET,
+                                                    seedsFilePath, resultsQueue))
+            processes.append(newProcess)
+            newProcess.start()
+
+        processesLeft = set(range(self._numProcesses))
+        while len(processesLeft) > 0:
+            try:
+                processId, pagesCrawled, resourcesPerHost, error = resultsQueue.get(
+                    timeout=ProcessCrawler.RESULTS_POLL_SECONDS)
+            except queue.Empty:
+                #A process that sent its result exits with 0, and the result is on the queue before it exits
+                deadProcessIds = [processId for processId in processesLeft
+                                    if processes[processId].exitcode not in (None, 0)]
+                for processId in deadProcessIds:
+                    processesLeft.discard(processId)
+                    self._onProcessFailed(processId, f"exit code {processes[processId].exitcode}",
+                                            sharedState)
+                continue
+
+            processesLeft.discard(processId)
+            if error != None:
+                self._onProcessFailed(processId, error, sharedState)
+            else:
+                logging.info(f"Process {processId} crawled {pagesCrawled} pages")
+            self._pagesCrawled += pagesCrawled
+            self._mergeResourcesPerHost(resourcesPerHost)
+
+        [process.join() for process in processes]
+        if len(self._failedProcessIds) > 0:
+            logging.info(f"The hosts of processes {sorted(self._failedProcessIds)} of {self._numProcesses} "
+                            f"were left uncrawled, since they failed")
+
+    def _onProcessFailed(self, processId:int, error:str, sharedState:dict):
+        """The process never reports being idle again, so the others are stopped instead of waiting for it"""
+        logging.info(f"Process {processId} failed ({error}). Stopping the other processes")
+        self._failedProcessIds.append(processId)
+        sharedState['globalDoneEvent'].set()
+
+    def _mergeResourcesPerHost(self, resourcesPerHost:dict):
+        for host, numResources in resourcesPerHost.items():
+            self._resourcesPerHost[host] = self._resourcesPerHost.get(host, 0) + numResources
+
+    def getResourcesNumPerHost(self) -> dict:
+        return self._resourcesPerHost
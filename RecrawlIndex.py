@@ -0,0 +1,137 @@
+from warcio.archiveiterator import ArchiveIterator
+from warcio.utils import Digester
+from threading import Lock
+import logging
+import pickle
+import glob
+import os
+
+class RecrawlIndex():
+    """
+    What a previous crawl saved of each page, read from its WARC files or from an index built from them:
+    the ETag and Last-Modified of the page, the digest of its payload and the date of its record.
+    Pages on the index are requested with a conditional GET and, if the server says they were not modified
+    or their payload is the same, saved as a revisit record of the previous one instead of parsed again
+    """
+
+    NOT_MODIFIED_PROFILE = "http://netpreserve.org/warc/1.0/revisit/server-not-modified"
+    IDENTICAL_PAYLOAD_PROFILE = "http://netpreserve.org/warc/1.0/revisit/identical-payload-digest"
+
+    def __init__(self, previousCrawlPath:str = None):
+        #Url -> (ETag, Last-Modified, payload digest, WARC-Date of the response record)
+        self._entries = dict()
+        self._lock = Lock()
+
+        self._numNotModified = 0
+        self._numIdenticalPayloads = 0
+        self._numModified = 0
+
+        if previousCrawlPath != None:
+            self.loadFrom(previousCrawlPath)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def loadFrom(self, previousCrawlPath:str):
+        """
+        A directory with the WARC files of the previous crawl, or an index file saved from them
+        """
+        if os.path.isdir(previousCrawlPath):
+            #Oldest first, so the latest record of a page is the one kept
+            warcFilePaths = sorted(glob.glob(os.path.join(previousCrawlPath, "*.warc.gz")), key=os.path.getmtime)
+            [self.addWarcFile(warcFilePath) for warcFilePath in warcFilePaths]
+        else:
+            with open(previousCrawlPath, 'rb') as indexFile:
+                self._entries.update(pickle.load(indexFile))
+
+        logging.info(f"Recrawling {len(self._entries)} pages of {previousCrawlPath}")
+
+    def addWarcFile(self, warcFilePath:str):
+        """
+        Revisit records keep pointing to the response record they were a revisit of,
+        so a crawl that was itself a recrawl can be recrawled too
+        """
+        with open(warcFilePath, 'rb') as warcFile:
+            for record in ArchiveIterator(warcFile):
+                if record.rec_type not in ("response", "revisit") or record.http_headers == None:
+                    continue
+                if record.rec_headers.get_header('WARC-Truncated') != None:
+                    continue
+
+                url = record.rec_headers.get_header('WARC-Target-URI')
+                payloadDigest = record.rec_headers.get_header('WARC-Payload-Digest')
+                if record.rec_type == "response":
+                    warcDate = record.rec_headers.get_header('WARC-Date')
+                    #Of the body as it was sent, Content-Encoding included, as getRevisitOf digests it
+                    if payloadDigest == None:
+                        payloadDigest = RecrawlIndex.getPayloadDigest(record.raw_stream.read())
+                else:
+                    warcDate = record.rec_headers.get_header('WARC-Refers-To-Date')
+
+                #A 304 may leave out the validators the page had
+                previousEntry = self._entries.get(url, (None, None, None, None))
+                etag = record.http_headers.get_header('ETag', previousEntry[0])
+                lastModified = record.http_headers.get_header('Last-Modified', previousEntry[1])
+                self._entries[url] = (etag, lastModified, payloadDigest, warcDate)
+
+    def save(self, filePath:str):
+        temporaryFilePath = f"{filePath}.tmp"
+        with open(temporaryFilePath, 'wb') as indexFile:
+            pickle.dump(self._entries, indexFile, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporaryFilePath, filePath)
+
+    def getUrls(self) -> list:
+        return list(self._entries.keys())
+
+    def getConditionalHeadersOf(self, url:str) -> dict:
+        """None if the page was not on the previous crawl or had neither an ETag nor a Last-Modified"""
+        entry = self._entries.get(url)
+        if entry == None or (entry[0] == None and entry[1] == None):
+            return None
+
+        conditionalHeaders = dict()
+        if entry[0] != None:
+            conditionalHeaders['If-None-Match'] = entry[0]
+        if entry[1] != None:
+            conditionalHeaders['If-Modified-Since'] = entry[1]
+        return conditionalHeaders
+
+    def getRevisitOf(self, url:str, status:int, rawBody:bytes = None) -> tuple:
+        """
+        The WARC-Profile, WARC-Payload-Digest and WARC-Refers-To-Date of the revisit record the response
+        should be saved as, or None if the page changed or was not on the previous crawl.
+        rawBody is the whole body of a successful response, as it was sent
+        """
+        entry = self._entries.get(url)
+        if entry == None:
+            return None
+
+        revisitOf = None
+        if status == 304:
+            revisitOf = (RecrawlIndex.NOT_MODIFIED_PROFILE, entry[2], entry[3])
+        elif rawBody != None and RecrawlIndex.getPayloadDigest(rawBody) == entry[2]:
+            revisitOf = (RecrawlIndex.IDENTICAL_PAYLOAD_PROFILE, entry[2], entry[3])
+
+        self._lock.acquire()
+        if revisitOf == None:
+            self._numModified += 1
+        elif status == 304:
+            self._numNotModified += 1
+        else:
+            self._numIdenticalPayloads += 1
+        self._lock.release()
+
+        return revisitOf
+
+    @staticmethod
+    def getPayloadDigest(payload:bytes) -> str:
+        """As warcio writes WARC-Payload-Digest"""
+        digester = Digester('sha1')
+        digester.update(payload)
+        return str(digester)
+
+    def getStatsString(self) -> str:
+        numRevisited = self._numNotModified + self._numIdenticalPayloads + self._numModified
+        return (f"RecrawlIndex: {len(self._entries)} pages of the previous crawl, {numRevisited} requested again: "
+                f"{self._numNotModified} not modified, {self._numIdenticalPayloads} with the same payload "
+                f"and {self._numModified} changed")
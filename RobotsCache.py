@@ -0,0 +1,241 @@
+from threading import Lock
+from urllib.parse import urlsplit
+import datetime
+import logging
+import pickle
+import os
+import WebAccesser
+
+class RobotsEntry():
+    """
+    The robots of one host, parsed from their content only when first needed.
+    None content means the robots could not be accessed, so everything is allowed
+    """
+
+    AGENTNAME = '*'
+    MAX_MEMOIZED_DECISIONS = 4096
+
+    def __init__(self, robotsUrlAndContent:tuple, expiresTimestamp:float):
+        self._robotsUrlAndContent = robotsUrlAndContent
+        self._expiresTimestamp = expiresTimestamp
+
+        self._robots = None
+        self._parsed = False
+        self._delay = None
+
+        #Decisions of allowed(), keyed by the part of the path that the rules can look at
+        self._decisions = dict()
+        self._maxRulePathLength = None
+        self._numMemoizedDecisions = 0
+
+    @property
+    def robotsUrlAndContent(self) -> tuple:
+        return self._robotsUrlAndContent
+
+    @robotsUrlAndContent.setter
+    def robotsUrlAndContent(self, newRobotsUrlAndContent):
+        raise AttributeError("robotsUrlAndContent is not writable")
+
+    @property
+    def numMemoizedDecisions(self) -> int:
+        return self._numMemoizedDecisions
+
+    @numMemoizedDecisions.setter
+    def numMemoizedDecisions(self, newNumMemoizedDecisions):
+        raise AttributeError("numMemoizedDecisions is not writable")
+
+    @property
+    def expiresTimestamp(self) -> float:
+        return self._expiresTimestamp
+
+    @expiresTimestamp.setter
+    def expiresTimestamp(self, newExpiresTimestamp):
+        raise AttributeError("expiresTimestamp is not writable")
+
+    def isNegative(self) -> bool:
+        return self._robotsUrlAndContent == None
+
+    def hasExpired(self, nowTimestamp:float = None) -> bool:
+        if nowTimestamp == None:
+            nowTimestamp = datetime.datetime.timestamp(datetime.datetime.now())
+        return nowTimestamp >= self._expiresTimestamp
+
+    def _parseIfNecessary(self):
+        if self._parsed:
+            return
+
+        if not self.isNegative():
+            robotsUrl, content = self._robotsUrlAndContent
+            self._robots = WebAccesser.WebAccesser.parseRobots(robotsUrl, content)
+            self._maxRulePathLength = RobotsEntry._getMaxRulePathLength(content)
+
+            if self._robots != None:
+                self._delay = self._robots.agent(RobotsEntry.AGENTNAME).delay
+        self._parsed = True
+
+    @staticmethod
+    def _getMaxRulePathLength(content:str) -> int:
+        """
+        Rules without wildcards or escapes only match a prefix of the path, so no rule
+        looks past its own length. Returns None when some rule may look further
+        """
+        maxRulePathLength = 0
+        for line in content.splitlines():
+            field, _, value = line.split('#', 1)[0].partition(':')
+            if field.strip().lower() not in ["allow", "disallow"]:
+                continue
+
+            rulePath = value.strip()
+            if any([specialChar in rulePath for specialChar in "*$%"]):
+                return None
+            maxRulePathLength = max(maxRulePathLength, len(rulePath))
+        return maxRulePathLength
+
+    def allowed(self, completeLink:str) -> bool:
+        self._parseIfNecessary()
+        if self._robots == None:
+            return True
+
+        decisionKey = self._getDecisionKey(completeLink)
+        decision = self._decisions.get(decisionKey)
+        if decision != None:
+            self._numMemoizedDecisions += 1
+            return decision
+
+        decision = self._robots.allowed(completeLink, RobotsEntry.AGENTNAME)
+        if len(self._decisions) >= RobotsEntry.MAX_MEMOIZED_DECISIONS:
+            self._decisions.clear()
+        self._decisions[decisionKey] = decision
+        return decision
+
+    def _getDecisionKey(self, completeLink:str) -> str:
+        splitLink = urlsplit(completeLink)
+        path = splitLink.path if splitLink.path != "" else "/"
+        if splitLink.query != "":
+            path = f"{path}?{splitLink.query}"
+
+        if self._maxRulePathLength == None or '%' in path:
+            return path
+        return path[:self._maxRulePathLength]
+
+    def delaySeconds(self) -> float:
+        """The crawl delay asked by the robots, or None"""
+        self._parseIfNecessary()
+        return self._delay
+
+class RobotsCache():
+    """
+    The robots of every host crawled by this process, shared by every worker.
+    Entries expire after a TTL, shorter for hosts whose robots could not be accessed,
+    and are kept on a file between runs
+    """
+
+    TTL_SECONDS = 24 * 60 * 60
+    NEGATIVE_TTL_SECONDS = 60 * 60
+
+    def __init__(self, filePath:str = None, ttlSeconds:float = TTL_SECONDS,
+                    negativeTtlSeconds:float = NEGATIVE_TTL_SECONDS):
+        self._filePath = filePath
+        self._ttlSeconds = ttlSeconds
+        self._negativeTtlSeconds = negativeTtlSeconds
+
+        self._entries = dict()
+        self._lock = Lock()
+
+        self._numHits = 0
+        self._numNegativeHits = 0
+        self._numMisses = 0
+        self._numFetches = 0
+
+        if self._filePath != None:
+            self._loadFromFile()
+
+    def getEntry(self, hostWithSchema:str) -> RobotsEntry:
+        """Returns the entry of the host if it has not expired, otherwise None"""
+        self._lock.acquire()
+        entry = self._entries.get(hostWithSchema)
+        if entry != None and entry.hasExpired():
+            entry = None
+
+        if entry == None:
+            self._numMisses += 1
+        elif entry.isNegative():
+            self._numNegativeHits += 1
+        else:
+            self._numHits += 1
+        self._lock.release()
+
+        return entry
+
+    def putContent(self, hostWithSchema:str, robotsUrlAndContent:tuple) -> RobotsEntry:
+        """
+        Caches the robots fetched for the host. None means they could not be accessed
+        """
+        ttlSeconds = self._ttlSeconds if robotsUrlAndContent != None else self._negativeTtlSeconds
+        expiresTimestamp = datetime.datetime.timestamp(datetime.datetime.now()) + ttlSeconds
+        entry = RobotsEntry(robotsUrlAndContent, expiresTimestamp)
+
+        self._lock.acquire()
+        self._entries[hostWithSchema] = entry
+        self._numFetches += 1
+        self._lock.release()
+
+        return entry
+
+    def restoreEntry(self, hostWithSchema:str, robotsUrlAndContent:tuple) -> RobotsEntry:
+        """For robots already fetched by a previous run, like the ones on a checkpoint"""
+        entry = self.getEntry(hostWithSchema)
+        if entry == None:
+            entry = self.putContent(hostWithSchema, robotsUrlAndContent)
+        return entry
+
+    def getOrFetchEntry(self, hostWithSchema:str, webAccess:WebAccesser.WebAccesser) -> RobotsEntry:
+        entry = self.getEntry(hostWithSchema)
+        if entry == None:
+            entry = self.putContent(hostWithSchema, webAccess.getRobotsContentOf(hostWithSchema))
+        return entry
+
+    def _loadFromFile(self):
+        if not os.path.isfile(self._filePath):
+            return
+
+        try:
+            with open(self._filePath, 'rb') as cacheFile:
+                savedEntries = pickle.load(cacheFile)
+        except Exception as e:
+            logging.info(f"Could not read the robots cache on {self._filePath}: {e}")
+            return
+
+        nowTimestamp = datetime.datetime.timestamp(datetime.datetime.now())
+        for hostWithSchema, (robotsUrlAndContent, expiresTimestamp) in savedEntries.items():
+            if expiresTimestamp > nowTimestamp:
+                self._entries[hostWithSchema] = RobotsEntry(robotsUrlAndContent, expiresTimestamp)
+
+        logging.info(f"Reusing the robots of {len(self._entries)} hosts on {self._filePath}")
+
+    def save(self):
+        if self._filePath == None:
+            return
+
+        nowTimestamp = datetime.datetime.timestamp(datetime.datetime.now())
+        self._lock.acquire()
+        entriesToSave = {hostWithSchema: (entry.robotsUrlAndContent, entry.expiresTimestamp)
+                            for hostWithSchema, entry in self._entries.items() if not entry.hasExpired(nowTimestamp)}
+        self._lock.release()
+
+        temporaryFilePath = f"{self._filePath}.tmp"
+        with open(temporaryFilePath, 'wb') as cacheFile:
+            pickle.dump(entriesToSave, cacheFile, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporaryFilePath, self._filePath)
+
+    def close(self):
+        self.save()
+
+    def getStatsString(self) -> str:
+        self._lock.acquire()
+        numMemoizedDecisions = sum([entry.numMemoizedDecisions for _, entry in self._entries.items()])
+        self._lock.release()
+
+        return (f"RobotsCache: {len(self._entries)} hosts, {self._numHits} hits, "
+                f"{self._numNegativeHits} negative hits, {self._numMisses} misses, {self._numFetches} fetches, "
+                f"{numMemoizedDecisions} memoized allow decisions")
@@ -0,0 +1,257 @@
+from threading import Lock
+import hashlib
+import pickle
+import logging
+import struct
+import utils
+import math
+import mmap
+import sys
+import os
+
+class SeenStore():
+    """
+    Remembers every URL already put on a frontier, so it is never enqueued twice.
+    It is shared by every worker, so it must be thread safe
+    """
+
+    def addIfNotSeen(self, url:str) -> bool:
+        """
+        Marks the url as seen. Returns whether it was not seen before
+        """
+        raise NotImplementedError()
+
+    def contains(self, url:str) -> bool:
+        raise NotImplementedError()
+
+    def getSeenLinksOfHosts(self, hostsWithSchema:set) -> list:
+        """
+        The urls seen of these hosts, or None if the store cannot tell which urls it has, like a Bloom filter
+        """
+        return None
+
+    def memoryFootprintBytes(self) -> int:
+        raise NotImplementedError()
+
+    def falsePositiveRate(self) -> float:
+        """The estimated probability of a never seen url being reported as seen"""
+        raise NotImplementedError()
+
+    def checkpointTo(self, filePath:str):
+        raise NotImplementedError()
+
+    def restoreFrom(self, filePath:str):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def getStatsString(self) -> str:
+        return (f"{type(self).__name__}: {self.memoryFootprintBytes()} bytes, "
+                f"estimated false positive rate {self.falsePositiveRate()}")
+
+class ExactSeenStore(SeenStore):
+    """
+    A set of the urls. No false positives, but memory grows with every url
+    """
+
+    def __init__(self):
+        self._seen = set()
+        self._stringsSizeBytes = 0
+        self._lock = Lock()
+
+    def addIfNotSeen(self, url:str) -> bool:
+        self._lock.acquire()
+        notSeen = url not in self._seen
+        if notSeen:
+            self._seen.add(url)
+            self._stringsSizeBytes += sys.getsizeof(url)
+        self._lock.release()
+        return notSeen
+
+    def contains(self, url:str) -> bool:
+        return url in self._seen
+
+    def getSeenLinksOfHosts(self, hostsWithSchema:set) -> list:
+        """Goes through every url, so it is only for when hosts move to other processes"""
+        self._lock.acquire()
+        seen = list(self._seen)
+        self._lock.release()
+
+        return [url for url in seen if utils.getHostWithSchemaOfLink(url) in hostsWithSchema]
+
+    def memoryFootprintBytes(self) -> int:
+        return sys.getsizeof(self._seen) + self._stringsSizeBytes
+
+    def falsePositiveRate(self) -> float:
+        return 0.0
+
+    def checkpointTo(self, filePath:str):
+        self._lock.acquire()
+        seenBytes = pickle.dumps(self._seen, pickle.HIGHEST_PROTOCOL)
+        self._lock.release()
+
+        with open(filePath, 'wb') as checkpointFile:
+            checkpointFile.write(seenBytes)
+
+    def restoreFrom(self, filePath:str):
+        with open(filePath, 'rb') as checkpointFile:
+            seen = pickle.load(checkpointFile)
+
+        self._lock.acquire()
+        self._seen = seen
+        self._stringsSizeBytes = sum([sys.getsizeof(url) for url in seen])
+        self._lock.release()
+
+class BloomSeenStore(SeenStore):
+    """
+    A Bloom filter sized for the expected number of urls and the desired false positive rate.
+    A false positive means a url that is never crawled
+    """
+
+    def __init__(self, expectedNumUrls:int, desiredFalsePositiveRate:float = 0.001):
+        self._numBits, self._numHashes = BloomSeenStore.getDimensions(expectedNumUrls, desiredFalsePositiveRate)
+        self._bits = bytearray(self._numBitsBytes())
+        self._bitsOffset = 0
+        self._numUrls = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def getDimensions(expectedNumUrls:int, desiredFalsePositiveRate:float):
+        expectedNumUrls = max(1, expectedNumUrls)
+        numBits = math.ceil(-expectedNumUrls * math.log(desiredFalsePositiveRate) / (math.log(2) ** 2))
+        numHashes = max(1, round(numBits / expectedNumUrls * math.log(2)))
+        return numBits, numHashes
+
+    def _numBitsBytes(self) -> int:
+        return (self._numBits + 7) // 8
+
+    def _bitPositions(self, url:str):
+        #Double hashing: the k positions come from two independent 64 bits hashes
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        firstHash = int.from_bytes(digest[:8], 'little')
+        secondHash = int.from_bytes(digest[8:], 'little') | 1
+        return [(firstHash + i * secondHash) % self._numBits for i in range(self._numHashes)]
+
+    def _isBitSet(self, position:int) -> bool:
+        return self._bits[self._bitsOffset + (position >> 3)] & (1 << (position & 7)) != 0
+
+    def _setBit(self, position:int):
+        byteIndex = self._bitsOffset + (position >> 3)
+        self._bits[byteIndex] = self._bits[byteIndex] | (1 << (position & 7))
+
+    def addIfNotSeen(self, url:str) -> bool:
+        positions = self._bitPositions(url)
+
+        self._lock.acquire()
+        notSeen = False
+        for position in positions:
+            if not self._isBitSet(position):
+                notSeen = True
+                self._setBit(position)
+
+        if notSeen:
+            self._numUrls += 1
+        self._lock.release()
+
+        return notSeen
+
+    def contains(self, url:str) -> bool:
+        return all([self._isBitSet(position) for position in self._bitPositions(url)])
+
+    def memoryFootprintBytes(self) -> int:
+        return self._numBitsBytes()
+
+    def falsePositiveRate(self) -> float:
+        return (1 - math.exp(-self._numHashes * self._numUrls / self._numBits)) ** self._numHashes
+
+    def checkpointTo(self, filePath:str):
+        self._lock.acquire()
+        state = {'numBits': self._numBits, 'numHashes': self._numHashes, 'numUrls': self._numUrls,
+                    'bits': bytes(self._bits[self._bitsOffset:self._bitsOffset + self._numBitsBytes()])}
+        self._lock.release()
+
+        with open(filePath, 'wb') as checkpointFile:
+            pickle.dump(state, checkpointFile, pickle.HIGHEST_PROTOCOL)
+
+    def restoreFrom(self, filePath:str):
+        with open(filePath, 'rb') as checkpointFile:
+            state = pickle.load(checkpointFile)
+
+        if state['numBits'] != self._numBits or state['numHashes'] != self._numHashes:
+            raise ValueError(f"The seen urls on {filePath} were saved by a filter of other dimensions")
+
+        self._lock.acquire()
+        self._bits[self._bitsOffset:self._bitsOffset + self._numBitsBytes()] = state['bits']
+        self._numUrls = state['numUrls']
+        self._lock.release()
+
+class MmapBloomSeenStore(BloomSeenStore):
+    """
+    A Bloom filter kept on a memory mapped file, so the urls seen survive restarts.
+    The file is reused only if asked to, when resuming a crawl, and if it was created with the same dimensions.
+    Otherwise it is recreated, so a new crawl from the same seeds does not take them as already seen
+    """
+
+    MAGIC = b"WCBLOOM1"
+    HEADER_FORMAT = "<8sQQQ"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+    def __init__(self, filePath:str, expectedNumUrls:int, desiredFalsePositiveRate:float = 0.001,
+                    reuseFile:bool = False):
+        self._numBits, self._numHashes = BloomSeenStore.getDimensions(expectedNumUrls, desiredFalsePositiveRate)
+        self._bitsOffset = MmapBloomSeenStore.HEADER_SIZE
+        self._numUrls = 0
+        self._lock = Lock()
+
+        self._filePath = filePath
+        fileSize = MmapBloomSeenStore.HEADER_SIZE + self._numBitsBytes()
+        reuseFile = reuseFile and self._fileHasSameDimensions()
+
+        self._file = open(filePath, 'r+b' if reuseFile else 'w+b')
+        if not reuseFile:
+            self._file.truncate(fileSize)
+
+        self._bits = mmap.mmap(self._file.fileno(), fileSize)
+
+        if reuseFile:
+            _, _, _, self._numUrls = struct.unpack_from(MmapBloomSeenStore.HEADER_FORMAT, self._bits, 0)
+            logging.info(f"Reusing the {self._numUrls} urls already seen on {filePath}")
+        self._writeHeader()
+
+    def _fileHasSameDimensions(self) -> bool:
+        if not os.path.isfile(self._filePath):
+            return False
+
+        with open(self._filePath, 'rb') as seenFile:
+            header = seenFile.read(MmapBloomSeenStore.HEADER_SIZE)
+
+        if len(header) < MmapBloomSeenStore.HEADER_SIZE:
+            return False
+
+        magic, numBits, numHashes, _ = struct.unpack(MmapBloomSeenStore.HEADER_FORMAT, header)
+        return magic == MmapBloomSeenStore.MAGIC and numBits == self._numBits and numHashes == self._numHashes
+
+    def _writeHeader(self):
+        struct.pack_into(MmapBloomSeenStore.HEADER_FORMAT, self._bits, 0,
+                            MmapBloomSeenStore.MAGIC, self._numBits, self._numHashes, self._numUrls)
+
+    def flush(self):
+        self._lock.acquire()
+        self._writeHeader()
+        self._bits.flush()
+        self._lock.release()
+
+    def close(self):
+        self.flush()
+        self._bits.close()
+        self._file.close()
+
+def createSeenStore(kind:str, expectedNumUrls:int, desiredFalsePositiveRate:float, filePath:str,
+                    reuseFile:bool = False) -> SeenStore:
+    if kind == "bloom":
+        return BloomSeenStore(expectedNumUrls, desiredFalsePositiveRate)
+    elif kind == "mmap":
+        return MmapBloomSeenStore(filePath, expectedNumUrls, desiredFalsePositiveRate, reuseFile)
+    else:
+        return ExactSeenStore()
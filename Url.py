@@ -0,0 +1,102 @@
+from functools import lru_cache
+import utils
+import sys
+
+class Url():
+    """
+    A link normalized once, with its host with schema, resource and host hash taken only then, so it goes
+    from the parser to the HostInfo of its host without being normalized or split again.
+    Links that come as strings, like seeds or the ones of other processes, are made into Urls with Url.of
+    """
+
+    __slots__ = ('_link', '_hostWithSchema', '_resource', '_hostHash')
+
+    #Links found on many pages, like the ones of menus, are normalized once for all of them
+    NORMALIZE_CACHE_SIZE = 64 * 1024
+
+    def __init__(self, link:str, hostWithSchema:str, resource:str, hostHash:int):
+        self._link = link
+        self._hostWithSchema = hostWithSchema
+        self._resource = resource
+        self._hostHash = hostHash
+
+    @property
+    def link(self) -> str:
+        return self._link
+
+    @link.setter
+    def link(self, newLink):
+        raise AttributeError("link is not writable")
+
+    @property
+    def hostWithSchema(self) -> str:
+        return self._hostWithSchema
+
+    @hostWithSchema.setter
+    def hostWithSchema(self, newHostWithSchema):
+        raise AttributeError("hostWithSchema is not writable")
+
+    @property
+    def resource(self) -> str:
+        return self._resource
+
+    @resource.setter
+    def resource(self, newResource):
+        raise AttributeError("resource is not writable")
+
+    @property
+    def hostHash(self) -> int:
+        """utils.stableHostHash of the host with schema"""
+        return self._hostHash
+
+    @hostHash.setter
+    def hostHash(self, newHostHash):
+        raise AttributeError("hostHash is not writable")
+
+    def __str__(self) -> str:
+        return self._link
+
+    def __repr__(self) -> str:
+        return f"Url({self._link!r})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Url) and self._link == other._link
+
+    def __hash__(self) -> int:
+        return hash(self._link)
+
+    def __reduce__(self):
+        #Sent between processes without normalizing it again on the other side
+        return (Url, (self._link, self._hostWithSchema, self._resource, self._hostHash))
+
+    @staticmethod
+    def of(link) -> "Url":
+        """A Url as it is, or the Url of a link string, normalized"""
+        if isinstance(link, Url):
+            return link
+        return Url.fromLink(link)
+
+    @staticmethod
+    @lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+    def fromLink(link:str) -> "Url":
+        return Url.fromNormalizedLink(utils.normalizeLinkIfCan(link))
+
+    @staticmethod
+    def fromNormalizedLink(normalizedLink:str) -> "Url":
+        linkParts = normalizedLink.split("/", 3)
+        #Interned, so the Urls and HostInfo of a host keep one copy of its name
+        hostWithSchema = sys.intern(f"{linkParts[0]}//{linkParts[2]}") if len(linkParts) >= 3 else ""
+        resource = f"/{linkParts[3]}" if len(linkParts) == 4 else "/"
+        return Url(normalizedLink, hostWithSchema, resource, utils.stableHostHash(hostWithSchema))
+
+    @staticmethod
+    def fromHostAndResource(hostWithSchema:str, resource:str) -> "Url":
+        """Of a resource already on the queue of its host, so already normalized"""
+        return Url(f"{hostWithSchema}{resource}", hostWithSchema, resource, utils.stableHostHash(hostWithSchema))
+
+    @staticmethod
+    def getCacheStatsString() -> str:
+        cacheInfo = Url.fromLink.cache_info()
+        numLookups = max(1, cacheInfo.hits + cacheInfo.misses)
+        return (f"Url: {cacheInfo.currsize} normalized links cached, {cacheInfo.hits} hits and "
+                f"{cacheInfo.misses} misses ({cacheInfo.hits / numLookups:.2%} hit rate)")
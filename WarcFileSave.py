@@ -1,70 +1,412 @@
 from warcio.statusandheaders import StatusAndHeaders
 from warcio.warcwriter import WARCWriter
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+from collections import deque
+from io import BytesIO
+import itertools
 import urllib3
+import time
 import logging
+import queue
+import zlib
+import os
+
+class WarcRecordCompressor():
+    """
+    Builds the WARC record of a response and gzips it as its own gzip member, as warcio does,
+    so records can be compressed by many threads and then just appended to a file.
+    zlib releases the GIL, so compressing on many threads uses many cores
+    """
+
+    GZIP_COMPRESS_LEVEL = 6
+
+    def __init__(self):
+        self._numRecords = 0
+        self._rawBytes = 0
+        self._compressedBytes = 0
+        self._compressSeconds = 0.0
+        self._statsLock = Lock()
+
+    @staticmethod
+    def serializeRecord(link:str, status:int, headersList:list, body:bytes, truncated:str = None,
+                        revisitOf:tuple = None) -> bytes:
+        """
+        truncated is why the body is not whole, like "length" or "time", written as WARC-Truncated.
+        revisitOf is the WARC-Profile, WARC-Payload-Digest and WARC-Refers-To-Date of a revisit record,
+        which is saved without the body
+        """
+        output = BytesIO()
+        writer = WARCWriter(output, gzip=False)
+
+        http_headers = StatusAndHeaders(str(status), headersList, protocol='HTTP/1.0')
+        warc_headers_dict = {} if truncated == None else {'WARC-Truncated': truncated}
+        if revisitOf != None:
+            profile, payloadDigest, refersToDate = revisitOf
+            record = writer.create_revisit_record(link, payloadDigest, link, refersToDate, http_headers=http_headers,
+                                                    warc_headers_dict=warc_headers_dict)
+            record.rec_headers.replace_header('WARC-Profile', profile)
+        else:
+            record = writer.create_warc_record(link, 'response', payload=BytesIO(body), http_headers=http_headers,
+                                                warc_headers_dict=warc_headers_dict)
+        writer.write_record(record)
+
+        return output.getvalue()
+
+    def compressRecord(self, link:str, status:int, headersList:list, body:bytes, truncated:str = None,
+                        revisitOf:tuple = None) -> tuple:
+        """
+        Returns the gzipped record, its size before compression and how long it took to compress
+        """
+        rawRecord = WarcRecordCompressor.serializeRecord(link, status, headersList, body, truncated, revisitOf)
+
+        start = time.perf_counter()
+        compressor = zlib.compressobj(WarcRecordCompressor.GZIP_COMPRESS_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS + 16)
+        compressedRecord = compressor.compress(rawRecord) + compressor.flush()
+        compressSeconds = time.perf_counter() - start
+
+        self._statsLock.acquire()
+        self._numRecords += 1
+        self._rawBytes += len(rawRecord)
+        self._compressedBytes += len(compressedRecord)
+        self._compressSeconds += compressSeconds
+        self._statsLock.release()
+
+        return compressedRecord, len(rawRecord), compressSeconds
+
+    def getStatsString(self) -> str:
+        rawMegabytes = self._rawBytes / (1024 * 1024)
+        megabytesPerSecond = rawMegabytes / self._compressSeconds if self._compressSeconds > 0 else 0.0
+        ratio = self._rawBytes / self._compressedBytes if self._compressedBytes > 0 else 0.0
+        return (f"Compressed {self._numRecords} records: {rawMegabytes:.2f} MB at {megabytesPerSecond:.2f} MB/s "
+                f"per thread, ratio {ratio:.2f}")
+
+class WarcFile():
+    """
+    An open WARC file that gzipped records are appended to. It is rotated to a new file
+    once it reaches maxFileBytes, so every file but the last one is about that size
+    """
+
+    MAX_FILE_BYTES = 1024 * 1024 * 1024
+
+    def __init__(self, warcPreName:str, firstWarcFileId:int = 0, maxFileBytes:int = MAX_FILE_BYTES):
+        self._warcPreName = warcPreName
+        self._maxFileBytes = maxFileBytes
+        self._currWarcFileId = firstWarcFileId
+
+        self._file = None
+        self._fileBytes = 0
+        self._numRecordsOnFile = 0
+        self._rawBytesOnFile = 0
+        self._compressedBytesOnFile = 0
+        self._compressSecondsOnFile = 0.0
+
+    @property
+    def warcFileId(self) -> int:
+        return self._currWarcFileId
+
+    @warcFileId.setter
+    def warcFileId(self, newWarcFileId):
+        raise AttributeError("warcFileId is not writable")
+
+    def getFileName(self) -> str:
+        return f"{self._warcPreName}{self._currWarcFileId}.warc.gz"
+
+    def append(self, compressedRecord:bytes, rawRecordSize:int, compressSeconds:float):
+        if self._file == None:
+            self._file = open(self.getFileName(), 'ab')
+            self._fileBytes = self._file.tell()
+
+        self._file.write(compressedRecord)
+        self._fileBytes += len(compressedRecord)
+        self._numRecordsOnFile += 1
+        self._rawBytesOnFile += rawRecordSize
+        self._compressedBytesOnFile += len(compressedRecord)
+        self._compressSecondsOnFile += compressSeconds
+
+        if self._fileBytes >= self._maxFileBytes:
+            self.close()
+            self._currWarcFileId += 1
+            logging.info("Atualizou nome warc file")
+
+    def flush(self, sync:bool = False):
+        if self._file != None:
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file == None:
+            return
+
+        self.flush(sync=True)
+        self._file.close()
+        self._file = None
+
+        rawMegabytes = self._rawBytesOnFile / (1024 * 1024)
+        megabytesPerSecond = rawMegabytes / self._compressSecondsOnFile if self._compressSecondsOnFile > 0 else 0.0
+        ratio = self._rawBytesOnFile / self._compressedBytesOnFile if self._compressedBytesOnFile > 0 else 0.0
+        logging.info(f"WARC file {self.getFileName()}: {self._numRecordsOnFile} records, {self._fileBytes} bytes, "
+                        f"compressed at {megabytesPerSecond:.2f} MB/s per thread, ratio {ratio:.2f}")
+
+        self._fileBytes = 0
+        self._numRecordsOnFile = 0
+        self._rawBytesOnFile = 0
+        self._compressedBytesOnFile = 0
+        self._compressSecondsOnFile = 0.0
 
 class WarcSaver():
-    
-    MAX_RESULTS_PER_WARC_FILE = 1000
 
-    def __init__(self, warcPreName = "results"):
-        self._warcOutputFilePreName = warcPreName
-        self._warcOutputFileExtensions = ".warc.gz"
-        
+    def __init__(self, warcPreName = "results", maxFileBytes:int = WarcFile.MAX_FILE_BYTES):
+        self._warcPreName = warcPreName
+        self._maxFileBytes = maxFileBytes
         self._warcFileLock = Lock()
-        
+        self._warcFile = WarcFile(warcPreName, 0, maxFileBytes)
+        self._compressor = WarcRecordCompressor()
+
         self._numSavedPages = 0
-        self._currWarcFileId = 0
-    
-    def saveAndReturnIfSuccess(self, response: urllib3.response.HTTPResponse, link:str):
+
+    def saveAndReturnIfSuccess(self, response: urllib3.response.HTTPResponse, link:str, shardKey:int = None,
+                                body:bytes = None, truncated:str = None, revisitOf:tuple = None):
+        """
+        body is what was read of a response that was not preloaded
+        """
+        headers_list = list(response.getheaders().items())
+        body = response.data if body == None else body
+        return self._saveRecordAndReturnIfSuccess(link, body, response.status, headers_list, truncated, revisitOf)
+
+    def saveBytesAndReturnIfSuccess(self, status:int, headersList:list, body:bytes, link:str, shardKey:int = None,
+                                    truncated:str = None, revisitOf:tuple = None):
+        """
+        Saves a response whose body was already read, e.g. by the asyncio engine
+        """
+        return self._saveRecordAndReturnIfSuccess(link, body, status, headersList, truncated, revisitOf)
+
+    def _saveRecordAndReturnIfSuccess(self, link:str, body:bytes, status:int, headersList, truncated:str = None,
+                                        revisitOf:tuple = None):
+        #Compressed on the caller thread, so only the append is done under the lock
+        try:
+            compressedRecord = self._compressor.compressRecord(link, status, headersList, body, truncated, revisitOf)
+        except:
+            return False
+
         self._warcFileLock.acquire()
         success = False
-        with open(self._getCompleteWarcOutputFileName(), 'ab') as output:
-            try:
-                writer = WARCWriter(output, gzip=True)
+        try:
+            self._warcFile.append(*compressedRecord)
+            self._warcFile.flush()
+            self._numSavedPages +=1
+            success = True
+        except:
+            success = False
 
-                headers_list = response.getheaders().items()
+        self._warcFileLock.release()
 
-                http_headers = StatusAndHeaders(str(response.status), headers_list, protocol='HTTP/1.0')
+        return success
 
-            
-                record = writer.create_warc_record(link, 'response', payload=response,
-                                                    http_headers=http_headers)
+    def resumeAfter(self, warcFileId:int, numSavedPages:int):
+        """
+        Continues a crawl that saved numSavedPages up to warcFileId.
+        It starts on a new file, since the last one may have been cut off
+        """
+        self._warcFileLock.acquire()
+        self._warcFile.close()
+        self._warcFile = WarcFile(self._warcPreName, warcFileId + 1, self._maxFileBytes)
+        self._numSavedPages = numSavedPages
+        self._warcFileLock.release()
 
-                writer.write_record(record)
+    @property
+    def numSavedPages(self):
+        return self._numSavedPages
 
-                self._numSavedPages +=1
+    @numSavedPages.setter
+    def numSavedPages(self, newSavedPages:int):
+        raise AttributeError("numSavedPages is not writable")
 
-                shouldSaveOnNewWarcFile = self._numSavedPages % WarcSaver.MAX_RESULTS_PER_WARC_FILE == 0
-                if shouldSaveOnNewWarcFile:
-                    self._currWarcFileId +=1
-                    logging.info("Atualizou nome warc file")
+    @property
+    def warcFileId(self):
+        return self._warcFile.warcFileId
 
-                success = True
+    @warcFileId.setter
+    def warcFileId(self, newWarcFileId:int):
+        raise AttributeError("warcFileId is not writable")
 
-            except:
-                success = False
-        
+    def close(self):
+        self._warcFileLock.acquire()
+        self._warcFile.close()
         self._warcFileLock.release()
 
-        return success
-    
-    def _getCompleteWarcOutputFileName(self):
-        return f"{self._warcOutputFilePreName}{self._currWarcFileId}{self._warcOutputFileExtensions}"
-    
+    def getStatsString(self) -> str:
+        return f"WarcSaver: {self._numSavedPages} records saved. {self._compressor.getStatsString()}"
+
+class BackgroundWarcSaver():
+    """
+    The same interface of WarcSaver, but records are only queued by the caller and written
+    by writer threads that keep their files open. Each writer has its own files, named after
+    the writer or, if sharded by worker, after the worker whose record it is.
+    Records are compressed by a pool of threads and appended in the order they were queued.
+    Files are flushed to disk every flushIntervalSeconds, so that is what may be lost on a crash
+    """
+
+    SHARD_BY_WRITER = "writer"
+    SHARD_BY_WORKER = "worker"
+    MAX_QUEUED_RECORDS_PER_WRITER = 1024
+    MAX_COMPRESSING_RECORDS_PER_WRITER = 64
+
+    def __init__(self, warcPreName:str = "results", numWriters:int = 1, shardBy:str = SHARD_BY_WRITER,
+                    flushIntervalSeconds:float = 5.0, numCompressors:int = None,
+                    maxFileBytes:int = WarcFile.MAX_FILE_BYTES):
+        self._warcPreName = warcPreName
+        self._numWriters = numWriters
+        self._shardBy = shardBy
+        self._flushIntervalSeconds = flushIntervalSeconds
+        self._maxFileBytes = maxFileBytes
+
+        self._numSavedPagesLock = Lock()
+        self._numSavedPages = 0
+        self._numWriteErrors = 0
+        self._firstWarcFileId = 0
+        self._nextWriter = itertools.count()
+
+        self._numCompressors = os.cpu_count() if numCompressors == None else numCompressors
+        self._compressor = WarcRecordCompressor()
+        self._compressorsPool = None
+
+        #Only touched by its writer thread
+        self._shardFilesOfWriters = [dict() for _ in range(numWriters)]
+
+        self._writersQueues = [queue.Queue(BackgroundWarcSaver.MAX_QUEUED_RECORDS_PER_WRITER) for _ in range(numWriters)]
+        self._writersThreads = list()
+        self._started = False
+
     @property
     def numSavedPages(self):
+        """Records queued, not necessarily on disk yet"""
         return self._numSavedPages
-    
+
     @numSavedPages.setter
     def numSavedPages(self, newSavedPages:int):
         raise AttributeError("numSavedPages is not writable")
 
     @property
     def warcFileId(self):
-        return self._currWarcFileId
-    
+        """The largest file id of any shard"""
+        warcFileIds = [shardFile.warcFileId for shardFiles in self._shardFilesOfWriters
+                        for _, shardFile in list(shardFiles.items())]
+        return max([self._firstWarcFileId] + warcFileIds)
+
     @warcFileId.setter
     def warcFileId(self, newWarcFileId:int):
-        raise AttributeError("warcFileId is not writable")
\ No newline at end of file
+        raise AttributeError("warcFileId is not writable")
+
+    def _startIfNecessary(self):
+        self._numSavedPagesLock.acquire()
+        if not self._started:
+            self._started = True
+            self._compressorsPool = ThreadPoolExecutor(max_workers=self._numCompressors,
+                                                        thread_name_prefix="WarcCompressor")
+            for writerId in range(self._numWriters):
+                writerThread = Thread(target=self._writeRecords, args=(writerId,), name=f"WarcWriter{writerId}")
+                self._writersThreads.append(writerThread)
+                writerThread.start()
+        self._numSavedPagesLock.release()
+
+    def saveAndReturnIfSuccess(self, response: urllib3.response.HTTPResponse, link:str, shardKey:int = None,
+                                body:bytes = None, truncated:str = None, revisitOf:tuple = None):
+        body = response.data if body == None else body
+        return self.saveBytesAndReturnIfSuccess(response.status, list(response.getheaders().items()), body,
+                                                link, shardKey, truncated, revisitOf)
+
+    def saveBytesAndReturnIfSuccess(self, status:int, headersList:list, body:bytes, link:str, shardKey:int = None,
+                                    truncated:str = None, revisitOf:tuple = None):
+        """
+        Returns once the record is queued. Blocks while the queue of its writer is full
+        """
+        self._startIfNecessary()
+
+        if self._shardBy == BackgroundWarcSaver.SHARD_BY_WORKER and shardKey != None:
+            writerId = shardKey % self._numWriters
+            shardName = f"{self._warcPreName}_k{shardKey}_"
+        else:
+            writerId = next(self._nextWriter) % self._numWriters
+            shardName = f"{self._warcPreName}_w{writerId}_"
+
+        self._writersQueues[writerId].put((shardName, link, status, headersList, body, truncated, revisitOf))
+
+        self._numSavedPagesLock.acquire()
+        self._numSavedPages += 1
+        self._numSavedPagesLock.release()
+        return True
+
+    def _writeRecords(self, writerId:int):
+        writerQueue = self._writersQueues[writerId]
+        shardFiles = self._shardFilesOfWriters[writerId]
+        #Records being compressed, in the order they must be appended
+        compressingRecords = deque()
+        nextFlushTime = time.monotonic() + self._flushIntervalSeconds
+
+        while True:
+            try:
+                #Does not wait for records while there are compressed ones to append
+                timeout = 0.0 if len(compressingRecords) > 0 else max(0.0, nextFlushTime - time.monotonic())
+                queuedRecord = writerQueue.get(timeout=timeout)
+            except queue.Empty:
+                queuedRecord = False
+
+            if queuedRecord == None:
+                self._appendCompressedRecords(compressingRecords, shardFiles, len(compressingRecords))
+                [shardFile.close() for _, shardFile in shardFiles.items()]
+                return
+
+            if queuedRecord != False:
+                shardName, link, status, headersList, body, truncated, revisitOf = queuedRecord
+                compressingRecords.append((shardName, link, self._compressorsPool.submit(
+                                            self._compressor.compressRecord, link, status, headersList, body,
+                                            truncated, revisitOf)))
+
+            #Appends what is already compressed, but always the oldest one if nothing new came or too many are waiting
+            numToWaitFor = 0
+            if queuedRecord == False or len(compressingRecords) > BackgroundWarcSaver.MAX_COMPRESSING_RECORDS_PER_WRITER:
+                numToWaitFor = 1
+            self._appendCompressedRecords(compressingRecords, shardFiles, numToWaitFor)
+
+            #A busy writer never times out waiting for records, so the time is checked after each one too
+            if time.monotonic() >= nextFlushTime:
+                [shardFile.flush(sync=True) for _, shardFile in shardFiles.items()]
+                nextFlushTime = time.monotonic() + self._flushIntervalSeconds
+
+    def _appendCompressedRecords(self, compressingRecords:deque, shardFiles:dict, numToWaitFor:int):
+        """
+        Appends the oldest records whose compression is done, waiting for at least numToWaitFor of them
+        """
+        numAppended = 0
+        while len(compressingRecords) > 0 and (numAppended < numToWaitFor or compressingRecords[0][2].done()):
+            shardName, link, compressingRecord = compressingRecords.popleft()
+            numAppended += 1
+
+            if shardName not in shardFiles:
+                shardFiles[shardName] = WarcFile(shardName, self._firstWarcFileId, self._maxFileBytes)
+
+            try:
+                shardFiles[shardName].append(*compressingRecord.result())
+            except Exception as e:
+                self._numWriteErrors += 1
+                logging.info(f"Could not write the record of {link}: {e}")
+
+    def resumeAfter(self, warcFileId:int, numSavedPages:int):
+        """Must be called before any record is saved"""
+        self._firstWarcFileId = warcFileId + 1
+        self._numSavedPages = numSavedPages
+
+    def close(self):
+        if not self._started:
+            return
+
+        [writerQueue.put(None) for writerQueue in self._writersQueues]
+        [writerThread.join() for writerThread in self._writersThreads]
+        self._compressorsPool.shutdown()
+
+    def getStatsString(self) -> str:
+        return (f"BackgroundWarcSaver: {self._numSavedPages} records queued to {self._numWriters} writers "
+                f"sharded by {self._shardBy}, {self._numWriteErrors} could not be written. "
+                f"{self._compressor.getStatsString()} on {self._numCompressors} threads")
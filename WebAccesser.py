@@ -1,18 +1,361 @@
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+from urllib3.util.connection import allowed_gai_family
+from DnsCache import DnsCache
+from threading import Lock
 import datetime
 import logging
+import socket
+import time
+import zlib
 import urllib3
 import certifi
 import reppy
 import utils
 
-class WebAccesser():
+class FetchStats():
+    """
+    What fetching pages with a single streamed GET saved, compared to a HEAD before every GET
+    """
+
+    def __init__(self):
+        self._numGETRequests = 0
+        self._numHEADRequests = 0
+        #HEADs that would have been sent before the GET of a page that was read
+        self._numHEADRequestsAvoided = 0
+        self._headerBytesAvoided = 0
+        self._numBodiesRead = 0
+        #Decoded, and as they were sent, compressed or not
+        self._bodyBytesRead = 0
+        self._bodyBytesOnWire = 0
+        self._numBodiesCompressed = 0
+        #Bodies that were not HTML: drained to reuse the connection when small, otherwise the connection is closed
+        self._numBodiesDrained = 0
+        self._bodyBytesDrained = 0
+        self._numBodiesAborted = 0
+        #Bodies cut at the maximum size or download time
+        self._numBodiesTruncatedByLength = 0
+        self._numBodiesTruncatedByTime = 0
+        self._lock = Lock()
+
+    def countHEADRequest(self):
+        self._numHEADRequests += 1
+
+    def countGETRequest(self):
+        self._numGETRequests += 1
+
+    def countBodyRead(self, numBytes:int, headerBytes:int, headAvoided:bool, numBytesOnWire:int = None):
+        self._numBodiesRead += 1
+        self._bodyBytesRead += numBytes
+        if numBytesOnWire == None:
+            self._bodyBytesOnWire += numBytes
+        else:
+            self._bodyBytesOnWire += numBytesOnWire
+            self._numBodiesCompressed += 1
+        if headAvoided:
+            self._numHEADRequestsAvoided += 1
+            self._headerBytesAvoided += headerBytes
+
+    def countBodyDrained(self, numBytes:int):
+        self._numBodiesDrained += 1
+        self._bodyBytesDrained += numBytes
+
+    def countBodyAborted(self):
+        self._numBodiesAborted += 1
+
+    def countBodyTruncated(self, truncated:str):
+        if truncated == WebAccesser.TRUNCATED_BY_LENGTH:
+            self._numBodiesTruncatedByLength += 1
+        elif truncated == WebAccesser.TRUNCATED_BY_TIME:
+            self._numBodiesTruncatedByTime += 1
+
+    def add(self, otherStats):
+        self._lock.acquire()
+        for attributeName, value in vars(otherStats).items():
+            if attributeName != "_lock":
+                setattr(self, attributeName, getattr(self, attributeName) + value)
+        self._lock.release()
+
+    @staticmethod
+    def getHeaderBytes(status:int, headersList:list) -> int:
+        """The size of the status line and headers of a response, as they were on the wire"""
+        statusLineBytes = len(f"HTTP/1.1 {status} \r\n")
+        return statusLineBytes + sum([len(name) + len(value) + 4 for name, value in headersList]) + 2
+
+    def getStatsString(self, numPagesCrawled:int) -> str:
+        numPagesCrawled = max(1, numPagesCrawled)
+        numRequests = self._numGETRequests + self._numHEADRequests
+        return (f"Fetch: {numRequests} requests ({self._numHEADRequests} HEAD), "
+                f"{self._numHEADRequestsAvoided} HEAD requests avoided "
+                f"({self._numHEADRequestsAvoided / numPagesCrawled:.2f} per page crawled, "
+                f"{self._headerBytesAvoided / numPagesCrawled:.0f} header bytes per page), "
+                f"{self._numBodiesRead} bodies read ({self._bodyBytesOnWire} bytes on the wire decoded to "
+                f"{self._bodyBytesRead}, {self._numBodiesCompressed} bodies compressed), "
+                f"{self._numBodiesDrained} non HTML bodies drained ({self._bodyBytesDrained} bytes, "
+                f"{self._bodyBytesDrained / numPagesCrawled:.0f} per page crawled), "
+                f"{self._numBodiesAborted} aborted, {self._numBodiesTruncatedByLength} truncated at the maximum size "
+                f"and {self._numBodiesTruncatedByTime} at the maximum download time")
+
+class BodyDecoder():
+    """
+    Decodes the Content-Encoding of a body a chunk at a time. A chunk is decoded to at most the bytes asked for
+    and what is left of it is decoded with the next one, so a small compressed body can not be inflated
+    past the maximum size of a body. Only gzip and deflate are decoded, which are the encodings accepted
+    """
+
+    ENCODINGS = ("gzip", "x-gzip", "deflate")
+
+    def __init__(self, contentEncoding:str):
+        self._isGzip = contentEncoding != "deflate"
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if self._isGzip else zlib.MAX_WBITS)
+        #Some servers send deflate without its zlib header, which is only known from the first bytes
+        self._deflateHeaderChecked = self._isGzip
+        #A gzip body may have more members after the first one. Errors on them are ignored, as urllib3 does
+        self._onFirstMember = True
+        self._finished = False
+
+    @staticmethod
+    def forContentEncoding(contentEncoding:str):
+        """A BodyDecoder, or None if the body is not encoded or its encoding is not decoded"""
+        if contentEncoding == None:
+            return None
+
+        contentEncoding = contentEncoding.strip().lower()
+        return BodyDecoder(contentEncoding) if contentEncoding in BodyDecoder.ENCODINGS else None
+
+    def decode(self, data:bytes, maxBytes:int) -> bytes:
+        """
+        Up to maxBytes, at least 1, of what is left of the chunks before and of data.
+        Raises urllib3.exceptions.DecodeError
+        """
+        decoded = bytearray()
+        data = self._decompressor.unconsumed_tail + data
+        while not self._finished and len(data) > 0 and len(decoded) < maxBytes:
+            try:
+                decoded += self._decompressor.decompress(data, maxBytes - len(decoded))
+            except zlib.error as e:
+                if not self._deflateHeaderChecked:
+                    self._deflateHeaderChecked = True
+                    self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                    continue
+                if self._onFirstMember:
+                    raise urllib3.exceptions.DecodeError(f"Received a body with Content-Encoding that could not be "
+                                                            f"decoded: {e}") from e
+                self._finished = True
+                break
+
+            self._deflateHeaderChecked = True
+            data = self._decompressor.unconsumed_tail
+            if self._decompressor.eof:
+                data = self._decompressor.unused_data
+                if not self._isGzip:
+                    self._finished = True
+                elif len(data) > 0:
+                    self._onFirstMember = False
+                    self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        return bytes(decoded)
+
+def newConnectionWithDnsCache(connection, dnsCache:DnsCache) -> socket.socket:
+    """
+    What urllib3 does to open the socket of a connection, but with the addresses of its host on dnsCache
+    """
+    try:
+        addresses = dnsCache.getAddresses(connection._dns_host, allowed_gai_family())
+    except (socket.gaierror, UnicodeError) as e:
+        raise NewConnectionError(connection, f"Failed to establish a new connection: {e}")
+
+    lastError = None
+    for family, socketType, proto, _, sockaddr in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socketType, proto)
+            for socketOption in connection.socket_options or []:
+                sock.setsockopt(*socketOption)
+            if connection.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(connection.timeout)
+            if connection.source_address:
+                sock.bind(connection.source_address)
+            #The entries have no port, IPv6 ones also have the flow info and scope id
+            sock.connect((sockaddr[0], connection.port) + tuple(sockaddr[2:]))
+            return sock
+        except OSError as e:
+            lastError = e
+            if sock != None:
+                sock.close()
+
+    if isinstance(lastError, socket.timeout):
+        raise ConnectTimeoutError(connection, f"Connection to {connection.host} timed out. "
+                                                f"(connect timeout={connection.timeout})")
+    raise NewConnectionError(connection, f"Failed to establish a new connection: {lastError}")
 
-    REQ_HEADERS = {'User-Agent': "Mozilla/5.0 (platform; rv:geckoversion) Gecko/geckotrail Firefox/firefoxversion"}
+class ConnectionStats():
+    """
+    Of the connections of a CachedDnsPoolManager, shared by every worker that uses it
+    """
 
     def __init__(self):
-        self._poolManager = self._getCustomPoolManager()
+        self._numRequests = 0
+        self._numRequestsOnReusedConnections = 0
+        self._numConnectionsOpened = 0
+        self._connectSeconds = 0.0
+        self._numTlsHandshakes = 0
+        self._tlsHandshakeSeconds = 0.0
+        self._lock = Lock()
+
+    def countRequest(self, onReusedConnection:bool):
+        self._lock.acquire()
+        self._numRequests += 1
+        if onReusedConnection:
+            self._numRequestsOnReusedConnections += 1
+        self._lock.release()
+
+    def countConnectionOpened(self, connectSeconds:float):
+        self._lock.acquire()
+        self._numConnectionsOpened += 1
+        self._connectSeconds += connectSeconds
+        self._lock.release()
+
+    def countTlsHandshake(self, handshakeSeconds:float):
+        self._lock.acquire()
+        self._numTlsHandshakes += 1
+        self._tlsHandshakeSeconds += handshakeSeconds
+        self._lock.release()
+
+    def getStatsString(self) -> str:
+        numRequests = max(1, self._numRequests)
+        numConnectionsOpened = max(1, self._numConnectionsOpened)
+        numTlsHandshakes = max(1, self._numTlsHandshakes)
+        reuseRatio = self._numRequestsOnReusedConnections / numRequests
+        return (f"Connections: {self._numRequests} requests on {self._numConnectionsOpened} connections opened "
+                f"({reuseRatio:.2%} of the requests reused one), "
+                f"{self._connectSeconds / numConnectionsOpened * 1000:.1f}ms to connect on average, "
+                f"{self._numTlsHandshakes} TLS handshakes taking {self._tlsHandshakeSeconds:.2f}s "
+                f"({self._tlsHandshakeSeconds / numTlsHandshakes * 1000:.1f}ms on average)")
+
+class CachedDnsConnection():
+    """
+    Opens the socket of a urllib3 connection with the addresses of its host on a DnsCache, counting it
+    """
+
+    def __init__(self, *args, dnsCache:DnsCache = None, connectionStats:ConnectionStats = None, **kwargs):
+        self._dnsCache = DnsCache() if dnsCache == None else dnsCache
+        self._connectionStats = ConnectionStats() if connectionStats == None else connectionStats
+        self._connectSeconds = 0.0
+        #Requests sent since the socket was opened
+        self._numRequestsOnSocket = 0
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        connectStart = time.monotonic()
+        sock = newConnectionWithDnsCache(self, self._dnsCache)
+        self._connectSeconds = time.monotonic() - connectStart
+        self._numRequestsOnSocket = 0
+        self._connectionStats.countConnectionOpened(self._connectSeconds)
+        return sock
+
+    def request(self, *args, **kwargs):
+        #Without a socket, it is opened to send this request
+        onReusedConnection = self.sock != None and self._numRequestsOnSocket > 0
+        super().request(*args, **kwargs)
+        self._numRequestsOnSocket += 1
+        self._connectionStats.countRequest(onReusedConnection)
+
+class CachedDnsHTTPConnection(CachedDnsConnection, urllib3.connection.HTTPConnection):
+    pass
+
+class CachedDnsHTTPSConnection(CachedDnsConnection, urllib3.connection.HTTPSConnection):
+    def connect(self):
+        connectStart = time.monotonic()
+        super().connect()
+        #What is left after opening the socket is the handshake
+        self._connectionStats.countTlsHandshake(time.monotonic() - connectStart - self._connectSeconds)
+
+class CachedDnsPoolManager(urllib3.PoolManager):
+    """
+    A PoolManager whose connections take the addresses of their hosts from a DnsCache.
+    The certificate is still checked against the name of the host. One is shared by every
+    worker of the process, for pages, HEADs and robots, so connections are reused when hosts
+    move between workers
+    """
+
+    def __init__(self, dnsCache:DnsCache, keepAlive:bool = True, **connectionPoolKw):
+        super().__init__(**connectionPoolKw)
+        self._dnsCache = dnsCache
+        #Without it, every request asks the server to close the connection after the response
+        self._keepAlive = keepAlive
+        self._connectionStats = ConnectionStats()
+
+    @property
+    def connectionStats(self) -> ConnectionStats:
+        return self._connectionStats
+
+    @connectionStats.setter
+    def connectionStats(self, newConnectionStats):
+        raise AttributeError("connectionStats is not writable")
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context)
+        pool.ConnectionCls = CachedDnsHTTPSConnection if scheme == "https" else CachedDnsHTTPConnection
+        pool.conn_kw['dnsCache'] = self._dnsCache
+        pool.conn_kw['connectionStats'] = self._connectionStats
+        return pool
+
+    def urlopen(self, method, url, redirect=True, **kw):
+        if not self._keepAlive:
+            kw['headers'] = dict(kw.get('headers') or self.headers, Connection="close")
+        return super().urlopen(method, url, redirect, **kw)
+
+class WebAccesser():
+
+    #The encodings a BodyDecoder decodes
+    REQ_HEADERS = {'User-Agent': "Mozilla/5.0 (platform; rv:geckoversion) Gecko/geckotrail Firefox/firefoxversion",
+                    'Accept-Encoding': "gzip, deflate"}
+
+    MAX_TIME_REQ_FOR_ROBOTS = 10.0
+    ROBOTS_DISALLOW_ALL = "User-agent: *\nDisallow: /\n"
+    ROBOTS_ALLOW_ALL = ""
+
+    #Non HTML bodies up to this size are read anyway, so the connection can be reused
+    MAX_BODY_BYTES_TO_DRAIN = 64 * 1024
+    #Like the 304 of a conditional GET, whose connection is always reused
+    STATUSES_WITHOUT_BODY = (204, 304)
+
+    #Bodies are read a chunk at a time, up to a size and a time since the request was sent.
+    #What was read until then is kept, flagged with why it was truncated, as WARC-Truncated does
+    MAX_BODY_BYTES = 10 * 1024 * 1024
+    MAX_DOWNLOAD_SECONDS = 30
+    MAX_ROBOTS_BYTES = 512 * 1024
+    BODY_CHUNK_BYTES = 64 * 1024
+    TRUNCATED_BY_LENGTH = "length"
+    TRUNCATED_BY_TIME = "time"
+    #The buffers bodies are read into are kept between requests, unless a body made them larger than this
+    MAX_KEPT_BUFFER_BYTES = 1024 * 1024
+
+    #Hosts whose connections are kept. The least recently used one has its connections closed
+    NUM_POOLS = 1024
+    #Connections kept per host. More may be opened at once, but they are closed after their response
+    MAX_CONNECTIONS_PER_HOST = 2
+
+    def __init__(self, dnsCache:DnsCache = None, poolManager:CachedDnsPoolManager = None, maxBodyBytes:int = None,
+                    maxDownloadSeconds:float = None):
+        #Usually shared by every worker of the process, with the DnsCache it was made with
+        self._poolManager = WebAccesser.newPoolManager(dnsCache) if poolManager == None else poolManager
+        self._maxBodyBytes = WebAccesser.MAX_BODY_BYTES if maxBodyBytes == None else maxBodyBytes
+        self._maxDownloadSeconds = WebAccesser.MAX_DOWNLOAD_SECONDS if maxDownloadSeconds == None else maxDownloadSeconds
+        #Decoded, to be parsed, and as sent by the server, to be archived
+        self._bodyBuffer = bytearray()
+        self._rawBodyBuffer = bytearray()
         self._lastResponse = None
+        self._lastResponseBody = None
+        self._lastResponseRawBody = None
+        self._lastResponseTruncated = None
+        #Spent decoding the Content-Encoding of the body, None if it was not compressed or not read
+        self._lastResponseDecodeSeconds = None
         self._lastRequestTimestamp = 0.0
+        #Until the status and headers of the response arrived
+        self._lastRequestSeconds = 0.0
+        self._lastRequestStart = 0.0
+        self._fetchStats = FetchStats()
         logging.getLogger("urllib3").setLevel(logging.CRITICAL)
     
     @property
@@ -31,6 +374,39 @@ class WebAccesser():
     def lastRequestTimestamp(self, newLastRequestTimestamp):
         raise AttributeError("lastRequestTimestamp is not directly writable")
     
+    @property
+    def lastResponseTruncated(self) -> str:
+        """Why the body of the last response was truncated, or None if it was read whole"""
+        return self._lastResponseTruncated
+    
+    @lastResponseTruncated.setter
+    def lastResponseTruncated(self, newLastResponseTruncated):
+        raise AttributeError("lastResponseTruncated is not directly writable")
+    
+    @property
+    def lastResponseDecodeSeconds(self) -> float:
+        return self._lastResponseDecodeSeconds
+    
+    @lastResponseDecodeSeconds.setter
+    def lastResponseDecodeSeconds(self, newLastResponseDecodeSeconds):
+        raise AttributeError("lastResponseDecodeSeconds is not directly writable")
+    
+    @property
+    def lastRequestSeconds(self) -> float:
+        return self._lastRequestSeconds
+    
+    @lastRequestSeconds.setter
+    def lastRequestSeconds(self, newLastRequestSeconds):
+        raise AttributeError("lastRequestSeconds is not directly writable")
+    
+    @property
+    def fetchStats(self) -> FetchStats:
+        return self._fetchStats
+    
+    @fetchStats.setter
+    def fetchStats(self, newFetchStats):
+        raise AttributeError("fetchStats is not directly writable")
+    
     @property
     def lastResponse(self) -> urllib3.response.HTTPResponse:
         return self._lastResponse
@@ -39,9 +415,16 @@ class WebAccesser():
     def lastResponse(self, newPool):
         raise AttributeError("lastResponse is not directly writable")
 
-    def _getCustomPoolManager(self):
+    @staticmethod
+    def newPoolManager(dnsCache:DnsCache = None, numPools:int = None, maxConnectionsPerHost:int = None,
+                        keepAlive:bool = True) -> CachedDnsPoolManager:
         timeout = urllib3.util.Timeout(connect=2.0, read=3.0)
-        return urllib3.PoolManager(
+        return CachedDnsPoolManager(
+                                    DnsCache() if dnsCache == None else dnsCache,
+                                    keepAlive,
+                                    num_pools=WebAccesser.NUM_POOLS if numPools == None else numPools,
+                                    maxsize=(WebAccesser.MAX_CONNECTIONS_PER_HOST if maxConnectionsPerHost == None
+                                                else maxConnectionsPerHost),
                                     retries=False,
                                     cert_reqs='CERT_REQUIRED',
                                     ca_certs=certifi.where(),
@@ -49,6 +432,20 @@ class WebAccesser():
                                 )
     
     def getRobotsOf(self, url:str) -> reppy.Robots:
+        robotsUrlAndContent = self.getRobotsContentOf(url)
+
+        if robotsUrlAndContent == None:
+            return None
+        
+        robotsUrl, content = robotsUrlAndContent
+        return WebAccesser.parseRobots(robotsUrl, content)
+    
+    def getRobotsContentOf(self, url:str) -> tuple:
+        """
+        Returns the robots url of the host of url and the content that should be parsed for it,
+        following the same rules of reppy.Robots.fetch, or None if it could not be accessed.
+        The content is kept so the robots can be rebuilt without fetching them again
+        """
         try:
             url = utils.normalizeLinkIfCan(url)
         except:
@@ -59,32 +456,213 @@ class WebAccesser():
         except:
             return None
 
-        hostRobots = None
-        MAX_TIME_REQ_FOR_ROBOTS = 10.0
         try:
-            hostRobots = reppy.Robots.fetch(hostRobotsPath, 
-                                            timeout=MAX_TIME_REQ_FOR_ROBOTS,
-                                            headers=WebAccesser.REQ_HEADERS)
+            requestStart = time.monotonic()
+            response = self._poolManager.request('GET', hostRobotsPath, headers=WebAccesser.REQ_HEADERS,
+                                                    timeout=urllib3.util.Timeout(total=WebAccesser.MAX_TIME_REQ_FOR_ROBOTS),
+                                                    retries=urllib3.util.Retry(total=5, connect=0, read=0, redirect=5,
+                                                                                raise_on_redirect=False),
+                                                    preload_content=False)
+            try:
+                content, _, _, _ = self._readBody(response, WebAccesser.MAX_ROBOTS_BYTES,
+                                               requestStart + WebAccesser.MAX_TIME_REQ_FOR_ROBOTS)
+            finally:
+                response.release_conn()
         except:
-            hostRobots = None
+            return None
         
-        return hostRobots
+        return WebAccesser.getRobotsUrlAndContentForStatus(hostRobotsPath, response.status,
+                                                            content.decode('utf-8', errors='replace'))
+    
+    @staticmethod
+    def getRobotsUrlAndContentForStatus(robotsUrl:str, status:int, content:str) -> tuple:
+        if status >= 200 and status < 300:
+            return robotsUrl, content
+        elif status in [401, 403]:
+            return robotsUrl, WebAccesser.ROBOTS_DISALLOW_ALL
+        elif status >= 400 and status < 500:
+            return robotsUrl, WebAccesser.ROBOTS_ALLOW_ALL
+        else:
+            return None
+    
+    @staticmethod
+    def parseRobots(robotsUrl:str, content:str) -> reppy.Robots:
+        try:
+            return reppy.Robots.parse(robotsUrl, content)
+        except:
+            return None
 
-    def GETRequest(self, link:str):
-        self._doRequest('GET', link)
+    def GETRequest(self, link:str, extraHeaders:dict = None):
+        self._fetchStats.countGETRequest()
+        self._doRequest('GET', link, extraHeaders)
+        try:
+            self._readBodyOfLastResponse()
+        finally:
+            self._lastResponse.release_conn()
+        self._countBodyOfLastResponseRead(0, False)
     
     def HEADRequest(self, link:str):
+        self._fetchStats.countHEADRequest()
         self._doRequest('HEAD', link)
+        self._lastResponse.release_conn()
     
-    def _doRequest(self, reqType:str, link:str):
+    def GETRequestIfHtml(self, link:str, extraHeaders:dict = None):
+        """
+        A single GET instead of a HEAD and a GET: the status and Content-Type are checked
+        as soon as the headers arrive and the body is only read if it is a successful HTML page.
+        extraHeaders are sent with the usual ones, like the ones of a conditional GET
+        """
+        self._fetchStats.countGETRequest()
+        self._doRequest('GET', link, extraHeaders)
+        response = self._lastResponse
+
+        try:
+            if self.lastRequestSuccess() and self.lastResponseHasTextHtmlContent():
+                self._readBodyOfLastResponse()
+                headerBytes = FetchStats.getHeaderBytes(response.status, list(response.headers.items()))
+                self._countBodyOfLastResponseRead(headerBytes, True)
+            else:
+                self._skipBodyOfLastResponse()
+        finally:
+            response.release_conn()
+    
+    def _skipBodyOfLastResponse(self):
+        response = self._lastResponse
+        try:
+            contentLength = int(response.getheader('content-length', ""))
+        except ValueError:
+            contentLength = None
+        if response.status in WebAccesser.STATUSES_WITHOUT_BODY:
+            contentLength = 0
+
+        if contentLength != None and contentLength <= WebAccesser.MAX_BODY_BYTES_TO_DRAIN:
+            response.drain_conn()
+            self._fetchStats.countBodyDrained(contentLength)
+        else:
+            response.close()
+            self._fetchStats.countBodyAborted()
+    
+    def _readBodyOfLastResponse(self):
+        (self._lastResponseBody, self._lastResponseRawBody, self._lastResponseTruncated,
+            self._lastResponseDecodeSeconds) = self._readBody(
+                                    self._lastResponse, self._maxBodyBytes, self._lastRequestStart + self._maxDownloadSeconds)
+        self._fetchStats.countBodyTruncated(self._lastResponseTruncated)
+    
+    def _countBodyOfLastResponseRead(self, headerBytes:int, headAvoided:bool):
+        numBytesOnWire = None
+        if self._lastResponseRawBody is not self._lastResponseBody:
+            numBytesOnWire = len(self._lastResponseRawBody)
+        self._fetchStats.countBodyRead(len(self._lastResponseBody), headerBytes, headAvoided, numBytesOnWire)
+    
+    def _readBody(self, response:urllib3.response.HTTPResponse, maxBytes:int, deadline:float) -> tuple:
+        """
+        Reads the body of a response not preloaded, into the buffers of this WebAccesser. Returns the body decoded,
+        the body as it was sent, which is the same object when it was not compressed, why it was truncated,
+        or None if it was read whole, and the seconds spent decoding it, or None if it was not compressed.
+        Both bodies are cut at maxBytes. A truncated response has its connection closed
+        """
+        numBytesRead = 0
+        numRawBytesRead = 0
+        truncated = None
+        decodeSeconds = 0.0
+        decoder = BodyDecoder.forContentEncoding(response.getheader('content-encoding'))
+        isCompressed = decoder != None
+
+        #urllib3 2 has read1, which returns what has arrived. Otherwise a read waits for a whole chunk, so the time
+        #is checked between chunks and the socket waits at most until the deadline for each part of one
+        readChunk = response.read1 if hasattr(response, 'read1') else response.read
+        connection = response.connection
+        readTimeout = None if connection == None or connection.sock == None else connection.sock.gettimeout()
+        while truncated == None:
+            secondsLeft = deadline - time.monotonic()
+            if secondsLeft <= 0 and not response.isclosed():
+                truncated = WebAccesser.TRUNCATED_BY_TIME
+                break
+            if connection != None and connection.sock != None:
+                connection.sock.settimeout(max(0.001, secondsLeft if readTimeout == None else min(secondsLeft, readTimeout)))
+
+            try:
+                rawChunk = readChunk(WebAccesser.BODY_CHUNK_BYTES, decode_content=False)
+            except urllib3.exceptions.ReadTimeoutError:
+                if time.monotonic() < deadline:
+                    raise
+                truncated = WebAccesser.TRUNCATED_BY_TIME
+                break
+
+            chunk = rawChunk
+            if isCompressed:
+                decodeStart = time.monotonic()
+                #One more byte than fits tells the body was longer
+                chunk = decoder.decode(rawChunk, maxBytes - numBytesRead + 1)
+                decodeSeconds += time.monotonic() - decodeStart
+                self._rawBodyBuffer[numRawBytesRead:numRawBytesRead + len(rawChunk)] = rawChunk
+                numRawBytesRead += len(rawChunk)
+            self._bodyBuffer[numBytesRead:numBytesRead + len(chunk)] = chunk
+            numBytesRead += len(chunk)
+
+            if len(rawChunk) == 0:
+                break
+            if numBytesRead > maxBytes or numRawBytesRead > maxBytes:
+                numBytesRead = min(numBytesRead, maxBytes)
+                numRawBytesRead = min(numRawBytesRead, maxBytes)
+                truncated = WebAccesser.TRUNCATED_BY_LENGTH
+        if truncated != None:
+            response.close()
+
+        body = bytes(memoryview(self._bodyBuffer)[:numBytesRead])
+        rawBody = bytes(memoryview(self._rawBodyBuffer)[:numRawBytesRead]) if isCompressed else body
+        if len(self._bodyBuffer) > WebAccesser.MAX_KEPT_BUFFER_BYTES:
+            self._bodyBuffer = bytearray()
+        if len(self._rawBodyBuffer) > WebAccesser.MAX_KEPT_BUFFER_BYTES:
+            self._rawBodyBuffer = bytearray()
+        return body, rawBody, truncated, decodeSeconds if isCompressed else None
+    
+    @staticmethod
+    def decodeBody(rawBody:bytes, contentEncoding:str, maxBytes:int = None) -> bytes:
+        """
+        A body as it was sent with the Content-Encoding, decoded and cut at maxBytes.
+        Encodings that are not decoded, like identity, are left as they are. Raises urllib3.exceptions.DecodeError
+        """
+        decoder = BodyDecoder.forContentEncoding(contentEncoding)
+        if decoder == None:
+            return rawBody
+        return decoder.decode(rawBody, WebAccesser.MAX_BODY_BYTES if maxBytes == None else maxBytes)
+    
+    def _doRequest(self, reqType:str, link:str, extraHeaders:dict = None):
         now = datetime.datetime.now()
         self._lastRequestTimestamp = datetime.datetime.timestamp(now)
-        self._lastResponse = self._poolManager.request(reqType, link, headers=WebAccesser.REQ_HEADERS)
+        self._lastRequestStart = time.monotonic()
+        self._lastResponseBody = None
+        self._lastResponseRawBody = None
+        self._lastResponseTruncated = None
+        self._lastResponseDecodeSeconds = None
+        #Never preloaded, so the body is read up to the maximum size and download time
+        headers = WebAccesser.REQ_HEADERS if extraHeaders == None else {**WebAccesser.REQ_HEADERS, **extraHeaders}
+        self._lastResponse = self._poolManager.request(reqType, link, headers=headers, preload_content=False)
+        self._lastRequestSeconds = time.monotonic() - self._lastRequestStart
     
     def lastResponseTextBytes(self) -> bytes:
-        if self._lastResponse != None:
-            return self._lastResponse.data
-        else:
+        return self._lastResponseBody
+    
+    def lastResponseRawBytes(self) -> bytes:
+        """The body as the server sent it, compressed if it was, to be archived with the headers of the response"""
+        return self._lastResponseRawBody
+    
+    def lastResponseRetryAfterSeconds(self) -> float:
+        if self._lastResponse == None:
+            return None
+        return WebAccesser.parseRetryAfterSeconds(self._lastResponse.getheader('retry-after'))
+    
+    @staticmethod
+    def parseRetryAfterSeconds(retryAfter:str) -> float:
+        """
+        The seconds of a Retry-After header, given in seconds or as a date. None if there is none or it is invalid
+        """
+        if retryAfter == None:
+            return None
+        try:
+            return urllib3.util.Retry(0).parse_retry_after(retryAfter)
+        except urllib3.exceptions.InvalidHeader:
             return None
     
     def lastRequestSuccess(self) -> bool:
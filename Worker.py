@@ -1,9 +1,12 @@
 from urllib3.exceptions import NewConnectionError, TimeoutError, MaxRetryError
 from WorkersPipeline import WorkersPipeline
-from WebAccesser import WebAccesser
-from queue import PriorityQueue
-from bs4 import BeautifulSoup
-import datetime
+from WebAccesser import WebAccesser, CachedDnsPoolManager
+from HostsScheduler import HostsScheduler
+from PolitenessGroups import PolitenessGroups
+from RecrawlIndex import RecrawlIndex
+from DnsCache import DnsCache
+from Metrics import CrawlMetrics
+from Url import Url
 import logging
 import Parser
 import utils
@@ -35,30 +38,50 @@ class Worker():
     This is a worker that effectively crawls web pages
     """
 
-    MAXPRIORITYFORHOST = 0
     REQ_HEADERS = {'User-Agent': "Mozilla/5.0 (platform; rv:geckoversion) Gecko/geckotrail Firefox/firefoxversion"}
     
-    def __init__(self, id):
+    def __init__(self, id, seenStore = None, frontierFactory = None, robotsCache = None, singleGET:bool = True,
+                    dnsCache:DnsCache = None, politenessGroups:PolitenessGroups = None,
+                    poolManager:CachedDnsPoolManager = None, maxBodyBytes:int = None, maxDownloadSeconds:float = None,
+                    recrawlIndex:RecrawlIndex = None, metrics:CrawlMetrics = None):
         #Worker Id
         self._id = id
 
         #Communicator between workers
         self._workersPipeline = WorkersPipeline({}, 0)
 
-        #Next host to request from
-        self._hostsQueue = PriorityQueue()
-        self._currMinDelay = float("inf")
-        self._currMaxDelay = 0.0
-        self._firstAddToHostsQueue = True
-
-        #Set of hosts currently on the _hostsQueue
-        self._hostsOnQueue = set()
+        #Hosts with resources to crawl, by the time each one may be requested next
+        self._hostsScheduler = HostsScheduler()
+        #Time spent waiting with hosts to crawl, because none of them could be requested yet
+        self._politenessIdleSeconds = 0.0
+        self._numPolitenessWaits = 0
+        #HEADs and GETs sent to hosts, failed or not, so a politeness group only waits after a request
+        self._numRequestsMadeToHosts = 0
 
         #All hosts discovered with their policies
-        self._hostsInfo = Host.HostsInfo()
-
-        #For Web access
-        self._webAccess = WebAccesser()
+        self._hostsInfo = Host.HostsInfo(seenStore, frontierFactory, robotsCache)
+        #Resources on the queues of every host of this worker, published so idle workers can ask for hosts
+        self._numPendingResources = 0
+        #Of the hosts of this process, the last time this worker sent away the ones it lost
+        self._hostsAssignmentVersion = 0
+
+        #For Web access. The DnsCache, the pool manager and the PolitenessGroups are shared by every worker of the process
+        dnsCache = DnsCache() if dnsCache == None else dnsCache
+        self._webAccess = WebAccesser(dnsCache, poolManager, maxBodyBytes, maxDownloadSeconds)
+        self._politenessGroups = PolitenessGroups(None, dnsCache) if politenessGroups == None else politenessGroups
+        #Whether a page is fetched with a single streamed GET instead of a HEAD and a GET
+        self._singleGET = singleGET
+        #Of the previous crawl, when recrawling it, shared by every worker
+        self._recrawlIndex = recrawlIndex
+        #Latencies of each stage of a page and depths of the queues, shared by every worker of the process
+        self._metrics = CrawlMetrics() if metrics == None else metrics
+
+        #Pages this worker saved, so a checkpoint knows how many pages its state accounts for
+        self._numPagesSaved = 0
+
+        #Saves this worker state when a checkpoint is requested
+        self._checkpointer = None
+        self._checkpointedGeneration = 0
     
     @property
     def id(self) -> int:
@@ -84,6 +107,23 @@ class Worker():
     def workersPipeline(self, newWorkersPipeline: WorkersPipeline):
         self._workersPipeline = newWorkersPipeline
 
+    @property
+    def checkpointer(self):
+        raise AttributeError("checkpointer is not readable")
+    
+    @checkpointer.setter
+    def checkpointer(self, newCheckpointer):
+        self._checkpointer = newCheckpointer
+        self._checkpointedGeneration = newCheckpointer.generation
+
+    @property
+    def numPagesSaved(self) -> int:
+        return self._numPagesSaved
+    
+    @numPagesSaved.setter
+    def numPagesSaved(self, newNumPagesSaved):
+        raise AttributeError("numPagesSaved is not writable")
+
     @property
     def hostsQueue(self):
         raise AttributeError("hostsQueue is not readable")
@@ -104,52 +144,39 @@ class Worker():
         for link in links:
             self.addLinkToRequest(link)
 
-    def addLinkToRequest(self, newLink:str):
-        hostWithSchema, resources = utils.getHostWithSchemaAndResourcesFromLink(newLink)
-
-        if not self._hostsInfo.alreadyCrawled(hostWithSchema, resources):
+    def addLinkToRequest(self, newLink):
+        """
+        newLink is a Url or a link string, which is normalized here
+        """
+        url = Url.of(newLink)
+        hostWithSchema = url.hostWithSchema
+
+        #The host was given to another worker after the link was sent here
+        ownerId = self._workersPipeline.workerOfHost(hostWithSchema, url.hostHash)
+        if ownerId != self._id:
+            self._workersPipeline.sendLinksToProperWorkers({ownerId: [url]}, self._id)
+            return
+
+        #Marked when enqueued, so it is not enqueued again while it waits to be crawled
+        if self._hostsInfo.markUrlAsSeen(url):
             
-            firstTimeHost = False
-            if not self._hostsInfo.hostExists(hostWithSchema):
-                firstTimeHost = True
-                self._hostsInfo.createInfoForHostIfNotExists(hostWithSchema)
-
-            self._putResourceIntoResourcesQueueOfHost(hostWithSchema, resources)
-
-            if firstTimeHost or hostWithSchema not in self._hostsOnQueue:
-                if firstTimeHost:
-                    if self._firstAddToHostsQueue:
-                        self._firstAddToHostsQueue = False
-                        self._addHostWithMaxPriorityToRequest(hostWithSchema)
-                    else:
-                        self._addHostWithMediumPriorityToRequest(hostWithSchema)
-                        
-                else:
-                    hostInfo = self._hostsInfo.getHostInfo(hostWithSchema)
-                    nextAllowedReqMinTimestamp = hostInfo.nextRequestAllowedTimestampFromNow()
+            self._hostsInfo.createInfoForHostIfNotExists(hostWithSchema)
+            self._putResourceIntoResourcesQueueOfHost(hostWithSchema, url.resource)
 
-                    if nextAllowedReqMinTimestamp > self._currMaxDelay:
-                        self._currMaxDelay = nextAllowedReqMinTimestamp
-
-                    self._addHostToRequest(hostWithSchema, hostInfo.nextRequestAllowedTimestampFromNow())
+            #A new host is ready right away, one already requested when its delay is over
+            self._addHostToRequest(self._hostsInfo.getHostInfo(hostWithSchema))
     
     def _putResourceIntoResourcesQueueOfHost(self, host:str, resource:str):
         hostInfo = self._hostsInfo.getHostInfo(host)
         hostInfo.addResource(resource)
+        self._addPendingResources(1)
     
-    def _addHostWithMaxPriorityToRequest(self, host:str):
-        self._addHostToRequest(host, Worker.MAXPRIORITYFORHOST)
-    
-    def _addHostWithMediumPriorityToRequest(self, host:str):
-        hostMediumPriority = (self._currMaxDelay - self._currMinDelay) / 2
-        if hostMediumPriority < 0:
-            hostMediumPriority = 0
-        self._addHostToRequest(host, hostMediumPriority)
+    def _addPendingResources(self, numResources:int):
+        self._numPendingResources += numResources
+        self._workersPipeline.setNumPendingResourcesOf(self._id, self._numPendingResources)
     
-    def _addHostToRequest(self, host:str, priority:int):
-        if host not in self._hostsOnQueue:
-            self._hostsOnQueue.add(host)
-            self._hostsQueue.put((priority, host))
+    def _addHostToRequest(self, hostInfo:Host.HostInfo):
+        self._hostsScheduler.addHost(hostInfo.hostNameWithSchema, hostInfo.nextRequestAllowedTime)
 
     def crawl(self):
 
@@ -157,6 +184,8 @@ class Worker():
 
         while not allWorkersFinished:
 
+            self._checkpointIfRequested()
+
             self._crawlUntilItCan()
             
             self._workersPipeline.waitForLinkOrAllDoneEvent(self._id)
@@ -169,6 +198,9 @@ class Worker():
         
         self._workersPipeline.setSaiu(self._id)
         self._workersPipeline.addResourcesPerHost(self._hostsInfo.getCrawledResourcesPerHostDict())
+        self._workersPipeline.addDelaySecondsPerHost(self._hostsInfo.getDelaySecondsPerHost())
+        self._workersPipeline.addFetchStats(self._webAccess.fetchStats)
+        self._workersPipeline.addPolitenessIdleTime(self._id, self._politenessIdleSeconds, self._numPolitenessWaits)
         logging.info(f"NAO SAIRAM:\n{self._workersPipeline.getNaoSairam()}")
 
     def _crawlUntilItCan(self):
@@ -177,63 +209,87 @@ class Worker():
         CHECK_FOR_OTHER_LINKS_EVERY_NUM_REQUESTS = 15
 
         while self._hasLinkToRequest() and not self._workersPipeline.allDone:
-            
-            completeLink, minTimestampToReq = self._getNextLinkAndMinTimestampToRequest()
-
-            if minTimestampToReq < self._currMinDelay:
-                self._currMinDelay = minTimestampToReq
-            
-            currHostWithSchema = utils.getHostWithSchemaOfLink(completeLink)
-            hostInfo = self._hostsInfo.getHostInfo(currHostWithSchema)
 
-            self._requestForRobotsOfHostIfNecessary(hostInfo)
+            self._checkpointIfRequested()
 
-            if self._shouldAccessPage(completeLink, hostInfo):
-                
-                self._waitMinDelayIfNecessary(minTimestampToReq)
-
-                self._accessPageAndGetLinks(completeLink, hostInfo)
-
-                if not hostInfo.emptyOfResources():
-                    self._addHostToRequest(hostInfo.hostNameWithSchema, hostInfo.nextRequestAllowedTimestampFromNow())
-            else:
-                pass
-
-            hostInfo.markResourceAsCrawled(utils.getResourcesFromLink(completeLink))
+            self._giveHostsIfRequested()
+            self._sendAwayHostsOfOtherProcessesIfReassigned()
+            if not self._hasLinkToRequest():
+                break
+            
+            nextHost = self._hostsScheduler.popReadyHost()
+            if nextHost == None:
+                self._waitForReadyHostOrReceivedLinks()
+                self._tryToCompleteWithReceivedLinks()
+                shouldCheckForOtherLinksCount = 0
+                continue
+
+            politenessGroup = self._politenessGroups.groupOf(nextHost)
+            groupRetryTime = self._politenessGroups.tryToStartRequest(politenessGroup)
+            if groupRetryTime != None:
+                #Another host on the same server was requested too recently
+                self._hostsScheduler.addHost(nextHost, groupRetryTime)
+                continue
+
+            resource = self._getNextResourceToRequestOfHost(nextHost)
+            completeLink = utils.getCompleteLinkFromHostAndResource(nextHost, resource)
+            hostInfo = self._hostsInfo.getHostInfo(nextHost)
+            self._metrics.observeHostFrontierDepth(hostInfo.numResources())
+
+            numRequestsMadeBefore = self._numRequestsMadeToHosts
+            robotsRequested = False
+            try:
+                robotsRequested = self._requestForRobotsOfHostIfNecessary(hostInfo)
+
+                if self._shouldAccessPage(completeLink, hostInfo):
+                    self._accessPageAndGetLinks(completeLink, hostInfo)
+            finally:
+                #The group is never left taken, and only waits for the delay if its server was requested
+                requestMade = robotsRequested or self._numRequestsMadeToHosts > numRequestsMadeBefore
+                self._politenessGroups.finishRequest(politenessGroup, hostInfo.requestDelaySeconds() if requestMade else 0.0)
+
+            hostInfo.markResourceAsCrawled(resource)
+
+            #Also when the page was not accessed, so the other resources of the host are not left behind
+            if not hostInfo.emptyOfResources():
+                self._addHostToRequest(hostInfo)
             shouldCheckForOtherLinksCount+=1
 
             if shouldCheckForOtherLinksCount == CHECK_FOR_OTHER_LINKS_EVERY_NUM_REQUESTS:
                 self._tryToCompleteWithReceivedLinks()
                 shouldCheckForOtherLinksCount = 0
 
-    def _waitMinDelayIfNecessary(self, minTimestampToReq):
-        now = datetime.datetime.now()
-        minTimeToWait = datetime.datetime.fromtimestamp(minTimestampToReq)
-
-        if minTimeToWait > now:
-            
-            timeDiff = minTimeToWait - now
-            time.sleep(timeDiff.total_seconds())
+    def _waitForReadyHostOrReceivedLinks(self):
+        """
+        None of the hosts of this worker may be requested yet. Links received meanwhile may be
+        of new hosts, which are ready right away, so the wait ends when they come
+        """
+        waitStart = time.monotonic()
+        self._workersPipeline.waitForLinkOrTimeout(self._id, self._hostsScheduler.secondsUntilNextReady())
+        waitSeconds = time.monotonic() - waitStart
+        self._politenessIdleSeconds += waitSeconds
+        self._numPolitenessWaits += 1
+        self._metrics.observeStage(CrawlMetrics.POLITENESS, waitSeconds)
     
     def _hasLinkToRequest(self) -> bool:
-        return not self._hostsQueue.empty()
+        return not self._hostsScheduler.isEmpty()
     
-    def _getNextLinkAndMinTimestampToRequest(self):
-        minTimestamp, nextHost = self._getNextHostToRequest()
-        nextHostResource = self._getNextResourceToRequestOfHost(nextHost)
-        completeLink = utils.getCompleteLinkFromHostAndResource(nextHost, nextHostResource)
-        return completeLink, minTimestamp
-    
-    def _getNextHostToRequest(self) -> str:
-        return self._hostsQueue.get()
-
     def _getNextResourceToRequestOfHost(self, host:str) -> str:
         hostInfo = self._hostsInfo.getHostInfo(host)
-        return hostInfo.getNextResource()
+        nextResource = hostInfo.getNextResource()
+        if nextResource != None:
+            self._addPendingResources(-1)
+        return nextResource
+
+    def _requestForRobotsOfHostIfNecessary(self, hostInfo:Host.HostInfo) -> bool:
+        """Whether the robots were requested to the host"""
+        if hostInfo.hasRobots():
+            return False
 
-    def _requestForRobotsOfHostIfNecessary(self, hostInfo:Host.HostInfo):
-        if not hostInfo.hasRobots():
-            hostInfo.tryFirstAccessToRobots(self._webAccess)
+        robotsStart = time.monotonic()
+        robotsRequested = hostInfo.tryFirstAccessToRobots(self._webAccess)
+        self._metrics.observeStage(CrawlMetrics.ROBOTS, time.monotonic() - robotsStart)
+        return robotsRequested
     
     def _shouldAccessPage(self, completeLink:str, hostInfo:Host.HostInfo) -> bool:
 
@@ -242,11 +298,19 @@ class Worker():
 
         if not allowed or not passHeuristics:
             return False
+        elif self._singleGET:
+            #The Content-Type is checked on the GET itself
+            return True
+        requestStart = time.monotonic()
         try:
             self._webAccess.HEADRequest(completeLink)
-        except:
+        except Exception as e:
+            self._metrics.count(CrawlMetrics.REQUEST_ERRORS)
+            self._markRequestMadeToHost(hostInfo, e)
             return False
         else:
+            self._metrics.observeStage(CrawlMetrics.HEAD, time.monotonic() - requestStart)
+            self._markRequestMadeToHost(hostInfo)
             if self._webAccess.lastResponseHasTextHtmlContent():
                 return True
             else:
@@ -254,32 +318,97 @@ class Worker():
 
     def _accessPageAndGetLinks(self, requestLink:str, hostInfo:Host.HostInfo):
         currHostWithSchema = hostInfo.hostNameWithSchema
+        conditionalHeaders = None
+        if self._recrawlIndex != None:
+            conditionalHeaders = self._recrawlIndex.getConditionalHeadersOf(requestLink)
 
+        requestStart = time.monotonic()
         try:
-            self._webAccess.GETRequest(requestLink)
+            if self._singleGET:
+                self._webAccess.GETRequestIfHtml(requestLink, conditionalHeaders)
+            else:
+                self._webAccess.GETRequest(requestLink, conditionalHeaders)
 
         except Exception as e:
-            pass
+            self._metrics.count(CrawlMetrics.REQUEST_ERRORS)
+            self._markRequestMadeToHost(hostInfo, e)
         else:
+            self._metrics.observeStage(CrawlMetrics.GET, time.monotonic() - requestStart)
+            self._markRequestMadeToHost(hostInfo)
+            #Of the Content-Encoding. Observed with the decoding of the charset of the page when it is parsed
+            decompressSeconds = self._webAccess.lastResponseDecodeSeconds
+
+            if self._saveRevisitIfUnchanged(requestLink):
+                if decompressSeconds != None:
+                    self._metrics.observeStage(CrawlMetrics.DECODE, decompressSeconds)
+                #Its links were already followed on the previous crawl
+                return
 
             if self._webAccess.lastRequestSuccess() and self._webAccess.lastResponseHasTextHtmlContent():
                 
-                parsedHTML = Parser.HTMLParser.parseHTMLBytes(self._webAccess.lastResponseTextBytes())
-
-                treatedUrls = self._getTreatedLinksFromPage(parsedHTML, currHostWithSchema)
+                contentType = self._webAccess.lastResponse.getheader('content-type')
+                parsedHTML = None
 
-                self._distributeUrlsToWorkers(treatedUrls)
+                if self._workersPipeline.parsePool != None and not self._workersPipeline.debugMode:
+                    #The links come back through this worker's inbox
+                    self._workersPipeline.parseOnPool(self._id, self._webAccess.lastResponseTextBytes(), contentType,
+                                                        currHostWithSchema, decompressSeconds)
+                else:
+                    decodeStart = time.monotonic()
+                    decodedHTML = Parser.HTMLParser.decodeHTMLBytes(self._webAccess.lastResponseTextBytes(), contentType)
+                    #The tree is only needed to print the page on debug mode
+                    parseStart = time.monotonic()
+                    urlsFound, parsedHTML = Parser.HTMLParser.getLinksAndParsedHTMLOfText(decodedHTML,
+                                                                                          self._workersPipeline.debugMode)
+                    normalizeStart = time.monotonic()
+                    treatedUrls = Parser.HTMLParser.formatUrlsWithHostIfNeeded(urlsFound, currHostWithSchema)
+                    self._metrics.observeStage(CrawlMetrics.DECODE, (decompressSeconds or 0.0) + parseStart - decodeStart)
+                    self._metrics.observeStage(CrawlMetrics.PARSE, normalizeStart - parseStart)
+                    self._metrics.observeStage(CrawlMetrics.NORMALIZE, time.monotonic() - normalizeStart)
+
+                    self._distributeUrlsToWorkers(treatedUrls)
 
                 response = self._webAccess.lastResponse
-                self._workersPipeline.saveResponse(response, requestLink)
+                if self._workersPipeline.saveResponse(response, requestLink, self._id, self._webAccess.lastResponseRawBytes(),
+                                                        self._webAccess.lastResponseTruncated):
+                    self._numPagesSaved += 1
                 
                 reqTimestamp = self._webAccess.lastRequestTimestamp
                 self._workersPipeline.printIfOnDebugMode(requestLink, reqTimestamp, parsedHTML)
+            elif decompressSeconds != None:
+                self._metrics.observeStage(CrawlMetrics.DECODE, decompressSeconds)
+
+    def _saveRevisitIfUnchanged(self, requestLink:str) -> bool:
+        """
+        Returns whether the page was not modified since the previous crawl, or has the same payload,
+        and so was saved as a revisit record
+        """
+        if self._recrawlIndex == None:
+            return False
+
+        rawBody = None
+        if self._webAccess.lastResponseTruncated == None:
+            rawBody = self._webAccess.lastResponseRawBytes()
+        response = self._webAccess.lastResponse
+        revisitOf = self._recrawlIndex.getRevisitOf(requestLink, response.status, rawBody)
+        if revisitOf == None:
+            return False
 
-    def _getTreatedLinksFromPage(self, parsedHTML:BeautifulSoup, currHostWithSchema:str):
-        urlsFound = Parser.HTMLParser.getAllLinksFromParsedHTML(parsedHTML)
-        treatedUrls = Parser.HTMLParser.formatUrlsWithHostIfNeeded(urlsFound, currHostWithSchema)
-        return treatedUrls
+        if self._workersPipeline.saveResponse(response, requestLink, self._id, b"", None, revisitOf):
+            self._numPagesSaved += 1
+        return True
+
+    def _markRequestMadeToHost(self, hostInfo:Host.HostInfo, error:Exception = None):
+        """
+        The delay of the host adapts to how the last request went, before it is scheduled with it
+        """
+        self._numRequestsMadeToHosts += 1
+        if error != None:
+            hostInfo.adaptDelayToFailure(isinstance(error, TimeoutError))
+        else:
+            hostInfo.adaptDelayToResponse(self._webAccess.lastResponse.status, self._webAccess.lastRequestSeconds,
+                                            self._webAccess.lastResponseRetryAfterSeconds())
+        hostInfo.markRequestMade()
 
     def _distributeUrlsToWorkers(self, treatedUrls):
         linksByWorker = self._workersPipeline.separateLinksByWorker(treatedUrls)
@@ -288,18 +417,148 @@ class Worker():
         self.addAllLinksToRequest(myLinks)
 
         linksByWorker.pop(self._id, None)
-        self._workersPipeline.sendLinksToProperWorkers(linksByWorker)
+        self._workersPipeline.sendLinksToProperWorkers(linksByWorker, self._id)
+    
+    def _giveHostsIfRequested(self):
+        """
+        Gives hosts with about half of the resources to crawl to an idle worker that asked for them.
+        The host with the most resources is kept, since it is probably the one being crawled
+        """
+        askingWorkerId = self._workersPipeline.takeHostsRequest(self._id)
+        if askingWorkerId == None or not self._workersPipeline.tryToStartMovingHosts():
+            return
+
+        numResourcesPerHost = sorted(self._hostsInfo.getNumResourcesPerHost().items(),
+                                        key=lambda hostAndNumResources: hostAndNumResources[1], reverse=True)
+        hostInfosToGive = list()
+        numResourcesToGive = 0
+        for host, numResources in numResourcesPerHost[1:]:
+            if numResourcesToGive >= self._numPendingResources // 2:
+                break
+            hostInfosToGive.append(self._hostsInfo.removeHostInfo(host))
+            numResourcesToGive += numResources
+        
+        if len(hostInfosToGive) > 0:
+            self._removeHostsFromQueue(set([hostInfo.hostNameWithSchema for hostInfo in hostInfosToGive]))
+            self._addPendingResources(-numResourcesToGive)
+
+        self._workersPipeline.finishMovingHosts(self._id, askingWorkerId, hostInfosToGive)
+    
+    def _removeHostsFromQueue(self, hosts:set):
+        self._hostsScheduler.removeHosts(hosts)
+    
+    def _sendAwayHostsOfOtherProcessesIfReassigned(self):
+        """
+        When hosts are assigned to processes again, like when a node joins or leaves a distributed crawl,
+        the resources of the hosts this worker lost are sent to the process that has them now
+        """
+        hostsAssignmentVersion = self._workersPipeline.hostsAssignmentVersion
+        if hostsAssignmentVersion == self._hostsAssignmentVersion:
+            return
+        self._hostsAssignmentVersion = hostsAssignmentVersion
+
+        linksToSend = list()
+        hostsLost = set()
+        numCrawledResourcesLost = 0
+        for host in self._hostsInfo.getHostsNames():
+            if not self._workersPipeline.isLocalHost(host):
+                hostInfo = self._hostsInfo.removeHostInfo(host)
+                self._workersPipeline.addResourcesPerHost({host: hostInfo.getCrawledResourcesNum()})
+                numCrawledResourcesLost += hostInfo.getCrawledResourcesNum()
+                while not hostInfo.emptyOfResources():
+                    linksToSend.append(Url.fromHostAndResource(host, hostInfo.getNextResource()))
+                hostsLost.add(host)
+        
+        if len(hostsLost) > 0:
+            self._removeHostsFromQueue(hostsLost)
+            self._addPendingResources(-len(linksToSend))
+            numSeenLinksSent = self._sendSeenLinksOfHostsLost(hostsLost, linksToSend, numCrawledResourcesLost)
+            logging.info(f"Worker {self._id} sent {len(linksToSend)} links to crawl and {numSeenLinksSent} seen "
+                            f"of {len(hostsLost)} hosts to other processes")
+            self._workersPipeline.deliverLinksToProperWorkers(linksToSend)
+    
+    def _sendSeenLinksOfHostsLost(self, hostsLost:set, linksToSend:list, numCrawledResourcesLost:int) -> int:
+        """
+        The urls seen of the hosts lost are marked as seen on the processes that have them now, so that their
+        pages are not crawled and saved again when links to them are found. The ones still to crawl are left out,
+        since they are sent to be crawled. With a seen store that cannot list its urls, like a Bloom filter,
+        the pages crawled of these hosts may be crawled again
+        """
+        seenLinks = self._hostsInfo.getSeenLinksOfHosts(hostsLost)
+        if seenLinks == None:
+            self._workersPipeline.addResourcesMaybeCrawledAgain(numCrawledResourcesLost)
+            logging.info(f"Worker {self._id}: {numCrawledResourcesLost} pages crawled of {len(hostsLost)} hosts "
+                            f"sent to other processes may be crawled again there")
+            return 0
+
+        linksToCrawl = set([url.link for url in linksToSend])
+        seenLinks = [link for link in seenLinks if link not in linksToCrawl]
+        self._workersPipeline.sendSeenLinksToTheirProcesses(seenLinks)
+        return len(seenLinks)
+    
+    def _adoptHosts(self, hostInfos:list):
+        for hostInfo in hostInfos:
+            #Resources of the host that were already here are counted
+            self._addPendingResources(hostInfo.numResources())
+            self._hostsInfo.adoptHostInfo(hostInfo)
+            if hostInfo.hostNameWithSchema in self._hostsScheduler:
+                #Scheduled for the links that arrived before it, as a host never requested
+                self._hostsScheduler.removeHosts(set([hostInfo.hostNameWithSchema]))
+            if not hostInfo.emptyOfResources():
+                self._addHostToRequest(hostInfo)
     
     def _tryToCompleteWithReceivedLinks(self):
         
+        self._adoptHosts(self._workersPipeline.getHostsSentToWorker(self._id))
         linksWorkersSentToMe = self._workersPipeline.getLinksSentToWorker(self._id)
 
         while len(linksWorkersSentToMe) > 0:
             newLink = linksWorkersSentToMe.popleft()
             self.addLinkToRequest(newLink)
     
+    def _checkpointIfRequested(self):
+        """
+        Saves this worker state if a checkpoint was requested since the last one.
+        Must be called between requests, when the state is consistent
+        """
+        if self._checkpointer == None:
+            return
+        
+        generation = self._checkpointer.generation
+        if generation > self._checkpointedGeneration:
+            self._workersPipeline.waitForPendingParsesOf(self._id)
+
+            #Hosts and links received before this point are part of this worker state
+            hostsWorkersSentToMe, linksWorkersSentToMe = self._workersPipeline.getAllSentToWorkerForCheckpoint(self._id,
+                                                                                                        generation)
+            self._adoptHosts(hostsWorkersSentToMe)
+            self.addAllLinksToRequest(linksWorkersSentToMe)
+
+            generationDir = self._checkpointer.getGenerationDir(generation)
+            self._checkpointer.saveWorkerState(self._id, generation, self.getCheckpointState(generationDir))
+            self._checkpointedGeneration = generation
+    
+    def getCheckpointState(self, checkpointDir:str) -> dict:
+        return {'hostsInfo': self._hostsInfo.getCheckpointState(checkpointDir),
+                'hostsQueue': self._hostsScheduler.getHosts(),
+                'numPagesSaved': self._numPagesSaved}
+    
+    def restoreFromCheckpointState(self, state:dict, checkpointDir:str):
+        self._hostsInfo.restoreFromCheckpointState(state['hostsInfo'], checkpointDir)
+        #Times of time.monotonic() do not carry over to another process, so every host is ready right away
+        [self._hostsScheduler.addHost(host) for host in state['hostsQueue']]
+        self._numPagesSaved = state['numPagesSaved']
+        self._addPendingResources(self._hostsInfo.getTotalNumResources())
+    
+    def getHostsNames(self) -> list:
+        return self._hostsInfo.getHostsNames()
+    
+    def numHostsToRequest(self) -> int:
+        """Of the hosts queue, read by the CrawlMetrics from other threads"""
+        return len(self._hostsScheduler)
+    
     def getCrawlingInfo(self) -> str:
-        hostsOnQueue = [host for host in self._hostsOnQueue]
+        hostsOnQueue = self._hostsScheduler.getHosts()
         requestsMade = self._hostsInfo.getCrawledResourcesPerHost()
         requestsToBeDone = str(self._hostsInfo)
 
@@ -1,23 +1,38 @@
 from WarcFileSave import WarcSaver
+from WebAccesser import FetchStats
+from Frontier import FrontierFactory
 from DebugPrinter import JsonPrinter
-from threading import Lock, Event
+from Metrics import CrawlMetrics
+from threading import Lock, Event, Condition
 from collections import deque
 from bs4 import BeautifulSoup
 from Parser import HTMLParser
+from Url import Url
 import logging
 import urllib3
 import utils
+import time
 
 class WorkersPipeline():
     """
     This represents the object that the workers use to communicate to eachother
     """
 
-    MAX_RESULTS_PER_WARC_FILE = 1000
+    MAX_LINKS_RECEIVED_PER_CALL = 1024
+    #An idle worker only asks for hosts of a worker with at least this many resources to crawl
+    MIN_PENDING_RESOURCES_TO_STEAL = 8
+    #The skew of the resources left to crawl per worker is sampled at most this often as they change
+    SKEW_SAMPLE_INTERVAL_SECONDS = 0.1
 
-    def __init__(self, workers:dict, maxNumPagesCrawled:int, debug:bool=False):
+    def __init__(self, workers:dict, maxNumPagesCrawled:int, debug:bool=False,
+                    linkExchange = None, warcPreName:str = "results", frontierFactory:FrontierFactory = None,
+                    parsePool = None, warcSaver = None, metrics:CrawlMetrics = None):
         self._workers = workers
         self._numWorkers = len(list(workers.keys()))
+
+        #Sends links to the other Crawler processes when crawling with many of them
+        self._linkExchange = linkExchange
+        self._numProcesses = 1 if linkExchange == None else linkExchange.numProcesses
         
         self._debugMode = debug
 
@@ -27,16 +42,21 @@ class WorkersPipeline():
         
         self._workerCommLinksRecv = {}
         self._workersCommLocks = {}
-        self._numWorkersWaiting = 0
-        self._numWorkersWaitingLock = Lock()
         self._workerWaitingLinksEvents = {}
         self._workerWaitingLinksEventsLocks = {}
 
         #For debugging purposes
         self._workersThatGotOut = dict()
         self._workersThatGotOutLock = Lock()
+        if frontierFactory == None:
+            frontierFactory = FrontierFactory()
+
+        #HostInfos moved to a worker, waiting for it to take them. Guarded by its comm lock
+        self._workerCommHostsRecv = {}
+
         for workerId in list(self._workers.keys()):
-            self._workerCommLinksRecv[workerId] = deque()
+            self._workerCommLinksRecv[workerId] = frontierFactory.newFrontier()
+            self._workerCommHostsRecv[workerId] = list()
             self._workersCommLocks[workerId] = Lock()
 
             self._workerWaitingLinksEvents[workerId] = Event()
@@ -47,11 +67,71 @@ class WorkersPipeline():
         self._allDone = False
         self._allDoneLock = Lock()
 
-        self._warcSaver = WarcSaver()
+        #Every worker is done when all of them are waiting, no link sent to them is left
+        #on their inboxes and no page is being parsed. Counted under a single lock,
+        #so checking it does not depend on the number of workers
+        self._quiescenceLock = Lock()
+        self._numWorkersWaiting = 0
+        self._numLinksOnInboxes = 0
+        self._numHostsOnInboxes = 0
+        self._numPendingParsesOfAll = 0
+
+        #A host belongs to the worker of its hash unless it was moved to another one.
+        #Written under the lock, read without it since a dict lookup is atomic
+        self._hostOwners = dict()
+        self._hostOwnersLock = Lock()
+
+        #An idle worker asks the worker with the most resources to crawl for some of its hosts.
+        #Each worker publishes its own number of resources to crawl
+        self._numPendingResources = {workerId:0 for workerId in list(self._workers.keys())}
+        self._hostsRequests = {workerId:deque() for workerId in list(self._workers.keys())}
+        self._workersAskingForHosts = set()
+        self._hostsRequestsLock = Lock()
+        #Held while hosts move, so a checkpoint does not start in between
+        self._hostsMoveLock = Lock()
+        self._numHostsMoves = 0
+        self._numHostsMoved = 0
+        self._numResourcesMoved = 0
+        #Skew (max/mean) of the resources left to crawl per worker. Sampled while crawling,
+        #since by the end every worker has drained its hosts
+        self._skewLock = Lock()
+        self._lastSkewSampleTime = time.monotonic()
+        self._lastSkew = 0.0
+        self._peakSkew = 0.0
+        self._peakSkewMaxPending = 0
+        self._peakSkewMeanPending = 0.0
+        #The skew of each sample weighted by how long it held, while any worker had something to crawl
+        self._skewSeconds = 0.0
+        self._skewSampledSeconds = 0.0
+
+        #A WarcSaver or anything with the same interface, like a BackgroundWarcSaver
+        self._warcSaver = WarcSaver(warcPreName) if warcSaver == None else warcSaver
         self._debugPrinter = JsonPrinter()
 
         self._resourcesPerHost = dict()
         self._resourcesPerHostLock = Lock()
+        #Pages crawled of hosts sent to other processes without their seen urls, which may be crawled again there
+        self._numResourcesMaybeCrawledAgain = 0
+        #The delay between requests each host ended the crawl with
+        self._delaySecondsPerHost = dict()
+
+        #Of every worker, added when it finishes
+        self._fetchStats = FetchStats()
+        #Shared with the workers, updated as they go
+        self._metrics = CrawlMetrics() if metrics == None else metrics
+        #Seconds and number of times each worker waited for a host it could request, while having hosts to crawl
+        self._politenessIdleTimes = dict()
+        self._politenessIdleTimesLock = Lock()
+
+        #Parses the pages of every worker on other processes, if any.
+        #While a page of a worker is being parsed, its links may still come, so it is not idle
+        self._parsePool = parsePool
+        self._numPendingParses = {workerId:0 for workerId in list(self._workers.keys())}
+        self._numPendingParsesCondition = Condition()
+
+        #The last checkpoint generation each worker saved its state for
+        self._checkpointer = None
+        self._workersCheckpointedGeneration = {workerId:0 for workerId in list(self._workers.keys())}
 
     @property
     def numWorkers(self) -> int:
@@ -69,6 +149,22 @@ class WorkersPipeline():
     def pagesCrawled(self, pagesCrawled):
         raise AttributeError("pagesCrawled is not writable")
     
+    @property
+    def parsePool(self):
+        return self._parsePool
+    
+    @parsePool.setter
+    def parsePool(self, newParsePool):
+        raise AttributeError("parsePool is not writable")
+    
+    @property
+    def debugMode(self) -> bool:
+        return self._debugMode
+    
+    @debugMode.setter
+    def debugMode(self, newDebugMode):
+        raise AttributeError("debugMode is not writable")
+    
     @property
     def allDone(self) -> bool:
         self._allDoneLock.acquire()
@@ -80,6 +176,15 @@ class WorkersPipeline():
     def allDone(self, newAllDone):
         raise AttributeError("allDone is not writable")
 
+    @property
+    def hostsAssignmentVersion(self) -> int:
+        """Changes when hosts may have moved to other processes, like when a node joins or leaves"""
+        return 0 if self._linkExchange == None else self._linkExchange.assignmentVersion
+    
+    @hostsAssignmentVersion.setter
+    def hostsAssignmentVersion(self, newHostsAssignmentVersion):
+        raise AttributeError("hostsAssignmentVersion is not writable")
+
     @property
     def workers(self) -> dict:
         return self._workers
@@ -88,6 +193,16 @@ class WorkersPipeline():
     def workers(self, newWorkers):
         raise AttributeError("workers is not writable")
     
+    @property
+    def checkpointer(self):
+        raise AttributeError("checkpointer is not readable")
+    
+    @checkpointer.setter
+    def checkpointer(self, newCheckpointer):
+        self._checkpointer = newCheckpointer
+        for workerId in list(self._workersCheckpointedGeneration.keys()):
+            self._workersCheckpointedGeneration[workerId] = newCheckpointer.generation
+
     @property
     def workerToWorkerLink(self):
         raise AttributeError("workerToWorkerLink is not readable or writable")
@@ -117,58 +232,235 @@ class WorkersPipeline():
         receivedLinksLock.acquire()
         self._workerWaitingLinksEventsLocks[workerId].acquire()
         
-        linksReceived = self._workerCommLinksRecv[workerId].copy()
-        self._workerCommLinksRecv[workerId].clear()
+        #At most a batch of links, so the inbox may keep most of them spilled on disk.
+        #If some are left, the event stays set and the worker comes back for them
+        workerInbox = self._workerCommLinksRecv[workerId]
+        linksReceived = deque()
+        while len(workerInbox) > 0 and len(linksReceived) < WorkersPipeline.MAX_LINKS_RECEIVED_PER_CALL:
+            linksReceived.append(workerInbox.popleft())
 
-        self._workerWaitingLinksEvents[workerId].clear()
+        if len(workerInbox) == 0 and len(self._workerCommHostsRecv[workerId]) == 0:
+            self._workerWaitingLinksEvents[workerId].clear()
 
         self._workerWaitingLinksEventsLocks[workerId].release()
         receivedLinksLock.release()
 
+        self._addLinksOnInboxes(-len(linksReceived))
         return linksReceived
     
-    def sendLinksToProperWorkers(self, linksByWorker:dict):
-        hostsAndResourcesToWorkerMap = dict()
-        for workerId, linksToSend in linksByWorker.items():
-            hostsWithSchemaToLinksMap = self._mapLinkResoursesToHosts(linksToSend)
-            hostsAndResourcesToWorkerMap[workerId] = [
-                    (hostWithSchema, resources) for hostWithSchema, resources in hostsWithSchemaToLinksMap.items()
-                    ]
-            
-            self._sendResourcesToWorkers(hostsAndResourcesToWorkerMap)
-    
-    def _mapLinkResoursesToHosts(self, linkList:list) -> dict:
-        hostsToLinksMap = dict()
-        for link in linkList:
-            hostWithSchema, resource = utils.getHostWithSchemaAndResourcesFromLink(link)
-            
-            if hostWithSchema not in list(hostsToLinksMap.keys()):
-                hostsToLinksMap[hostWithSchema] = set()
-            
-            hostsToLinksMap[hostWithSchema].add(resource)
-        return hostsToLinksMap
-    
-    def _sendResourcesToWorkers(self, hostsAndResourcesToWorkerMap:dict):
-        for workerId, mappedLinks in hostsAndResourcesToWorkerMap.items():
-            if len(mappedLinks) > 0:
-                #mappedLinks is a list of tuples
-                #each tuple has a host as a first value and a set of resources of that
-                #host as a second value
+    def getHostsSentToWorker(self, workerId:int) -> list:
+        """
+        The HostInfos other workers gave to the worker. Must be taken before its links,
+        since links of a host may be sent to its new owner as soon as it is moved
+        """
+        receivedLinksLock = self._workersCommLocks[workerId]
+        receivedLinksLock.acquire()
+        hostsReceived = self._workerCommHostsRecv[workerId]
+        self._workerCommHostsRecv[workerId] = list()
+        receivedLinksLock.release()
+
+        self._addHostsOnInboxes(-len(hostsReceived))
+        return hostsReceived
+    
+    def getAllSentToWorkerForCheckpoint(self, workerId:int, generation:int) -> tuple:
+        """
+        Every HostInfo and link sent to the worker. From now on, links sent to it by workers that did not
+        save their state for this generation yet are recorded as in flight
+        """
+        self._hostsMoveLock.acquire()
+        receivedLinksLock = self._workersCommLocks[workerId]
+        receivedLinksLock.acquire()
+        self._workerWaitingLinksEventsLocks[workerId].acquire()
+
+        workerInbox = self._workerCommLinksRecv[workerId]
+        linksReceived = deque()
+        while len(workerInbox) > 0:
+            linksReceived.append(workerInbox.popleft())
+        hostsReceived = self._workerCommHostsRecv[workerId]
+        self._workerCommHostsRecv[workerId] = list()
+        
+        self._workersCheckpointedGeneration[workerId] = generation
+        self._workerWaitingLinksEvents[workerId].clear()
+
+        self._workerWaitingLinksEventsLocks[workerId].release()
+        receivedLinksLock.release()
+        self._hostsMoveLock.release()
+
+        self._addLinksOnInboxes(-len(linksReceived))
+        self._addHostsOnInboxes(-len(hostsReceived))
+        return hostsReceived, linksReceived
+    
+    def sendLinksToProperWorkers(self, linksByWorker:dict, senderId:int = None):
+        """
+        Links are Urls or strings, which are normalized here. The same link is only sent once
+        """
+        sendStart = time.monotonic()
+        urlsByWorker = {workerId: set([Url.of(link) for link in linksToSend])
+                        for workerId, linksToSend in linksByWorker.items()}
+        self._sendUrlsToWorkers(urlsByWorker, senderId)
+        self._metrics.observeStage(CrawlMetrics.SEND, time.monotonic() - sendStart)
+        self._metrics.count(CrawlMetrics.LINKS_SENT, sum([len(urls) for urls in urlsByWorker.values()]))
+    
+    def _sendUrlsToWorkers(self, urlsByWorker:dict, senderId:int = None):
+        for workerId, urlsToSend in urlsByWorker.items():
+            if len(urlsToSend) > 0:
                 workerLock = self._workersCommLocks[workerId]
 
                 workerLock.acquire()
-                for hostAndResources in mappedLinks:
-                    workerLinkDeque = self._workerCommLinksRecv[workerId]
-                    currHost = hostAndResources[0]
-                    resourcesOfHost = hostAndResources[1]
-                    for resource in resourcesOfHost:
-                        
-                        completeLink = utils.getCompleteLinkFromHostAndResource(currHost, resource)
-                        workerLinkDeque.append(completeLink)                    
+                workerInbox = self._workerCommLinksRecv[workerId]
+                [workerInbox.append(url) for url in urlsToSend]
+                
+                self._recordLinksInFlightIfNecessary(senderId, workerId, urlsToSend)
+                #Counted before the sender may go waiting, so the receiver is not taken as done
+                self._addLinksOnInboxes(len(urlsToSend))
                
                 workerLock.release()
                 self._signalWorkerReceivedLinkEvent(workerId)
 
+    def _recordLinksInFlightIfNecessary(self, senderId:int, receiverId:int, links:list):
+        """
+        The receiver already saved its state for a checkpoint the sender did not,
+        so these links would be in neither of their states
+        """
+        if self._checkpointer == None or senderId == None:
+            return
+
+        receiverGeneration = self._workersCheckpointedGeneration[receiverId]
+        if receiverGeneration > self._workersCheckpointedGeneration[senderId]:
+            self._checkpointer.recordInFlightLinks(receiverGeneration, [str(link) for link in links])
+
+    def _addLinksOnInboxes(self, numLinks:int):
+        self._quiescenceLock.acquire()
+        self._numLinksOnInboxes += numLinks
+        self._quiescenceLock.release()
+
+    def _addHostsOnInboxes(self, numHosts:int):
+        self._quiescenceLock.acquire()
+        self._numHostsOnInboxes += numHosts
+        self._quiescenceLock.release()
+
+    def setNumPendingResourcesOf(self, workerId:int, numPendingResources:int):
+        self._numPendingResources[workerId] = numPendingResources
+        self._sampleSkewIfDue()
+
+    def _sampleSkewIfDue(self):
+        now = time.monotonic()
+        if now - self._lastSkewSampleTime < WorkersPipeline.SKEW_SAMPLE_INTERVAL_SECONDS:
+            return
+        #Another worker is already taking it
+        if not self._skewLock.acquire(blocking=False):
+            return
+
+        numPendingResources = list(self._numPendingResources.values())
+        maxPending = max(numPendingResources, default=0)
+        meanPending = sum(numPendingResources) / len(numPendingResources) if len(numPendingResources) > 0 else 0.0
+        skew = maxPending / meanPending if meanPending > 0 else 0.0
+
+        if self._lastSkew > 0:
+            self._skewSeconds += self._lastSkew * (now - self._lastSkewSampleTime)
+            self._skewSampledSeconds += now - self._lastSkewSampleTime
+        if skew > self._peakSkew:
+            self._peakSkew, self._peakSkewMaxPending, self._peakSkewMeanPending = skew, maxPending, meanPending
+        self._lastSkew = skew
+        self._lastSkewSampleTime = now
+        self._skewLock.release()
+
+    def getQueueDepths(self) -> dict:
+        """
+        For the CrawlMetrics. Read without the locks, since a len and a dict copy are atomic
+        and a snapshot only needs to be about right
+        """
+        return {'inboxLinks': {workerId: len(inbox) for workerId, inbox in self._workerCommLinksRecv.items()},
+                'inboxHosts': {workerId: len(hosts) for workerId, hosts in self._workerCommHostsRecv.items()},
+                'pendingResources': dict(self._numPendingResources),
+                'pendingParses': self._numPendingParsesOfAll}
+
+    def _askForHostsIfPossible(self, workerId:int):
+        """
+        Asks the worker with the most resources to crawl to give some of its hosts to this one
+        """
+        self._sampleSkewIfDue()
+
+        askedWorkerId = None
+        self._hostsRequestsLock.acquire()
+        if workerId not in self._workersAskingForHosts:
+            victimId, victimNumPending = max(self._numPendingResources.items(), key=lambda idAndNumPending: idAndNumPending[1])
+            if victimId != workerId and victimNumPending >= WorkersPipeline.MIN_PENDING_RESOURCES_TO_STEAL:
+                self._workersAskingForHosts.add(workerId)
+                self._hostsRequests[victimId].append(workerId)
+                askedWorkerId = victimId
+        self._hostsRequestsLock.release()
+
+        #It may be waiting for one of its hosts to be ready
+        if askedWorkerId != None:
+            self._signalWorkerReceivedLinkEvent(askedWorkerId)
+
+    def takeHostsRequest(self, workerId:int) -> int:
+        """
+        The id of a worker that asked this one for hosts, or None
+        """
+        if len(self._hostsRequests[workerId]) == 0:
+            return None
+
+        self._hostsRequestsLock.acquire()
+        askingWorkerId = None
+        if len(self._hostsRequests[workerId]) > 0:
+            askingWorkerId = self._hostsRequests[workerId].popleft()
+            self._workersAskingForHosts.discard(askingWorkerId)
+        self._hostsRequestsLock.release()
+
+        return askingWorkerId
+
+    def tryToStartMovingHosts(self) -> bool:
+        """
+        Hosts are not moved while workers save their state for a checkpoint, so a host is never on
+        the state of both workers or neither. If it returns True, finishMovingHosts must be called
+        """
+        self._hostsMoveLock.acquire()
+        if self._checkpointer == None:
+            return True
+
+        generation = self._checkpointer.generation
+        if all([workerGeneration == generation for _, workerGeneration in self._workersCheckpointedGeneration.items()]):
+            return True
+
+        self._hostsMoveLock.release()
+        return False
+
+    def finishMovingHosts(self, fromWorkerId:int, toWorkerId:int, hostInfos:list):
+        """
+        From now on, the links of these hosts go to toWorkerId
+        """
+        numResourcesMoved = sum([hostInfo.numResources() for hostInfo in hostInfos])
+
+        workerLock = self._workersCommLocks[toWorkerId]
+        workerLock.acquire()
+        self._workerCommHostsRecv[toWorkerId].extend(hostInfos)
+        self.setOwnerOfHosts(toWorkerId, [hostInfo.hostNameWithSchema for hostInfo in hostInfos])
+        #Counted before the giver may go waiting, so the receiver is not taken as done
+        self._addHostsOnInboxes(len(hostInfos))
+        workerLock.release()
+
+        if len(hostInfos) > 0:
+            self._numHostsMoves += 1
+            self._numHostsMoved += len(hostInfos)
+            self._numResourcesMoved += numResourcesMoved
+        self._hostsMoveLock.release()
+
+        if len(hostInfos) > 0:
+            logging.info(f"Worker {fromWorkerId} gave {len(hostInfos)} hosts with {numResourcesMoved} resources "
+                            f"to worker {toWorkerId}")
+            self._signalWorkerReceivedLinkEvent(toWorkerId)
+
+    def setOwnerOfHosts(self, workerId:int, hostsWithSchema:list):
+        self._hostOwnersLock.acquire()
+        for hostWithSchema in hostsWithSchema:
+            if utils.threadOfHost(self._numWorkers, hostWithSchema, self._numProcesses) == workerId:
+                self._hostOwners.pop(hostWithSchema, None)
+            else:
+                self._hostOwners[hostWithSchema] = workerId
+        self._hostOwnersLock.release()
+
     def _signalWorkerReceivedLinkEvent(self, workerId:int):
         self._workerWaitingLinksEventsLocks[workerId].acquire()
         self._workerWaitingLinksEvents[workerId].set()
@@ -178,45 +470,77 @@ class WorkersPipeline():
         self._setWorkerWaiting()
 
         if not self.allDone and not self._shouldStop():
+            self._askForHostsIfPossible(workerId)
             self._workerWaitingLinksEvents[workerId].wait()
 
         self._unsetWorkerWaiting()
     
+    def waitForLinkOrTimeout(self, workerId:int, timeoutSeconds:float):
+        """
+        For a worker that has hosts to crawl, but may not request any of them before timeoutSeconds.
+        It is not idle, so it is not counted as waiting
+        """
+        self._workerWaitingLinksEvents[workerId].wait(timeoutSeconds)
+
     def _setWorkerWaiting(self):
-        self._numWorkersWaitingLock.acquire()
+        self._quiescenceLock.acquire()
         self._numWorkersWaiting += 1
-        self._numWorkersWaitingLock.release()
+        self._quiescenceLock.release()
     
     def _unsetWorkerWaiting(self):
-        self._numWorkersWaitingLock.acquire()
+        self._quiescenceLock.acquire()
         self._numWorkersWaiting -= 1
-        self._numWorkersWaitingLock.release()
+        self._quiescenceLock.release()
 
-    def _shouldStop(self):
+    def _isQuiescent(self) -> bool:
+        """
+        A worker only waits with nothing left to crawl, and links are counted on the inboxes
+        before their sender can wait, so no work is left when this is true
+        """
+        self._quiescenceLock.acquire()
+        isQuiescent = (self._numWorkersWaiting == self._numWorkers and self._numLinksOnInboxes == 0
+                        and self._numHostsOnInboxes == 0 and self._numPendingParsesOfAll == 0)
+        self._quiescenceLock.release()
+        return isQuiescent
 
-        self._numWorkersWaitingLock.acquire()
-        everyWorkerWaiting = self._numWorkersWaiting == self._numWorkers
-        self._numWorkersWaitingLock.release()
+    def _shouldStop(self):
 
         self._numPagesCrawledLock.acquire()
         shouldStop = self._crawledPassMaxNumPages()
         self._numPagesCrawledLock.release()
 
         if not shouldStop:
-            [lock.acquire() for _, lock in self._workerWaitingLinksEventsLocks.items()]
-            aWorkerSentLinksToAnother = any([event.is_set() for _, event in self._workerWaitingLinksEvents.items()])
+            shouldStop = self._isQuiescent()
 
-            shouldStop = everyWorkerWaiting and not aWorkerSentLinksToAnother
-            [lock.release() for _, lock in self._workerWaitingLinksEventsLocks.items()]
+            if shouldStop and self._linkExchange != None:
+                #This process is idle, but the others may still send links to it
+                shouldStop = self._linkExchange.notifyLocallyIdle()
 
         if shouldStop:
             logging.info("TIME TO STOP")
-            self.setAllDone()
-            [lock.acquire() for _, lock in self._workerWaitingLinksEventsLocks.items()]
-            self._wakeEveryWorkerToDie()
-            [lock.release() for _, lock in self._workerWaitingLinksEventsLocks.items()]
+            self.finishAllWorkers()
         
         return shouldStop
+    
+    def checkIfShouldStop(self):
+        """
+        For when something other than a worker may have made every worker idle,
+        like links of another process that were already consumed
+        """
+        self._quiescenceLock.acquire()
+        everyWorkerWaiting = self._numWorkersWaiting == self._numWorkers
+        self._quiescenceLock.release()
+
+        if everyWorkerWaiting and not self.allDone:
+            self._shouldStop()
+
+    def finishAllWorkers(self):
+        self.setAllDone()
+        self.wakeEveryWorker()
+    
+    def wakeEveryWorker(self):
+        #allDone is set before, so a worker that clears its event afterwards does not wait on it
+        self._wakeEveryWorkerToDie()
 
     def setAllDone(self):
         self._allDoneLock.acquire()
@@ -226,20 +550,110 @@ class WorkersPipeline():
     def _wakeEveryWorkerToDie(self):
         return [event.set() for _, event in self._workerWaitingLinksEvents.items()]
     
+    def isLocalHost(self, hostWithSchema:str) -> bool:
+        return self._linkExchange == None or self._linkExchange.isLocalHost(hostWithSchema)
+
+    def workerOfHost(self, hostWithSchema:str, hostHash:int = None) -> int:
+        """
+        hostHash is the utils.stableHostHash of the host, if it is already known
+        """
+        ownerId = self._hostOwners.get(hostWithSchema)
+        if ownerId != None:
+            return ownerId
+        if hostHash == None:
+            hostHash = utils.stableHostHash(hostWithSchema)
+        return utils.threadOfHostHash(self._numWorkers, hostHash, self._numProcesses)
+
     def separateLinksByWorker(self, urls:set) -> dict:
+        """
+        Separates the links, Urls or strings, by the worker of their host as Urls.
+        Links of hosts owned by other processes are sent to them right away, as strings
+        """
         linkByHost = dict()
 
         for workerId in range(self._numWorkers):
             linkByHost[workerId] = list()
+        
+        linksByProcess = dict()
 
         for url in urls:
-            hostWithSchema = utils.getHostWithSchemaOfLink(url)
-            workerId = utils.threadOfHost(self._numWorkers, hostWithSchema)
+            url = Url.of(url)
 
-            linkByHost[workerId].append(url)
+            if self.isLocalHost(url.hostWithSchema):
+                workerId = self.workerOfHost(url.hostWithSchema, url.hostHash)
+                linkByHost[workerId].append(url)
+            else:
+                processId = self._linkExchange.processOfHost(url.hostWithSchema)
+                linksByProcess.setdefault(processId, list()).append(url.link)
+        
+        for processId, links in linksByProcess.items():
+            self._linkExchange.sendLinks(processId, links)
         
         return linkByHost
     
+    def parseOnPool(self, workerId:int, html:bytes, contentType:str, hostWithSchema:str,
+                        decompressSeconds:float = None):
+        """
+        Parses the page on the ParsePool. Its links, including the ones of the worker itself,
+        are sent to the workers' inboxes when it is done. decompressSeconds is how long undoing
+        its Content-Encoding took, observed with decoding its charset
+        """
+        self._numPendingParsesCondition.acquire()
+        self._numPendingParses[workerId] += 1
+        self._numPendingParsesCondition.release()
+
+        self._quiescenceLock.acquire()
+        self._numPendingParsesOfAll += 1
+        self._quiescenceLock.release()
+
+        submitTime = time.monotonic()
+        self._parsePool.submit(html, contentType, hostWithSchema,
+                                lambda links, decodeSeconds: self._onLinksParsed(workerId, links, submitTime,
+                                                                                    decompressSeconds, decodeSeconds))
+    
+    def _onLinksParsed(self, workerId:int, links:set, submitTime:float, decompressSeconds:float, decodeSeconds:float):
+        self._metrics.observeStage(CrawlMetrics.DECODE, (decompressSeconds or 0.0) + decodeSeconds)
+        self._metrics.observeStage(CrawlMetrics.PARSE, time.monotonic() - submitTime - decodeSeconds)
+
+        #Sent before the parse stops being pending, so the workers are never all idle in between
+        self.sendLinksToProperWorkers(self.separateLinksByWorker(links), workerId)
+
+        self._quiescenceLock.acquire()
+        self._numPendingParsesOfAll -= 1
+        self._quiescenceLock.release()
+
+        self._numPendingParsesCondition.acquire()
+        self._numPendingParses[workerId] -= 1
+        self._numPendingParsesCondition.notify_all()
+        self._numPendingParsesCondition.release()
+
+        self.checkIfShouldStop()
+    
+    def waitForPendingParsesOf(self, workerId:int):
+        """
+        So that the links of the pages of the worker are either sent or on its state when it is saved
+        """
+        self._numPendingParsesCondition.acquire()
+        while self._numPendingParses[workerId] > 0:
+            self._numPendingParsesCondition.wait()
+        self._numPendingParsesCondition.release()
+    
+    def deliverLinksToProperWorkers(self, links:list):
+        linksByWorker = self.separateLinksByWorker(links)
+        self.sendLinksToProperWorkers(linksByWorker)
+    
+    def sendSeenLinksToTheirProcesses(self, links:list):
+        """
+        Links of hosts that moved to other processes, to be marked as seen there without being crawled
+        """
+        linksByProcess = dict()
+        for link in links:
+            processId = self._linkExchange.processOfHost(utils.getHostWithSchemaOfLink(link))
+            linksByProcess.setdefault(processId, list()).append(link)
+        
+        for processId, linksOfProcess in linksByProcess.items():
+            self._linkExchange.sendSeenLinks(processId, linksOfProcess)
+    
     def setSaiu(self, workerId:int):
         self._workersThatGotOutLock.acquire()
         self._workersThatGotOut[workerId] = True
@@ -251,24 +665,47 @@ class WorkersPipeline():
         self._workersThatGotOutLock.release()
         return sairamString
     
-    def saveResponse(self, response: urllib3.response.HTTPResponse, link:str):
+    def saveResponse(self, response: urllib3.response.HTTPResponse, link:str, workerId:int = None,
+                        body:bytes = None, truncated:str = None, revisitOf:tuple = None) -> bool:
+        """
+        The page is only counted once its record is saved, or queued to be, by the WarcSaver.
+        body is what was read of the response as it was sent, truncated why it is not whole, if it is not,
+        and revisitOf what the revisit record of a page unchanged since the previous crawl refers to
+        """
+        saveStart = time.monotonic()
+        saved = self._warcSaver.saveAndReturnIfSuccess(response, link, workerId, body, truncated, revisitOf)
+        self._metrics.observeStage(CrawlMetrics.WARC, time.monotonic() - saveStart)
 
-        if self._warcSaver.saveAndReturnIfSuccess(response, link):
+        if saved:
+            self._metrics.count(CrawlMetrics.PAGES_SAVED)
             self._addPageCrawledAndSaved(link)
+            return True
+        
+        return False
     
     def _addPageCrawledAndSaved(self, link:str):
         
         self._numPagesCrawledLock.acquire()
         self._numPagesCrawled += 1
         logging.info(f"NUM PAGES: {self._numPagesCrawled}")
+
+        if self._linkExchange != None:
+            self._linkExchange.addPageAndReturnIfLimitReached()
         
-        if self._crawledPassMaxNumPages():
+        limitReached = self._crawledPassMaxNumPages()
+        if limitReached:
             logging.info(f"ATINGIU MAX PAGES")
             self.setAllDone()
         
         self._numPagesCrawledLock.release()
+
+        #The workers already waiting would not check allDone again until woken
+        if limitReached:
+            self.wakeEveryWorker()
     
     def _crawledPassMaxNumPages(self) -> bool:
+        if self._linkExchange != None:
+            return self._linkExchange.pagesLimitReached()
         return self._numPagesCrawled > self._maxNumPagesToCrawl
     
     def printIfOnDebugMode(self,  link:str, reqTimestamp:float, parsedHTML:BeautifulSoup):
@@ -281,11 +718,81 @@ class WorkersPipeline():
     def addResourcesPerHost(self, hostAndNumResourcesMap:dict):
         self._resourcesPerHostLock.acquire()
         for host, numResources in hostAndNumResourcesMap.items():
-            if host in list(self._resourcesPerHost.keys()):
-                self._resourcesPerHost[host] += numResources
-            else:
-                self._resourcesPerHost[host] = numResources
+            self._resourcesPerHost[host] = self._resourcesPerHost.get(host, 0) + numResources
+        self._resourcesPerHostLock.release()
+    
+    def addResourcesMaybeCrawledAgain(self, numResources:int):
+        self._resourcesPerHostLock.acquire()
+        self._numResourcesMaybeCrawledAgain += numResources
+        self._resourcesPerHostLock.release()
+    
+    def addDelaySecondsPerHost(self, hostAndDelaySecondsMap:dict):
+        self._resourcesPerHostLock.acquire()
+        self._delaySecondsPerHost.update(hostAndDelaySecondsMap)
         self._resourcesPerHostLock.release()
     
+    def getDelaysStatsString(self) -> str:
+        MAX_SLOWEST_HOSTS_TO_SHOW = 10
+        hostsByDelay = sorted(self._delaySecondsPerHost.items(), key=lambda hostAndDelay: hostAndDelay[1], reverse=True)
+        delays = [delaySeconds for _, delaySeconds in hostsByDelay]
+        if len(delays) == 0:
+            return "Delays: no host was crawled"
+
+        slowestHosts = ", ".join([f"{host}: {delaySeconds:.2f}s" for host, delaySeconds
+                                    in hostsByDelay[:MAX_SLOWEST_HOSTS_TO_SHOW]])
+        return (f"Delays: between requests to each of {len(delays)} hosts, min {delays[-1]:.2f}s, "
+                f"median {delays[len(delays) // 2]:.2f}s, max {delays[0]:.2f}s. Slowest hosts: {slowestHosts}")
+    
+    def closeWarcSaver(self):
+        self._warcSaver.close()
+        logging.info(self._warcSaver.getStatsString())
+    
+    def addFetchStats(self, fetchStats:FetchStats):
+        self._fetchStats.add(fetchStats)
+    
+    def getFetchStatsString(self) -> str:
+        return self._fetchStats.getStatsString(self._numPagesCrawled)
+    
+    def addPolitenessIdleTime(self, workerId:int, idleSeconds:float, numWaits:int):
+        self._politenessIdleTimesLock.acquire()
+        self._politenessIdleTimes[workerId] = (idleSeconds, numWaits)
+        self._politenessIdleTimesLock.release()
+    
+    def getPolitenessStatsString(self) -> str:
+        idleSeconds = [workerIdleSeconds for _, (workerIdleSeconds, _) in sorted(self._politenessIdleTimes.items())]
+        numWaits = sum([workerNumWaits for _, (_, workerNumWaits) in self._politenessIdleTimes.items()])
+        meanIdleSeconds = sum(idleSeconds) / len(idleSeconds) if len(idleSeconds) > 0 else 0.0
+        idleSecondsPerWorker = ", ".join([f"{workerId}: {workerIdleSeconds:.2f}s" for workerId, (workerIdleSeconds, _)
+                                            in sorted(self._politenessIdleTimes.items())])
+
+        return (f"Politeness: workers waited {sum(idleSeconds):.2f}s in {numWaits} waits for a host they could request, "
+                f"max {max(idleSeconds, default=0.0):.2f}s, mean {meanIdleSeconds:.2f}s per worker. "
+                f"Per worker: {idleSecondsPerWorker}")
+    
+    def getHostsMovesStatsString(self) -> str:
+        self._skewLock.acquire()
+        peakSkew, peakSkewMaxPending, peakSkewMeanPending = self._peakSkew, self._peakSkewMaxPending, self._peakSkewMeanPending
+        meanSkew = self._skewSeconds / self._skewSampledSeconds if self._skewSampledSeconds > 0 else 0.0
+        self._skewLock.release()
+
+        return (f"Hosts moves: {self._numHostsMoves} moves of {self._numHostsMoved} hosts with "
+                f"{self._numResourcesMoved} resources to crawl, {len(self._hostOwners)} hosts not on the worker "
+                f"of their hash. Skew (max/mean) of the resources left to crawl per worker: peak {peakSkew:.2f} "
+                f"(max {peakSkewMaxPending}, mean {peakSkewMeanPending:.2f}), time-averaged {meanSkew:.2f}. "
+                f"{self._numResourcesMaybeCrawledAgain} pages crawled of hosts sent to other processes "
+                f"may be crawled again there")
+    
+    def getCheckpointState(self) -> dict:
+        return {'warcFileId': self._warcSaver.warcFileId, 'numSavedPages': self._warcSaver.numSavedPages}
+    
+    def restoreFromCheckpointState(self, state:dict, numPagesCrawled:int):
+        """
+        numPagesCrawled is what the restored workers account for. The pages saved after
+        their states were saved will be crawled again, on new WARC files
+        """
+        self._numPagesCrawled = numPagesCrawled
+        self._warcSaver.resumeAfter(state['warcFileId'], state['numSavedPages'])
+        self.deliverLinksToProperWorkers(state['inFlightLinks'])
+    
     def getTotalResourcesPerHost(self):
         return self._resourcesPerHost
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+How much memory the HostsInfo of a worker takes per host and how long looking a host up takes on it,
+with the resources of each host packed and kept on deques of strings, as they were before.
+
+Usage: python benchmarkHostsTable.py [<NUM_HOSTS> [<RESOURCES_PER_HOST>]]
+"""
+
+from timeit import default_timer as timer
+from collections import deque
+from Frontier import FrontierFactory
+from Host import HostsInfo
+import tracemalloc
+import random
+import sys
+
+NUM_HOSTS = 1000000
+RESOURCES_PER_HOST = 4
+NUM_LOOKUPS = 1000000
+NUM_QUEUED_RESOURCES = 100000
+#Looking up on a list of the hosts, as hostExists did, takes milliseconds at millions of hosts
+NUM_LIST_LOOKUPS = 20
+
+class DequeFrontierFactory(FrontierFactory):
+    def newHostFrontier(self):
+        return deque()
+
+def hostOf(hostId:int) -> str:
+    return f"https://www.host{hostId}.com.br"
+
+def buildHostsInfo(numHosts:int, resourcesPerHost:int, frontierFactory:FrontierFactory) -> tuple:
+    """The HostsInfo and how many bytes it took"""
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+
+    hostsInfo = HostsInfo(frontierFactory=frontierFactory)
+    for hostId in range(numHosts):
+        host = hostOf(hostId)
+        hostsInfo.createInfoForHostIfNotExists(host)
+        hostInfo = hostsInfo.getHostInfo(host)
+        [hostInfo.addResource(f"/noticias/2024/05/{hostId % 31}/materia-{resourceId}.html")
+            for resourceId in range(resourcesPerHost)]
+
+    numBytes = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return hostsInfo, numBytes
+
+def benchmarkLookups(hostsInfo:HostsInfo, numHosts:int):
+    hostsToLookUp = [hostOf(random.randrange(2 * numHosts)) for _ in range(NUM_LOOKUPS)]
+    start = timer()
+    [hostsInfo.getHostInfo(host) for host in hostsToLookUp]
+    lookupSeconds = timer() - start
+
+    hostsNames = hostsInfo.getHostsNames()
+    start = timer()
+    [host in list(hostsNames) for host in hostsToLookUp[:NUM_LIST_LOOKUPS]]
+    listLookupSeconds = timer() - start
+
+    print(f"Lookups: {lookupSeconds / NUM_LOOKUPS * 1000000000:.0f} ns/lookup, "
+            f"{listLookupSeconds / NUM_LIST_LOOKUPS * 1000000000:.0f} ns/lookup on a list of the hosts")
+
+def benchmarkQueue(frontierFactory:FrontierFactory) -> str:
+    """Out of tracemalloc, which makes every allocation slower"""
+    frontier = frontierFactory.newHostFrontier()
+    resources = [f"/noticias/2024/05/{resourceId % 31}/materia-{resourceId}.html" for resourceId in range(NUM_QUEUED_RESOURCES)]
+
+    start = timer()
+    frontier.extend(resources)
+    appendSeconds = timer() - start
+
+    start = timer()
+    [frontier.popleft() for _ in range(NUM_QUEUED_RESOURCES)]
+    popSeconds = timer() - start
+
+    return (f"{appendSeconds / NUM_QUEUED_RESOURCES * 1000000:.2f} us/append, "
+            f"{popSeconds / NUM_QUEUED_RESOURCES * 1000000:.2f} us/popleft")
+
+def benchmarkHostsTable(numHosts:int, resourcesPerHost:int):
+    print(f"{numHosts} hosts with {resourcesPerHost} resources to crawl each")
+
+    for name, frontierFactory in (("Deques of strings", DequeFrontierFactory()), ("Packed", FrontierFactory())):
+        hostsInfo, numBytes = buildHostsInfo(numHosts, resourcesPerHost, frontierFactory)
+        print(f"{name}: {numBytes / numHosts:.0f} bytes/host, {numBytes / 1024 / 1024:.1f} MiB, "
+                f"{benchmarkQueue(frontierFactory)}")
+
+        if isinstance(frontierFactory, DequeFrontierFactory):
+            del hostsInfo
+        else:
+            benchmarkLookups(hostsInfo, numHosts)
+
+if __name__ == "__main__":
+    numHosts = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_HOSTS
+    resourcesPerHost = int(sys.argv[2]) if len(sys.argv) > 2 else RESOURCES_PER_HOST
+    benchmarkHostsTable(numHosts, resourcesPerHost)
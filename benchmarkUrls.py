@@ -0,0 +1,89 @@
+"""
+How long a discovered link takes from the parser to the queue of its host, normalizing and splitting it
+on every step as it was done before Url, and normalizing it once as a Url.
+The links are the ones of the pages saved on WARC files or, without them, made up ones with a menu on every page.
+
+Usage: python benchmarkUrls.py [<WARC_FILE> ...]
+"""
+
+from warcio.archiveiterator import ArchiveIterator
+from timeit import default_timer as timer
+from Parser import HTMLParser
+from Url import Url
+import utils
+import sys
+
+NUM_THREADS = 8
+NUM_HOSTS = 200
+NUM_PAGES = 500
+NUM_MENU_LINKS = 30
+NUM_PAGE_LINKS = 20
+
+def getSavedLinks(warcFilePaths:list) -> list:
+    links = []
+    for warcFilePath in warcFilePaths:
+        with open(warcFilePath, 'rb') as warcFile:
+            for record in ArchiveIterator(warcFile):
+                if record.rec_type != 'response' or record.http_headers == None:
+                    continue
+
+                contentType = record.http_headers.get_header('content-type', "")
+                if 'text/html' not in contentType:
+                    continue
+
+                pageLink = record.rec_headers.get_header('WARC-Target-URI')
+                hrefs = HTMLParser.extractLinksFromHTMLBytes(record.content_stream().read(), contentType).hrefs
+                links.extend(HTMLParser.formatUrlsWithHostIfNeeded(hrefs, pageLink))
+    return [str(link) for link in links]
+
+def getMadeUpLinks() -> list:
+    links = []
+    for page in range(NUM_PAGES):
+        host = f"https://www.host{page % NUM_HOSTS}.com.br"
+        links.extend(f"{host}/menu/{menuLink}/" for menuLink in range(NUM_MENU_LINKS))
+        links.extend(f"{host}/news/{page}/article-{pageLink}.html?from=home" for pageLink in range(NUM_PAGE_LINKS))
+    return links
+
+def linkPathBeforeUrl(link:str):
+    #Parser.formatUrlsWithHostIfNeeded
+    link = utils.normalizeLinkIfCan(link)
+    #WorkersPipeline._mapLinkResoursesToHosts
+    hostWithSchema, resource = utils.getHostWithSchemaAndResourcesFromLink(link)
+    #utils.threadOfHost, hashing the host as it did before its hashes were cached
+    utils.threadOfHostHash(NUM_THREADS, utils.stableHostHash.__wrapped__(hostWithSchema))
+    link = utils.getCompleteLinkFromHostAndResource(hostWithSchema, resource)
+    #Worker.addLinkToRequest
+    hostWithSchema, resource = utils.getHostWithSchemaAndResourcesFromLink(link)
+    #Worker._getNextLinkOfHost
+    return utils.getCompleteLinkFromHostAndResource(hostWithSchema, resource)
+
+def linkPathWithUrl(link:str):
+    url = Url.fromLink(link)
+    utils.threadOfHostHash(NUM_THREADS, url.hostHash)
+    url.hostWithSchema
+    url.resource
+    return url.link
+
+def benchmarkUrls(links:list) -> int:
+    numMismatches = sum(1 for link in links if linkPathBeforeUrl(link) != linkPathWithUrl(link))
+    Url.fromLink.cache_clear()
+
+    start = timer()
+    [linkPathBeforeUrl(link) for link in links]
+    beforeSeconds = timer() - start
+
+    start = timer()
+    [linkPathWithUrl(link) for link in links]
+    urlSeconds = timer() - start
+
+    numLinks = max(1, len(links))
+    print(f"{len(links)} links, {len(set(links))} different, {numMismatches} mismatches")
+    print(f"Before Url: {beforeSeconds}s ({beforeSeconds / numLinks * 1000000:.2f} us/link)")
+    print(f"Url: {urlSeconds}s ({urlSeconds / numLinks * 1000000:.2f} us/link)")
+    print(Url.getCacheStatsString())
+
+    return numMismatches
+
+if __name__ == "__main__":
+    links = getSavedLinks(sys.argv[1:]) if len(sys.argv) > 1 else getMadeUpLinks()
+    exit(0 if benchmarkUrls(links) == 0 else 1)
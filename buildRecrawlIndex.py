@@ -0,0 +1,23 @@
+"""
+Builds the index of a crawl from its WARC files, so a recrawl of it (main.py -P <INDEX>) does not read them again.
+A WARC directory may be given more than once, like the ones of the days a site was crawled, oldest first.
+
+Usage: python buildRecrawlIndex.py <INDEX> <WARCS_DIR>...
+"""
+
+from RecrawlIndex import RecrawlIndex
+import sys
+
+def buildRecrawlIndex(indexFilePath:str, warcDirs:list) -> int:
+    recrawlIndex = RecrawlIndex()
+    [recrawlIndex.loadFrom(warcDir) for warcDir in warcDirs]
+    recrawlIndex.save(indexFilePath)
+    print(f"{len(recrawlIndex)} pages on {indexFilePath}")
+    return len(recrawlIndex)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python buildRecrawlIndex.py <INDEX> <WARCS_DIR>...")
+        exit(1)
+
+    buildRecrawlIndex(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,58 @@
+"""
+Checks that the streaming link extractor finds the same links as the BeautifulSoup one
+on the pages saved on WARC files, and how long each one takes.
+
+Usage: python compareLinkExtractors.py <WARC_FILE> [<WARC_FILE> ...]
+"""
+
+from warcio.archiveiterator import ArchiveIterator
+from timeit import default_timer as timer
+from Parser import HTMLParser
+import sys
+
+def getSavedHTMLPages(warcFilePaths:list):
+    for warcFilePath in warcFilePaths:
+        with open(warcFilePath, 'rb') as warcFile:
+            for record in ArchiveIterator(warcFile):
+                if record.rec_type != 'response' or record.http_headers == None:
+                    continue
+
+                contentType = record.http_headers.get_header('content-type', "")
+                if 'text/html' in contentType:
+                    yield record.rec_headers.get_header('WARC-Target-URI'), contentType, record.content_stream().read()
+
+def compareExtractors(warcFilePaths:list) -> int:
+    numPages = 0
+    numMismatches = 0
+    treeSeconds = 0.0
+    streamingSeconds = 0.0
+
+    for link, contentType, htmlBytes in getSavedHTMLPages(warcFilePaths):
+        numPages += 1
+
+        start = timer()
+        treeLinks = HTMLParser.getAllLinksFromParsedHTML(HTMLParser.parseHTMLBytes(htmlBytes, contentType))
+        treeSeconds += timer() - start
+
+        start = timer()
+        streamingLinks = HTMLParser.extractLinksFromHTMLBytes(htmlBytes, contentType).hrefs
+        streamingSeconds += timer() - start
+
+        if treeLinks != streamingLinks:
+            numMismatches += 1
+            print(f"MISMATCH {link}: only on tree {treeLinks - streamingLinks}, "
+                    f"only on streaming {streamingLinks - treeLinks}")
+
+    print(f"{numPages} pages, {numMismatches} mismatches")
+    if numPages > 0:
+        print(f"BeautifulSoup tree: {treeSeconds}s ({treeSeconds / numPages * 1000:.3f} ms/page)")
+        print(f"Streaming: {streamingSeconds}s ({streamingSeconds / numPages * 1000:.3f} ms/page)")
+
+    return numMismatches
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python compareLinkExtractors.py <WARC_FILE> [<WARC_FILE> ...]")
+        exit(1)
+
+    exit(0 if compareExtractors(sys.argv[1:]) == 0 else 1)
@@ -1,9 +1,24 @@
 from timeit import default_timer as timer
+from AsyncCrawler import AsyncCrawler
+from ProcessCrawler import ProcessCrawler
+from DistributedCrawler import CrawlCoordinator, NodeCrawler
 from Crawler import Crawler
 import logging
 import utils
 import sys
+import os
 import DebugPrinter
+from Checkpoint import CrawlCheckpointer, CheckpointError
+from RobotsCache import RobotsCache
+from ParsePool import ParsePool
+from WarcFileSave import WarcSaver, BackgroundWarcSaver
+from PolitenessGroups import PolitenessGroups
+from DnsCache import DnsCache
+from WebAccesser import WebAccesser
+from RecrawlIndex import RecrawlIndex
+from Metrics import CrawlMetrics, MetricsReporter
+import SeenStore
+import Frontier
 
 class UndefinedCommandError(Exception):
     pass
@@ -11,8 +26,30 @@ class UndefinedCommandError(Exception):
 class ArgsWrongTypeError(Exception):
     pass
 
+VALIDENGINES = ["threads", "async", "processes", "coordinator", "node"]
+VALIDSEENSTORES = ["exact", "bloom", "mmap"]
+VALIDFETCHMODES = ["get", "head"]
+VALIDWARCSHARDINGS = [BackgroundWarcSaver.SHARD_BY_WRITER, BackgroundWarcSaver.SHARD_BY_WORKER]
+VALIDPOLITENESSGROUPINGS = [PolitenessGroups.BY_HOST, PolitenessGroups.BY_IP, PolitenessGroups.BY_DOMAIN]
+
+SEENSTORE_EXPECTED_NUM_URLS = 10000000
+SEENSTORE_FALSE_POSITIVE_RATE = 0.001
+SEENSTORE_FILE_PATH = "seen.bloom"
+
+FRONTIER_SPILL_DIR = "frontier_spill"
+
+CHECKPOINT_INTERVAL_SECONDS = 300
+
+ROBOTS_CACHE_FILE_PATH = "robots.cache"
+
+WARC_PRE_NAME = "results"
+
+METRICS_INTERVAL_SECONDS = 10
+
 def printUsage():
-    print("Usage: python main.py -s <SEEDS> -n <LIMIT> [-d]")
+    print("Usage: python main.py -s <SEEDS> -n <LIMIT> [-d] [-e <threads|async|processes|coordinator|node>] [-c <MAX_IN_FLIGHT>] [-p <NUM_PROCESSES>] [-u <exact|bloom|mmap>] [-m <MAX_RESOURCES_IN_MEMORY>] [-k <CHECKPOINT_DIR>] [-r <CHECKPOINT_DIR>] [-f <get|head>] [-w <NUM_PARSE_PROCESSES>] [-q <MAX_PENDING_PARSES>] [-b <NUM_WARC_WRITERS>] [-o <writer|worker>] [-t <WARC_FLUSH_SECONDS>] [-z <WARC_FILE_MB>] [-g <host|ip|domain>] [-i <NUM_POOLS>] [-x <MAX_CONNECTIONS_PER_HOST>] [-y] [-l <MAX_BODY_KB>] [-v <MAX_DOWNLOAD_SECONDS>] [-P <PREVIOUS_WARCS_DIR|RECRAWL_INDEX>] [-M <METRICS_FILE>] [-H <METRICS_PORT>] [-a <HOST:PORT>] [-j <NUM_NODES>]")
+    print("       python main.py -e coordinator -s <SEEDS> -n <LIMIT> -a <HOST:PORT> [-j <NUM_NODES>]")
+    print("       python main.py -e node -a <COORDINATOR_HOST:PORT> [-u <exact|bloom|mmap>] [-m <MAX_RESOURCES_IN_MEMORY>] [-f <get|head>]")
     exit(1)
 
 def getConfigFromArgs(validCommands):
@@ -48,21 +85,289 @@ def getConfigFromArgs(validCommands):
                 elif sys.argv[posCommandExpected] == "-d":
                     argsConfig['debugMode'] = True
                     posCommandExpected += 1
+                
+                elif sys.argv[posCommandExpected] == "-e":
+                    
+                    engine = sys.argv[posCommandExpected+1]
+                    if engine not in VALIDENGINES:
+                        raise UndefinedCommandError("Unsupported engine: ", engine)
+                    
+                    argsConfig['engine'] = engine
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-c":
+                    argsConfig['maxInFlightRequests'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-p":
+                    argsConfig['numProcesses'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-u":
+                    
+                    seenStoreKind = sys.argv[posCommandExpected+1]
+                    if seenStoreKind not in VALIDSEENSTORES:
+                        raise UndefinedCommandError("Unsupported seen store: ", seenStoreKind)
+                    
+                    argsConfig['seenStore'] = seenStoreKind
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-m":
+                    argsConfig['maxResidentResources'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-k":
+                    argsConfig['checkpointDir'] = sys.argv[posCommandExpected+1]
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-r":
+                    #Resuming keeps checkpointing on the same directory
+                    argsConfig['checkpointDir'] = sys.argv[posCommandExpected+1]
+                    argsConfig['resume'] = True
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-f":
+                    
+                    fetchMode = sys.argv[posCommandExpected+1]
+                    if fetchMode not in VALIDFETCHMODES:
+                        raise UndefinedCommandError("Unsupported fetch mode: ", fetchMode)
+                    
+                    argsConfig['fetchMode'] = fetchMode
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-w":
+                    argsConfig['numParseProcesses'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-q":
+                    argsConfig['maxPendingParses'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-b":
+                    argsConfig['numWarcWriters'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-o":
+                    
+                    warcSharding = sys.argv[posCommandExpected+1]
+                    if warcSharding not in VALIDWARCSHARDINGS:
+                        raise UndefinedCommandError("Unsupported WARC sharding: ", warcSharding)
+                    
+                    argsConfig['warcSharding'] = warcSharding
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-t":
+                    argsConfig['warcFlushIntervalSeconds'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-z":
+                    argsConfig['warcFileMegabytes'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-g":
+                    
+                    politenessGroupBy = sys.argv[posCommandExpected+1]
+                    if politenessGroupBy not in VALIDPOLITENESSGROUPINGS:
+                        raise UndefinedCommandError("Unsupported politeness grouping: ", politenessGroupBy)
+                    
+                    argsConfig['politenessGroupBy'] = politenessGroupBy
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-i":
+                    argsConfig['numPools'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-x":
+                    argsConfig['maxConnectionsPerHost'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-y":
+                    argsConfig['keepAlive'] = False
+                    posCommandExpected += 1
+                
+                elif sys.argv[posCommandExpected] == "-l":
+                    argsConfig['maxBodyKilobytes'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-v":
+                    argsConfig['maxDownloadSeconds'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-P":
+                    argsConfig['previousCrawl'] = sys.argv[posCommandExpected+1]
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-M":
+                    argsConfig['metricsFile'] = sys.argv[posCommandExpected+1]
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-H":
+                    argsConfig['metricsPort'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-a":
+                    argsConfig['address'] = getAddressArg(posCommandExpected)
+                    posCommandExpected += 2
+                
+                elif sys.argv[posCommandExpected] == "-j":
+                    argsConfig['numNodes'] = getIntArg(posCommandExpected)
+                    posCommandExpected += 2
         else:
             raise UndefinedCommandError("Unsupported command: ",sys.argv[posCommandExpected])
         
         if posCommandExpected >= len(sys.argv):
             readAllCommands = True
+    
+    #Only the threads engine checkpoints, and the engine may come after -k or -r
+    if argsConfig['checkpointDir'] != "" and argsConfig['engine'] != "threads":
+        raise UndefinedCommandError("Checkpoints (-k and -r) are only supported by the threads engine, not by: ",
+                                    argsConfig['engine'])
         
     return argsConfig
 
+def getIntArg(posCommand:int) -> int:
+    try:
+        return int(sys.argv[posCommand+1])
+    except ValueError as e:
+        raise ArgsWrongTypeError("Wrong value type for command '", 
+                                    sys.argv[posCommand],
+                                    "'. type() == int expected but '",
+                                    sys.argv[posCommand+1],
+                                    "' value was given") from e
+
+def getAddressArg(posCommand:int) -> tuple:
+    host, _, port = sys.argv[posCommand+1].rpartition(":")
+    try:
+        return (host, int(port))
+    except ValueError as e:
+        raise ArgsWrongTypeError("Wrong value for command '",
+                                    sys.argv[posCommand],
+                                    "'. <HOST:PORT> expected but '",
+                                    sys.argv[posCommand+1],
+                                    "' value was given") from e
+
 def getConfigDictTemplate():
     templateConfig = dict()
     templateConfig['seedPathFile'] = ""
     templateConfig['LIMIT'] = 0
     templateConfig['debugMode'] = False
+    templateConfig['engine'] = "threads"
+    templateConfig['maxInFlightRequests'] = 1000
+    templateConfig['numProcesses'] = os.cpu_count()
+    templateConfig['seenStore'] = "exact"
+    #0 keeps the whole frontier in memory
+    templateConfig['maxResidentResources'] = 0
+    #Only the threads engine writes checkpoints
+    templateConfig['checkpointDir'] = ""
+    templateConfig['resume'] = False
+    #"get" fetches a page with a single GET, "head" sends a HEAD before it
+    templateConfig['fetchMode'] = "get"
+    #0 parses the pages on the threads that fetched them. Only for the threads engine
+    templateConfig['numParseProcesses'] = 0
+    templateConfig['maxPendingParses'] = 256
+    #0 writes the WARC records on the threads that fetched them
+    templateConfig['numWarcWriters'] = 0
+    templateConfig['warcSharding'] = BackgroundWarcSaver.SHARD_BY_WRITER
+    templateConfig['warcFlushIntervalSeconds'] = 5
+    templateConfig['warcFileMegabytes'] = 1024
+    #Hosts on the same IP or registered domain share their politeness delay. Only for the threads engine
+    templateConfig['politenessGroupBy'] = PolitenessGroups.BY_HOST
+    #Of the connection pool shared by every worker. Only for the threads engine
+    templateConfig['numPools'] = WebAccesser.NUM_POOLS
+    templateConfig['maxConnectionsPerHost'] = WebAccesser.MAX_CONNECTIONS_PER_HOST
+    templateConfig['keepAlive'] = True
+    #Bodies are cut at this size or after this time since their request was sent. Only for the threads engine
+    templateConfig['maxBodyKilobytes'] = WebAccesser.MAX_BODY_BYTES // 1024
+    templateConfig['maxDownloadSeconds'] = WebAccesser.MAX_DOWNLOAD_SECONDS
+    #WARC files of a previous crawl, or an index built from them, whose pages are requested with conditional GETs.
+    #Only for the threads engine
+    templateConfig['previousCrawl'] = ""
+    #Where JSON snapshots of the metrics are appended every METRICS_INTERVAL_SECONDS and the port of localhost
+    #they are served on. Empty and 0 for neither. Only for the threads engine
+    templateConfig['metricsFile'] = ""
+    templateConfig['metricsPort'] = 0
+    #Where the coordinator of a distributed crawl listens and how many nodes it waits for before starting
+    templateConfig['address'] = ("127.0.0.1", 9000)
+    templateConfig['numNodes'] = 1
     return templateConfig
 
+def getSeenStoreConfig(configs:dict) -> dict:
+    return {'kind': configs['seenStore'],
+            'expectedNumUrls': SEENSTORE_EXPECTED_NUM_URLS,
+            'falsePositiveRate': SEENSTORE_FALSE_POSITIVE_RATE,
+            'filePath': SEENSTORE_FILE_PATH,
+            #The urls seen by an mmap store are kept from its file only when resuming
+            'reuseFile': configs['resume']}
+
+def createSeenStore(configs:dict) -> SeenStore.SeenStore:
+    seenStoreConfig = getSeenStoreConfig(configs)
+    return SeenStore.createSeenStore(seenStoreConfig['kind'], seenStoreConfig['expectedNumUrls'],
+                                        seenStoreConfig['falsePositiveRate'], seenStoreConfig['filePath'],
+                                        seenStoreConfig['reuseFile'])
+
+def createFrontierFactory(configs:dict) -> Frontier.FrontierFactory:
+    if configs['maxResidentResources'] > 0:
+        return Frontier.SpillingFrontierFactory(FRONTIER_SPILL_DIR, configs['maxResidentResources'])
+    return Frontier.FrontierFactory()
+
+def createWarcSaver(configs:dict):
+    maxFileBytes = configs['warcFileMegabytes'] * 1024 * 1024
+    if configs['numWarcWriters'] > 0:
+        return BackgroundWarcSaver(WARC_PRE_NAME, configs['numWarcWriters'], configs['warcSharding'],
+                                    configs['warcFlushIntervalSeconds'], maxFileBytes=maxFileBytes)
+    return WarcSaver(WARC_PRE_NAME, maxFileBytes)
+
+def createMetricsReporter(configs:dict) -> MetricsReporter:
+    if configs['metricsFile'] == "" and configs['metricsPort'] == 0:
+        return None
+    return MetricsReporter(CrawlMetrics(), configs['metricsFile'] if configs['metricsFile'] != "" else None,
+                            configs['metricsPort'] if configs['metricsPort'] != 0 else None, METRICS_INTERVAL_SECONDS)
+
+def createCrawler(configs:dict):
+    NUMWORKERS = 80
+    singleGET = configs['fetchMode'] == "get"
+    if configs['engine'] == "async":
+        return AsyncCrawler(configs['LIMIT'], NUMWORKERS, configs['debugMode'], configs['maxInFlightRequests'],
+                            seenStore=createSeenStore(configs), frontierFactory=createFrontierFactory(configs),
+                            robotsCache=RobotsCache(ROBOTS_CACHE_FILE_PATH), singleGET=singleGET,
+                            warcSaver=createWarcSaver(configs), maxBodyBytes=configs['maxBodyKilobytes'] * 1024,
+                            maxDownloadSeconds=configs['maxDownloadSeconds'])
+    elif configs['engine'] == "processes":
+        numWorkersPerProcess = max(1, NUMWORKERS // configs['numProcesses'])
+        maxResidentResourcesPerProcess = configs['maxResidentResources'] // configs['numProcesses']
+        return ProcessCrawler(configs['LIMIT'], configs['numProcesses'], numWorkersPerProcess, configs['debugMode'],
+                                getSeenStoreConfig(configs), maxResidentResourcesPerProcess, ROBOTS_CACHE_FILE_PATH,
+                                singleGET)
+    elif configs['engine'] == "coordinator":
+        return CrawlCoordinator(configs['LIMIT'], configs['address'], configs['numNodes'])
+    elif configs['engine'] == "node":
+        return NodeCrawler(configs['address'], NUMWORKERS, configs['debugMode'], getSeenStoreConfig(configs),
+                            configs['maxResidentResources'], ROBOTS_CACHE_FILE_PATH, singleGET)
+    else:
+        checkpointer = None
+        if configs['checkpointDir'] != "":
+            checkpointer = CrawlCheckpointer(configs['checkpointDir'], NUMWORKERS, CHECKPOINT_INTERVAL_SECONDS)
+
+        parsePool = None
+        if configs['numParseProcesses'] > 0:
+            parsePool = ParsePool(configs['numParseProcesses'], configs['maxPendingParses'])
+
+        recrawlIndex = None
+        if configs['previousCrawl'] != "":
+            recrawlIndex = RecrawlIndex(configs['previousCrawl'])
+
+        dnsCache = DnsCache()
+        return Crawler(configs['LIMIT'], NUMWORKERS, configs['debugMode'], seenStore=createSeenStore(configs),
+                        frontierFactory=createFrontierFactory(configs), checkpointer=checkpointer,
+                        robotsCache=RobotsCache(ROBOTS_CACHE_FILE_PATH), singleGET=singleGET, parsePool=parsePool,
+                        warcSaver=createWarcSaver(configs), dnsCache=dnsCache,
+                        politenessGroups=PolitenessGroups(configs['politenessGroupBy'], dnsCache),
+                        poolManager=WebAccesser.newPoolManager(dnsCache, configs['numPools'],
+                                                                configs['maxConnectionsPerHost'], configs['keepAlive']),
+                        maxBodyBytes=configs['maxBodyKilobytes'] * 1024,
+                        maxDownloadSeconds=configs['maxDownloadSeconds'], recrawlIndex=recrawlIndex,
+                        metricsReporter=createMetricsReporter(configs))
+
 if __name__ == "__main__":
     
     logging.basicConfig(level=logging.INFO, format='%(thread)d-%(threadName)s-%(levelname)s-%(message)s',
@@ -73,7 +378,7 @@ if __name__ == "__main__":
     if len(sys.argv) < MINNUMARGS:
         printUsage()
     else:
-        VALIDCOMMANDS = ["-s", "-n", "-d"]
+        VALIDCOMMANDS = ["-s", "-n", "-d", "-e", "-c", "-p", "-u", "-m", "-k", "-r", "-f", "-w", "-q", "-b", "-o", "-t", "-z", "-g", "-i", "-x", "-y", "-l", "-v", "-P", "-M", "-H", "-a", "-j"]
         configs = dict()
         try:
             configs = getConfigFromArgs(VALIDCOMMANDS)
@@ -82,13 +387,19 @@ if __name__ == "__main__":
         else:
             logging.info(f"Todos o comandos foram aceitos {configs}")
 
-            NUMWORKERS = 80
-            myCrawler = Crawler(configs['LIMIT'], NUMWORKERS, configs['debugMode'])
+            myCrawler = createCrawler(configs)
             try:
                 start = timer()
-                myCrawler.startCrawlingFromSeedsFile(configs['seedPathFile'])
+                if configs['resume']:
+                    myCrawler.resumeFromCheckpoint(configs['checkpointDir'])
+                elif configs['engine'] == "node":
+                    myCrawler.startCrawlingFromCoordinator()
+                else:
+                    myCrawler.startCrawlingFromSeedsFile(configs['seedPathFile'])
                 end = timer()
                 totalTime = end - start
+                logging.info(f"Engine {configs['engine']}: {myCrawler.pagesCrawled} pages in {totalTime}s "
+                                f"({myCrawler.pagesCrawled/totalTime} pages/sec)")
                 logging.info(f"{DebugPrinter.JsonPrinter().getJsonOfDict(myCrawler.getResourcesNumPerHost())}")
-            except FileNotFoundError as e:
+            except (FileNotFoundError, CheckpointError, ConnectionError) as e:
                 utils.printErrorMessageAndExitWithErrorCode(e, 1)
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""
+Runs a distributed crawl on this machine: a coordinator and some nodes, each one on its own
+directory under the working directory. One more node joins the crawl after it starts and
+one node leaves it, so their hosts are reassigned.
+
+Usage: python runLocalDistributedCrawl.py <SEEDS> <LIMIT> [<NUM_NODES>] [<PORT>]
+"""
+
+import subprocess
+import signal
+import time
+import sys
+import os
+
+SECONDS_BETWEEN_STEPS = 2
+
+def startMainOnDir(dirName:str, args:list) -> subprocess.Popen:
+    os.makedirs(dirName, exist_ok=True)
+    mainPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    return subprocess.Popen([sys.executable, mainPath] + args, cwd=dirName)
+
+def runLocalDistributedCrawl(seedsFilePath:str, limit:int, numNodes:int, port:int) -> int:
+    address = f"127.0.0.1:{port}"
+    coordinator = startMainOnDir("coordinator", ["-e", "coordinator", "-s", os.path.abspath(seedsFilePath),
+                                                    "-n", str(limit), "-a", address, "-j", str(numNodes)])
+    time.sleep(SECONDS_BETWEEN_STEPS / 4)
+
+    nodes = [startMainOnDir(f"node{nodeNum}", ["-e", "node", "-a", address]) for nodeNum in range(numNodes)]
+
+    time.sleep(SECONDS_BETWEEN_STEPS)
+    nodes.append(startMainOnDir(f"node{numNodes}", ["-e", "node", "-a", address]))
+
+    time.sleep(SECONDS_BETWEEN_STEPS)
+    if nodes[0].poll() == None:
+        nodes[0].send_signal(signal.SIGTERM)
+
+    coordinatorReturnCode = coordinator.wait()
+    nodesReturnCodes = [node.wait() for node in nodes]
+    print(f"Coordinator exited with {coordinatorReturnCode}, nodes with {nodesReturnCodes}. "
+            f"Logs and WARC files are on the coordinator and node directories")
+
+    return max([coordinatorReturnCode] + nodesReturnCodes)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python runLocalDistributedCrawl.py <SEEDS> <LIMIT> [<NUM_NODES>] [<PORT>]")
+        exit(1)
+
+    numNodes = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    port = int(sys.argv[4]) if len(sys.argv) > 4 else 9000
+    exit(runLocalDistributedCrawl(sys.argv[1], int(sys.argv[2]), numNodes, port))
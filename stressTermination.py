@@ -0,0 +1,165 @@
+"""
+Stresses the termination detection of WorkersPipeline with many worker threads that only
+exchange links, so workers go idle and are woken up again all the time.
+Checks that the crawl stops once no link is left, without losing any, and once the
+page limit is reached.
+
+Usage: python stressTermination.py [<NUM_WORKERS>] [<NUM_ROUNDS>]
+"""
+
+from WorkersPipeline import WorkersPipeline
+from timeit import default_timer as timer
+from collections import deque
+from threading import Lock, Thread
+import random
+import sys
+
+JOIN_TIMEOUT_SECONDS = 60
+
+class CountingWarcSaver():
+    """Saves nothing, so only the pipeline is measured"""
+
+    def saveAndReturnIfSuccess(self, response, link:str, shardKey:int = None, body:bytes = None, truncated:str = None,
+                                revisitOf:tuple = None):
+        return True
+
+    def close(self):
+        pass
+
+    def getStatsString(self) -> str:
+        return ""
+
+class LinkExchangingWorker():
+    """
+    Crawls a link by sending some new links to random workers, while there are links to create
+    """
+
+    CHECK_FOR_OTHER_LINKS_EVERY_NUM_REQUESTS = 15
+
+    def __init__(self, id:int, numWorkers:int, linksBudget:dict, linksBudgetLock:Lock, savePages:bool):
+        self._id = id
+        self._numWorkers = numWorkers
+        self._linksBudget = linksBudget
+        self._linksBudgetLock = linksBudgetLock
+        self._savePages = savePages
+
+        self._links = deque()
+        self._numCrawled = 0
+        self.workersPipeline = None
+
+    @property
+    def numCrawled(self) -> int:
+        return self._numCrawled
+
+    @numCrawled.setter
+    def numCrawled(self, newNumCrawled):
+        raise AttributeError("numCrawled is not writable")
+
+    def addLinkToRequest(self, link:str):
+        self._links.append(link)
+
+    def crawl(self):
+        while True:
+            self._crawlUntilItCan()
+            self.workersPipeline.waitForLinkOrAllDoneEvent(self._id)
+
+            if self.workersPipeline.allDone:
+                return
+            self._links.extend(self.workersPipeline.getLinksSentToWorker(self._id))
+
+    def _crawlUntilItCan(self):
+        numCrawledSinceCheck = 0
+        while len(self._links) > 0 and not self.workersPipeline.allDone:
+            link = self._links.popleft()
+            self._numCrawled += 1
+            if self._savePages:
+                self.workersPipeline.saveResponse(None, link, self._id)
+
+            linksByWorker = dict()
+            for childLink in self._takeNewLinks(link, random.randint(0, 3)):
+                linksByWorker.setdefault(random.randrange(self._numWorkers), list()).append(childLink)
+
+            self._links.extend(linksByWorker.pop(self._id, list()))
+            self.workersPipeline.sendLinksToProperWorkers(linksByWorker, self._id)
+
+            numCrawledSinceCheck += 1
+            if numCrawledSinceCheck == LinkExchangingWorker.CHECK_FOR_OTHER_LINKS_EVERY_NUM_REQUESTS:
+                self._links.extend(self.workersPipeline.getLinksSentToWorker(self._id))
+                numCrawledSinceCheck = 0
+
+    def _takeNewLinks(self, parentLink:str, numLinks:int) -> list:
+        self._linksBudgetLock.acquire()
+        numLinks = min(numLinks, self._linksBudget['left'])
+        self._linksBudget['left'] -= numLinks
+        firstLinkId = self._linksBudget['nextId']
+        self._linksBudget['nextId'] += numLinks
+        self._linksBudgetLock.release()
+
+        return [f"http://w{self._id}.test/{linkId}" for linkId in range(firstLinkId, firstLinkId + numLinks)]
+
+def runRound(numWorkers:int, numLinks:int, maxNumPagesToCrawl:int) -> tuple:
+    """
+    Returns the number of links created, the number crawled, the pages counted by the pipeline
+    and whether every worker finished
+    """
+    linksBudget = {'left': numLinks, 'nextId': numWorkers}
+    linksBudgetLock = Lock()
+    savePages = maxNumPagesToCrawl != None
+
+    workers = {workerId: LinkExchangingWorker(workerId, numWorkers, linksBudget, linksBudgetLock, savePages)
+                for workerId in range(numWorkers)}
+    workersPipeline = WorkersPipeline(workers, maxNumPagesToCrawl if savePages else numLinks + numWorkers,
+                                        warcSaver=CountingWarcSaver())
+
+    for workerId, worker in workers.items():
+        worker.workersPipeline = workersPipeline
+        worker.addLinkToRequest(f"http://w{workerId}.test/{workerId}")
+
+    workersThreads = [Thread(target=worker.crawl) for _, worker in workers.items()]
+    [thread.start() for thread in workersThreads]
+    deadline = timer() + JOIN_TIMEOUT_SECONDS
+    [thread.join(max(0.0, deadline - timer())) for thread in workersThreads]
+
+    everyWorkerFinished = not any([thread.is_alive() for thread in workersThreads])
+    if not everyWorkerFinished:
+        #Let the stuck workers go so the process can exit
+        workersPipeline.finishAllWorkers()
+
+    numCreated = numWorkers + (numLinks - linksBudget['left'])
+    numCrawled = sum([worker.numCrawled for _, worker in workers.items()])
+    return numCreated, numCrawled, workersPipeline.pagesCrawled, everyWorkerFinished
+
+def stressTermination(numWorkers:int, numRounds:int) -> int:
+    numFailures = 0
+
+    for roundId in range(numRounds):
+        numLinks = random.randint(0, 20 * numWorkers)
+
+        start = timer()
+        numCreated, numCrawled, _, everyWorkerFinished = runRound(numWorkers, numLinks, None)
+        seconds = timer() - start
+
+        #Every link is created before its sender can go idle, so every one of them must be crawled
+        failed = not everyWorkerFinished or numCrawled != numCreated
+        numFailures += int(failed)
+        print(f"{'FAILED' if failed else 'OK'} round {roundId} until idle: {numWorkers} workers, "
+                f"{numCrawled} of {numCreated} links crawled in {seconds:.2f}s")
+
+        maxNumPagesToCrawl = random.randint(1, 5 * numWorkers)
+
+        start = timer()
+        _, _, pagesCrawled, everyWorkerFinished = runRound(numWorkers, 1000 * numWorkers, maxNumPagesToCrawl)
+        seconds = timer() - start
+
+        failed = not everyWorkerFinished or pagesCrawled <= maxNumPagesToCrawl
+        numFailures += int(failed)
+        print(f"{'FAILED' if failed else 'OK'} round {roundId} until the limit of {maxNumPagesToCrawl} pages: "
+                f"{numWorkers} workers, {pagesCrawled} pages in {seconds:.2f}s")
+
+    return numFailures
+
+if __name__ == "__main__":
+    numWorkers = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    numRounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    exit(0 if stressTermination(numWorkers, numRounds) == 0 else 1)
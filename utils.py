@@ -1,4 +1,6 @@
+from functools import lru_cache
 import logging
+import hashlib
 from url_normalize import url_normalize
 
 def printErrorMessageAndExitWithErrorCode(exceptionRaised: Exception, errorCode: int):
@@ -45,11 +47,71 @@ def getHostWithSchemaOfLink(link:str) -> str:
 
     return schemaAndHost
 
+def getHostNameOfHostWithSchema(hostWithSchema:str) -> str:
+    """
+    The host without schema, port or user info, as it is resolved
+    """
+    hostName = hostWithSchema.split("//")[-1].split("@")[-1]
+    if hostName.startswith("["):
+        return hostName[1:].split("]")[0]
+    return hostName.split(":")[0].lower()
+
+#Second level labels under which names are registered on country code top level domains, like com.br
+SECOND_LEVEL_DOMAINS = set(["com", "net", "org", "gov", "edu", "mil", "co", "ac", "or", "ne", "go", "blog", "art", "jus", "leg"])
+
+def registeredDomainOf(hostName:str) -> str:
+    """
+    The domain the host was registered under, like globo.com for g1.globo.com or uol.com.br for noticias.uol.com.br.
+    Without a public suffix list, a two letter top level domain is taken as having second level ones
+    """
+    labels = hostName.rstrip(".").split(".")
+    if len(labels) <= 2 or labels[-1].isdigit():
+        return hostName
+
+    if len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_DOMAINS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
 def getResourcesFromLink(link: str) -> str:
     return f"/{'/'.join(link.split('/')[3:])}"
 
-def threadOfHost(numThreads:int, host:str) -> int:
-    return abs(hash(host)%numThreads)
+#Hosts are hashed for every link of theirs, so the hashes of the most recent ones are kept
+HOST_HASH_CACHE_SIZE = 64 * 1024
+
+def stableHash(text:str) -> int:
+    """
+    A hash that is the same in every process and every run, unlike the salted built-in hash()
+    """
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+@lru_cache(maxsize=HOST_HASH_CACHE_SIZE)
+def stableHostHash(host:str) -> int:
+    """stableHash of a host, cached since the same hosts are hashed over and over"""
+    return stableHash(host)
+
+def processOfHost(numProcesses:int, host:str) -> int:
+    return stableHostHash(host) % numProcesses
+
+def threadOfHost(numThreads:int, host:str, numProcesses:int = 1) -> int:
+    """
+    The worker of the host inside its process. The hash is divided by numProcesses
+    so that the choice of worker is not correlated with the choice of process
+    """
+    return threadOfHostHash(numThreads, stableHostHash(host), numProcesses)
+
+def threadOfHostHash(numThreads:int, hostHash:int, numProcesses:int = 1) -> int:
+    """threadOfHost of a host whose stableHostHash is already known, like the one of a Url"""
+    return (hostHash // numProcesses) % numThreads
+
+def nodeOfHost(nodeIds:list, host:str) -> int:
+    """
+    The node of the host by rendezvous hashing: when a node joins or leaves,
+    only the hosts it gets or had change node. None if there is no node
+    """
+    if len(nodeIds) == 0:
+        return None
+    #Not cached, or the scores of every node would push the hashes of the hosts out of the cache
+    return max(nodeIds, key=lambda nodeId: stableHash(f"{nodeId}/{host}"))
 
 def getCompleteLinkFromHostAndResource(host:str, resource:str) -> str:
         completeLink = f"{host}{resource}"